@@ -6,12 +6,17 @@ multiprocessing.set_start_method('spawn', force=True)
 import os
 from celery import Celery
 
+from shared_utils.cache.EntityCodec import register_kombu_serializer
+
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
 
 # Create the Celery app instance.
 app = Celery('TradeLens')
 
+# Entity codec serializer: sends numpy arrays on entities as raw out-of-band buffers instead of pickling them in-band.
+register_kombu_serializer('entity_codec')
+
 # Load any custom configuration from your Django settings, using a CELERY namespace.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 import sys
+import tempfile
 from pathlib import Path
 import os
 
@@ -128,20 +129,113 @@ CACHES = {
     }
 }
 
+# Entity cache storage. When split storage is enabled, entity metadata is stored under the entity id and
+# large attributes (numpy arrays over the threshold, or names listed in Entity.split_attributes) are stored
+# under their own content-addressed keys so unchanged arrays are not re-uploaded on every save.
+ENTITY_CACHE_SPLIT_ATTRIBUTES = True
+ENTITY_CACHE_SPLIT_THRESHOLD_BYTES = 1024 * 1024
+
+# Large numpy attributes are written once to a content-addressed .npy store on local disk and memory-mapped
+# read-only by workers, so Redis only holds a handle to them.
+ENTITY_ARRAY_STORE_ENABLED = True
+ENTITY_ARRAY_STORE_DIR = BASE_DIR / 'array_store'
+
+# DataSet rows are stored as one float64 column per feature in .npy files, see dataset_manager.storage
+DATASET_STORE_DIR = BASE_DIR / 'dataset_store'
+# Superseded dataset versions are kept this long for readers still holding the previous manifest
+DATASET_STORE_GRACE_SECONDS = 600
+
+# External source of dataset bars, see dataset_manager.sources. A FileDataSource with a 'directory' parameter
+# reads local CSV/Parquet files instead of yfinance.
+DATASET_DATA_SOURCE = {'class_path': 'dataset_manager.sources.YFinanceDataSource', 'parameters': {}}
+
+# Batch ingestion (dataset_manager.ingestion): feature processes (None for one per CPU) and database writer threads
+DATASET_INGEST_PROCESSES = None
+DATASET_INGEST_WRITERS = 2
+
+# In-process (L1) entity cache kept by each worker process in front of Redis. Entries are checked against a
+# version stamp in Redis on every read and evicted early through redis pub/sub when another process saves.
+ENTITY_L1_CACHE_ENABLED = True
+ENTITY_L1_CACHE_MAX_ENTRIES = 1024
+ENTITY_L1_CACHE_MAX_BYTES = 256 * 1024 * 1024
+ENTITY_L1_CACHE_INVALIDATION = True
+
+# Entity writes are compare-and-set on the version stamp; conflicting concurrent saves are merged and retried
+# up to ENTITY_CAS_MAX_RETRIES times. Exclusive strategies hold an entity lock for up to ENTITY_LOCK_TIMEOUT
+# seconds and wait at most ENTITY_LOCK_BLOCKING_TIMEOUT seconds to get it.
+ENTITY_CAS_MAX_RETRIES = 5
+ENTITY_LOCK_TIMEOUT = 60
+ENTITY_LOCK_BLOCKING_TIMEOUT = 30
+
+# Entity updates broadcast to the frontend are coalesced per entity within this window and each entity is sent
+# at most ENTITY_BROADCAST_MAX_PER_SECOND times per second. A window of 0 sends updates immediately.
+ENTITY_BROADCAST_WINDOW_SECONDS = 0.05
+ENTITY_BROADCAST_MAX_PER_SECOND = 10
+
+# Entities already sent to clients are broadcast as versioned JSON-patch deltas against the last snapshot.
+# Snapshots live in the cache for ENTITY_SNAPSHOT_TIMEOUT seconds (None keeps them until the cache is cleared).
+ENTITY_BROADCAST_DELTAS = True
+ENTITY_SNAPSHOT_TIMEOUT = None
+
+# Maximum number of independent nested strategy requests executed concurrently by StrategyExecutorService.execute_requests
+STRATEGY_EXECUTOR_MAX_WORKERS = 4
+
+# Threads running ExecutionClass.THREAD strategies in each web/ASGI process
+STRATEGY_THREAD_POOL_WORKERS = 4
+
+# Results of cacheable strategies are memoized by strategy, param_config and input attribute fingerprints.
+# Entries live for STRATEGY_RESULT_CACHE_TIMEOUT seconds (None keeps them until the cache is cleared).
+STRATEGY_RESULT_CACHE_ENABLED = True
+STRATEGY_RESULT_CACHE_TIMEOUT = None
+
+# Executed requests of Celery tasks are kept in the entity cache this long for the callers waiting on them
+STRATEGY_RESULT_HANDLE_TIMEOUT = 3600
+
+# Top-level strategy executions record a span tree (timings, cache bytes, db queries, broadcasts) in the
+# trace of their request, served by training_session api/get_strategy_trace/
+STRATEGY_TRACING_ENABLED = True
+
 if 'test' in sys.argv:
     CACHES['default'] = {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
         'LOCATION': 'unique-test-cache',  # Unique identifier for the in-memory cache
     }
+    # The test database numbers datasets from 1 again, their files must not land next to the real ones
+    DATASET_STORE_DIR = Path(tempfile.mkdtemp(prefix='test_dataset_store_'))
+    # CacheService.clear_all empties the array store, which entities in the dev cache still point to
+    ENTITY_ARRAY_STORE_DIR = Path(tempfile.mkdtemp(prefix='test_array_store_'))
 
 # Celery settings
 CELERY_BROKER_URL = 'redis://localhost:6379/3'
 CELERY_RESULT_BACKEND = 'redis://localhost:6379/2'
-CELERY_ACCEPT_CONTENT = ['pickle']
+CELERY_ACCEPT_CONTENT = ['pickle', 'entity_codec']
 CELERY_TASK_SERIALIZER = 'pickle'
-CELERY_RESULT_SERIALIZER = 'pickle'
+CELERY_RESULT_SERIALIZER = 'entity_codec'
 CELERY_TIMEZONE = 'UTC'
 
+# Strategies are routed to a queue per workload (see StrategyQueue) so long training and fetch jobs don't
+# hold up requests from the UI. run/run.py starts a worker per queue with its concurrency and pool, and
+# tasks without their own priority use the queue's (0 is highest).
+STRATEGY_QUEUES = {
+    'interactive': {'concurrency': 4, 'pool': 'threads', 'priority': 0},
+    'io': {'concurrency': 8, 'pool': 'threads', 'priority': 3},
+    'cpu': {'concurrency': 2, 'pool': 'threads', 'priority': 5},
+    'training': {'concurrency': 1, 'pool': 'threads', 'priority': 9},
+}
+CELERY_TASK_DEFAULT_QUEUE = 'cpu'
+CELERY_TASK_ROUTES = {
+    'shared_utils.tasks.execute_interactive_strategy_request': {'queue': 'interactive'},
+    'shared_utils.tasks.execute_io_strategy_request': {'queue': 'io'},
+    'shared_utils.tasks.execute_strategy_request': {'queue': 'cpu'},
+    'shared_utils.tasks.execute_training_strategy_request': {'queue': 'training'},
+    # Batches are sent to the queue of their heaviest request, this is only the fallback
+    'shared_utils.tasks.execute_strategy_batch': {'queue': 'cpu'},
+}
+# Priorities on the redis broker: one list per priority step, consumed highest priority first
+CELERY_BROKER_TRANSPORT_OPTIONS = {'priority_steps': list(range(10)), 'sep': ':', 'queue_order_strategy': 'priority'}
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -7,7 +7,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
 # Initialize Django
 django.setup()
 
-from dataset_manager.services import StockDataSetService
+from dataset_manager.ingestion import BatchIngestionService
 from sequenceset_manager.services import StockSequenceSetService
 
 # tickers = ["AAPL", "SPY", "QQQ", "XOM", "MSFT", "AMZN", "BB", 'F', 'TSLA', 'GE',
@@ -17,7 +17,13 @@ from sequenceset_manager.services import StockSequenceSetService
 tickers = ["VST", "DAVE"]
 sequences_lengths = [50]
 
-for ticker in tickers:
+
+def create_sequence_sets(ticker, dataset):
     for sequence_length in sequences_lengths:
-        StockDataSetService.create_new_dataset(dataset_type="stock", start_date='1990-01-01', end_date=None, ticker=ticker, interval="1d")
-        StockSequenceSetService.create_sequence_set(sequence_length, dataset_type='stock', ticker=ticker, interval='1d')
\ No newline at end of file
+        StockSequenceSetService.create_sequence_set(sequence_length, dataset_type='stock', ticker=ticker, interval='1d')
+
+
+if __name__ == "__main__":
+    service = BatchIngestionService(on_written=create_sequence_sets)
+    report = service.add_tickers(tickers, start_date='1990-01-01', end_date=None, interval="1d")
+    print(report.summary())
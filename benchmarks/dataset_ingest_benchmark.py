@@ -0,0 +1,85 @@
+"""
+Benchmark writing and reading a feature DataFrame, comparing DataRow objects created one per row (the previous
+behaviour) against ColumnarDataStore, the path datasets are ingested through. Needs the configured database.
+Run from the repository root:
+
+    python benchmarks/dataset_ingest_benchmark.py --rows 5000 --features 250
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import django
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
+django.setup()
+
+from django.db import connection, transaction
+
+from dataset_manager.models import DataRow, DataSet
+from dataset_manager.services import DataSetService
+from dataset_manager.storage import ColumnarDataStore
+
+
+def build_frame(rows, features):
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(rows, features))
+    # Feature factories leave NaNs at the start of every rolling window
+    values[rng.random(size=values.shape) < 0.05] = np.nan
+    index = pd.date_range('2000-01-01', periods=rows, freq='D', tz='UTC', name='Date')
+    return pd.DataFrame(values, index=index, columns=[f'feature_{i}' for i in range(features)])
+
+
+def write_per_row(df, dataset):
+    df = df.fillna(-999)
+    with transaction.atomic():
+        for _, row in df.iterrows():
+            DataRow.objects.create(dataset=dataset, timestamp=row.name, features=row.to_dict())
+
+
+def measure(name, func, rows):
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed:8.2f} s  {rows / elapsed:10.0f} rows/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--features', type=int, default=250)
+    parser.add_argument('--skip-per-row', action='store_true', help='skip the slow per-row baseline')
+    args = parser.parse_args()
+
+    df = build_frame(args.rows, args.features)
+    dataset = DataSet.objects.create(dataset_type='benchmark', start_timestamp=df.index[0],
+                                     end_timestamp=df.index[-1], features=df.columns.tolist(), metadata={})
+    store = ColumnarDataStore(tempfile.mkdtemp())
+    print(f"{args.rows} rows x {args.features} features on {connection.vendor}\n")
+    try:
+        write_before = read_before = None
+        if not args.skip_per_row:
+            write_before = measure('per-row write', lambda: write_per_row(df, dataset), len(df))
+            read_before = measure('DataRow read', lambda: DataSetService.datarows_to_dataframe(dataset), len(df))
+            DataRow.objects.filter(dataset=dataset).delete()
+        write = measure('columnar write', lambda: store.write(dataset, df), len(df))
+        read = measure('columnar read', lambda: store.load(dataset), len(df))
+        tail = df.iloc[-10:]
+        measure('columnar append 10', lambda: store.append(dataset, tail), len(tail))
+    finally:
+        dataset.delete()
+        shutil.rmtree(store.root, ignore_errors=True)
+
+    if write_before is not None:
+        print(f"\nwrite speedup {write_before / write:.1f}x, read speedup {read_before / read:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
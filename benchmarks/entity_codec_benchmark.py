@@ -0,0 +1,82 @@
+"""
+Benchmark the entity codec against the pickle path previously used for the entity cache and Celery
+messages. Run from the repository root:
+
+    python benchmarks/entity_codec_benchmark.py --samples 50000 --sequence-length 50 --features 40
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+import tracemalloc
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
+django.setup()
+
+import numpy as np
+
+from data_bundle_manager.entities.DataBundleEntity import DataBundleEntity
+from shared_utils.cache.EntityCodec import EntityCodec
+
+
+def build_data_bundle(samples, sequence_length, features):
+    rng = np.random.default_rng(0)
+    data_bundle = DataBundleEntity()
+    X = rng.standard_normal((samples, sequence_length, features))
+    y = rng.standard_normal((samples, 1, 1))
+    split = int(samples * 0.8)
+    data_bundle.set_attribute('X', X)
+    data_bundle.set_attribute('y', y)
+    data_bundle.set_attribute('X_train', X[:split].copy())
+    data_bundle.set_attribute('X_test', X[split:].copy())
+    data_bundle.set_attribute('y_train', y[:split].copy())
+    data_bundle.set_attribute('y_test', y[split:].copy())
+    data_bundle.set_attribute('X_feature_dict', {f'feature_{i}': i for i in range(features)})
+    return data_bundle
+
+
+def measure(name, func, repeat):
+    timings = []
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    print(f"{name:<28} best {min(timings) * 1000:10.1f} ms   peak alloc {peak / 1024 ** 2:10.1f} MB")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', type=int, default=50000)
+    parser.add_argument('--sequence-length', type=int, default=50)
+    parser.add_argument('--features', type=int, default=40)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data_bundle = build_data_bundle(args.samples, args.sequence_length, args.features)
+    total = sum(value.nbytes for value in data_bundle.get_attributes().values() if isinstance(value, np.ndarray))
+    print(f"DataBundleEntity with {total / 1024 ** 2:.1f} MB of array attributes\n")
+
+    # Celery's pickle serializer uses protocol 4, which writes array data in-band
+    pickled = measure('pickle dumps (protocol 4)', lambda: pickle.dumps(data_bundle, protocol=4), args.repeat)
+    measure('pickle loads (protocol 4)', lambda: pickle.loads(pickled), args.repeat)
+
+    encoded = measure('entity codec encode', lambda: EntityCodec.encode(data_bundle), args.repeat)
+    decoded = measure('entity codec decode', lambda: EntityCodec.decode(encoded), args.repeat)
+
+    print(f"\npayload size: pickle {len(pickled) / 1024 ** 2:.1f} MB, codec {len(encoded) / 1024 ** 2:.1f} MB")
+    assert np.array_equal(decoded.get_attribute('X'), data_bundle.get_attribute('X'))
+    assert not decoded.get_attribute('X').flags.owndata
+
+
+if __name__ == '__main__':
+    main()
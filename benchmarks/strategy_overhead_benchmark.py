@@ -0,0 +1,83 @@
+"""
+Benchmark the per-request overhead of running a trivial GetAttributesStrategy, comparing services that
+import the strategy directory and build their own EntityService for every request (the previous
+behaviour) against the shared strategy registry with injected services. Run from the repository root:
+
+    python benchmarks/strategy_overhead_benchmark.py --requests 2000
+"""
+import argparse
+import os
+import sys
+import time
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
+django.setup()
+
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.BaseStrategy import GetAttributesStrategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.strategy_directory.StrategyDirectory import StrategyDirectory
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry, get_strategy_registry
+
+
+def build_request():
+    strategy_request = StrategyRequestEntity()
+    strategy_request.strategy_name = GetAttributesStrategy.__name__
+    strategy_request.param_config = {'attribute_names': ['value']}
+    return strategy_request
+
+
+def run_rebuilt(entity, requests):
+    """Every request builds its services and imports the strategy directory, as before the shared registry"""
+    for _ in range(requests):
+        executor_service = StrategyExecutorService(entity_service=EntityService(),
+                                                   registry=StrategyRegistry.build(StrategyDirectory()))
+        strategy = executor_service.strategies[GetAttributesStrategy.__name__](executor_service, build_request())
+        # Strategies used to build their own EntityService and StrategyExecutorService as well
+        EntityService()
+        StrategyExecutorService(entity_service=EntityService(), registry=StrategyRegistry.build(StrategyDirectory()))
+        strategy.apply(entity)
+
+
+def run_shared(entity, requests):
+    executor_service = StrategyExecutorService(entity_service=EntityService(), registry=get_strategy_registry())
+    for _ in range(requests):
+        strategy = executor_service.strategies[GetAttributesStrategy.__name__](executor_service, build_request())
+        strategy.apply(entity)
+
+
+def measure(name, func, requests, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    per_request = min(timings) / requests
+    print(f"{name:<32} {per_request * 1e6:10.1f} us per request")
+    return per_request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    entity = Entity()
+    entity.set_attribute('value', 42)
+    get_strategy_registry()
+
+    before = measure('rebuilt services and directory', lambda: run_rebuilt(entity, args.requests),
+                     args.requests, args.repeat)
+    after = measure('shared registry and services', lambda: run_shared(entity, args.requests),
+                    args.requests, args.repeat)
+    print(f"\nspeedup {before / after:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,18 +16,18 @@ class DataBundleEntity(Entity):
     def serialize(self):
         sup_dict = super().serialize()
         sup_dict['meta_data'] =  {
-            'X': self.get_attribute('X').shape if self.has_attribute('X') else None,
-            'y': self.get_attribute('y').shape if self.has_attribute('y') else None,
-            'X_train': self.get_attribute('X_train').shape if self.has_attribute('X_train') else None,
-            'X_test': self.get_attribute('X_test').shape if self.has_attribute('X_test') else None,
-            'y_train': self.get_attribute('y_train').shape if self.has_attribute('y_train') else None,
-            'y_test': self.get_attribute('y_test').shape if self.has_attribute('y_test') else None,
-            'y_train_scaled': self.get_attribute('y_train_scaled').shape if self.has_attribute(
+            'X': self.get_attribute_shape('X') if self.has_attribute('X') else None,
+            'y': self.get_attribute_shape('y') if self.has_attribute('y') else None,
+            'X_train': self.get_attribute_shape('X_train') if self.has_attribute('X_train') else None,
+            'X_test': self.get_attribute_shape('X_test') if self.has_attribute('X_test') else None,
+            'y_train': self.get_attribute_shape('y_train') if self.has_attribute('y_train') else None,
+            'y_test': self.get_attribute_shape('y_test') if self.has_attribute('y_test') else None,
+            'y_train_scaled': self.get_attribute_shape('y_train_scaled') if self.has_attribute(
                 'y_train_scaled') else None,
-            'y_test_scaled': self.get_attribute('y_test_scaled').shape if self.has_attribute('y_test_scaled') else None,
-            'X_train_scaled': self.get_attribute('X_train_scaled').shape if self.has_attribute(
+            'y_test_scaled': self.get_attribute_shape('y_test_scaled') if self.has_attribute('y_test_scaled') else None,
+            'X_train_scaled': self.get_attribute_shape('X_train_scaled') if self.has_attribute(
                 'X_train_scaled') else None,
-            'X_test_scaled': self.get_attribute('X_test_scaled').shape if self.has_attribute('X_test_scaled') else None,
+            'X_test_scaled': self.get_attribute_shape('X_test_scaled') if self.has_attribute('X_test_scaled') else None,
         }
 
         return sup_dict
@@ -86,9 +86,8 @@ class CreateFeatureSetsStrategy(DataBundleStrategy):
                 strat_request.param_config['entity_class'] =  'data_bundle_manager.entities.FeatureSetEntity.FeatureSetEntity'
                 nested_requests.append(strat_request)
 
-        for strat_request in nested_requests:
-            feature_set = self.executor_service.execute(data_bundle, strat_request).ret_val['child_entity']
-            feature_sets.append(feature_set)
+        for strat_request in self.executor_service.execute_requests(nested_requests, entity=data_bundle):
+            feature_sets.append(strat_request.ret_val['child_entity'])
             self.strategy_request.add_nested_request(strat_request)
 
         return feature_sets
@@ -132,6 +131,10 @@ class CreateFeatureSetsStrategy(DataBundleStrategy):
 
 class SplitBundleDateStrategy(DataBundleStrategy):
     name = "SplitBundleDate"
+    cacheable = True
+    input_attributes = ['X', 'y', 'row_ids', 'seq_end_dates']
+    output_attributes = ['X_train', 'X_test', 'y_train', 'y_test', 'train_row_ids', 'test_row_ids']
+
     def __init__(self, strategy_executor, strategy_request):
         super().__init__(strategy_executor, strategy_request)
 
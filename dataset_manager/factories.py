@@ -1,10 +1,15 @@
 from abc import ABC, abstractmethod
+from typing import Dict, List, Mapping
 import pandas as pd 
 import pandas_ta as ta
 from .models import FeatureFactoryConfig
+from .feature_engine import bfill, ema, ewm_mean, fill, pct_change, rolling, rsi, shift, sma
 import numpy as np
 import ta as technical_analysis
 
+# Relative error left in recursive indicators (EMA, RSI) started from a tail of the history instead of all of it
+WARMUP_TOLERANCE = 1e-4
+
 
 class FeatureFactory(ABC):
     def __init__(self, config: FeatureFactoryConfig):
@@ -13,6 +18,51 @@ class FeatureFactory(ABC):
     @abstractmethod
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         pass
+
+    @abstractmethod
+    def get_input_columns(self) -> List[str]:
+        '''
+        Columns read by compute, raw columns or outputs of other factories
+        '''
+        pass
+
+    @abstractmethod
+    def get_output_columns(self) -> List[str]:
+        '''
+        Columns written by compute, the feature names add_features creates
+        '''
+        pass
+
+    @abstractmethod
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        '''
+        Numpy version of add_features used by the FeatureEngine: takes the input columns as float64 arrays and
+        returns every output column. Intermediate outputs are back filled like add_features does before they
+        are used, infinities and the final back fill are left to the engine.
+        '''
+        pass
+
+    def get_lookback(self) -> int:
+        '''
+        Number of earlier rows needed to compute the features of a row as if the whole history was given,
+        counted from the raw OHLCV columns. Used to update a dataset from a tail of its history.
+        '''
+        return 0
+
+    def get_lookahead(self) -> int:
+        '''
+        Number of later rows the features of a row depend on (targets). These rows are recomputed when
+        new rows are added.
+        '''
+        return 0
+
+    @staticmethod
+    def recursive_warmup(alpha) -> int:
+        '''
+        Rows after which an exponentially weighted indicator with smoothing factor alpha has forgotten its
+        starting value up to WARMUP_TOLERANCE
+        '''
+        return int(np.ceil(np.log(WARMUP_TOLERANCE) / np.log(1 - alpha)))
     
     def create_feature_names(self, df: pd.DataFrame) -> pd.DataFrame:
         old_columns = list(df.columns)
@@ -26,6 +76,38 @@ class FeatureFactory(ABC):
 
 class OHLCVFeatureFactory(FeatureFactory):
 
+    def get_lookback(self) -> int:
+        # pct_change and the previous close
+        return 1
+
+    RAW_COLUMNS = ['open', 'high', 'low', 'close', 'volume']
+    INTRADAY_COLUMNS = ['opHi', 'opLo', 'hiCl', 'loCl', 'hiLo', 'opCl', 'pctChgClOp', 'pctChgClLo', 'pctChgClHi']
+
+    def get_input_columns(self) -> List[str]:
+        return list(self.RAW_COLUMNS)
+
+    def get_output_columns(self) -> List[str]:
+        return ['pctChg' + feature for feature in self.RAW_COLUMNS] + list(self.INTRADAY_COLUMNS)
+
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        out = {'pctChg' + feature: bfill(pct_change(columns[feature]) * 100) for feature in self.RAW_COLUMNS}
+
+        open_, high, low, close = columns['open'], columns['high'], columns['low'], columns['close']
+        previous_close = shift(close, 1)
+        intraday = {
+            'opHi': (high - open_) / open_ * 100.0,
+            'opLo': (low - open_) / open_ * 100.0,
+            'hiCl': (close - high) / high * 100.0,
+            'loCl': (close - low) / low * 100.0,
+            'hiLo': (high - low) / low * 100.0,
+            'opCl': (close - open_) / open_ * 100.0,
+            'pctChgClOp': (open_ - previous_close) / previous_close * 100.0,
+            'pctChgClLo': (low - previous_close) / previous_close * 100.0,
+            'pctChgClHi': (high - previous_close) / previous_close * 100.0,
+        }
+        out.update({name: bfill(values) for name, values in intraday.items()})
+        return out
+
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         if not df.index.is_unique:
             print("Warning: Duplicate indices detected before processing.")
@@ -104,6 +186,51 @@ class MovingAverageFeatureFactory(FeatureFactory):
         super().__init__(config)
         self.windows = self.config.parameters.get("windows", [5, 10, 20])
 
+    def get_lookback(self) -> int:
+        # Derivatives look back one window on top of the average itself, the EMA also needs its warmup
+        return max(max(2 * window - 1, self.recursive_warmup(2 / (window + 1)) + window) for window in self.windows)
+
+    def get_input_columns(self) -> List[str]:
+        return ['close', 'volume']
+
+    def get_output_columns(self) -> List[str]:
+        averages = [('sma', 'close'), ('ema', 'close'), ('smaVol', 'volume')]
+        columns = [prefix + str(window) for prefix, _ in averages for window in self.windows]
+        for prefix, base in averages:
+            for window in self.windows:
+                columns.append('pctDiff+' + prefix + str(window) + '_' + base)
+                columns += ['pctDiff+' + prefix + str(window) + '_' + prefix + str(window2)
+                            for window2 in self.windows if window2 != window]
+        columns += ['deriv+' + prefix + str(window) for prefix, _ in averages for window in self.windows]
+        return columns
+
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        close, volume = columns['close'], columns['volume']
+        out = {}
+        for window in self.windows:
+            out['sma' + str(window)] = bfill(sma(close, window))
+        for window in self.windows:
+            out['ema' + str(window)] = bfill(ema(close, window))
+        for window in self.windows:
+            out['smaVol' + str(window)] = bfill(sma(volume, window))
+
+        for prefix, base_name, base in [('sma', 'close', close), ('ema', 'close', close), ('smaVol', 'volume', volume)]:
+            for window in self.windows:
+                average = out[prefix + str(window)]
+                out['pctDiff+' + prefix + str(window) + '_' + base_name] = bfill((base - average) / average * 100)
+                for window2 in self.windows:
+                    if window2 == window:
+                        continue
+                    other = out[prefix + str(window2)]
+                    out['pctDiff+' + prefix + str(window) + '_' + prefix + str(window2)] = \
+                        bfill((average - other) / other * 100)
+
+        for prefix in ['sma', 'ema', 'smaVol']:
+            for window in self.windows:
+                average = out[prefix + str(window)]
+                out['deriv+' + prefix + str(window)] = bfill((average - shift(average, window)) / window)
+        return out
+
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         if not df.index.is_unique:
             print("Warning: Duplicate indices detected before processing.")
@@ -347,6 +474,39 @@ class BandFeatureFactory(FeatureFactory):
     def __init__(self, config: FeatureFactoryConfig):
         super().__init__(config)
         self.windows = self.config.parameters.get("windows", [5, 10, 20])
+
+    def get_lookback(self) -> int:
+        return max(self.windows) - 1
+
+    def get_input_columns(self) -> List[str]:
+        return ['close']
+
+    def get_output_columns(self) -> List[str]:
+        columns = []
+        for window in self.windows:
+            columns += ["bb_high" + str(window), "bb_low" + str(window)]
+        for window in self.windows:
+            columns += ["pctDiff+bb_high_low" + str(window), "pctDiff+bb_high_close" + str(window),
+                        "pctDiff+bb_low_close" + str(window), "bb_indicator" + str(window)]
+        return columns
+
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        close = columns['close']
+        out = {}
+        for window in self.windows:
+            # ta.volatility.BollingerBands: population standard deviation, two deviations wide
+            average = rolling(close, window, 'mean')
+            deviation = rolling(close, window, 'std')
+            out["bb_high" + str(window)] = bfill(average + 2 * deviation)
+            out["bb_low" + str(window)] = bfill(average - 2 * deviation)
+
+        for window in self.windows:
+            high, low = out["bb_high" + str(window)], out["bb_low" + str(window)]
+            out["pctDiff+bb_high_low" + str(window)] = bfill((high - low) / low * 100)
+            out["pctDiff+bb_high_close" + str(window)] = bfill((high - close) / close * 100)
+            out["pctDiff+bb_low_close" + str(window)] = bfill((low - close) / close * 100)
+            out["bb_indicator" + str(window)] = bfill((close - low) / (high - low) * 100)
+        return out
     
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         if not df.index.is_unique:
@@ -429,6 +589,41 @@ class MomentumFeatureFactory(FeatureFactory):
     def __init__(self, config: FeatureFactoryConfig):
         super().__init__(config)
         self.rsi_periods = self.config.parameters.get("rsi_periods", [5, 10, 20, 50, 100])
+
+    def get_lookback(self) -> int:
+        # RSI uses Wilder's smoothing (alpha 1 / period), MACD a 26 period EMA followed by a 9 period signal EMA
+        rsi = max(self.recursive_warmup(1 / period) + period for period in self.rsi_periods)
+        macd = 26 + self.recursive_warmup(2 / 27) + 9 + self.recursive_warmup(2 / 10)
+        stochastic = 14 + 3
+        return max(rsi, macd, stochastic)
+
+    def get_input_columns(self) -> List[str]:
+        return ['high', 'low', 'close']
+
+    def get_output_columns(self) -> List[str]:
+        return ["rsi" + str(period) for period in self.rsi_periods] + \
+            ["macd", "macd_signal", "macd_diff", "stock_k", "stock_d"]
+
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        high, low, close = columns['high'], columns['low'], columns['close']
+        out = {"rsi" + str(period): bfill(rsi(close, period)) for period in self.rsi_periods}
+
+        # ta.trend.MACD without fillna: EMAs start at the first row and are hidden until their window is full
+        fast = ewm_mean(close, span=12, min_periods=12, adjust=False)
+        slow = ewm_mean(close, span=26, min_periods=26, adjust=False)
+        macd = fast - slow
+        signal = ewm_mean(macd, span=9, min_periods=9, adjust=False)
+        out["macd"] = bfill(macd)
+        out["macd_signal"] = bfill(signal)
+        out["macd_diff"] = bfill(macd - signal)
+
+        # ta.momentum.StochasticOscillator with window 14 and smooth_window 3
+        lowest = rolling(low, 14, 'min')
+        highest = rolling(high, 14, 'max')
+        stock_k = 100 * (close - lowest) / (highest - lowest)
+        out["stock_k"] = bfill(stock_k)
+        out["stock_d"] = bfill(rolling(stock_k, 3, 'mean'))
+        return out
     
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         if not df.index.is_unique:
@@ -532,6 +727,32 @@ class TargetFeatureFactory(FeatureFactory):
     def __init__(self, config: FeatureFactoryConfig):
         super().__init__(config)
         self.output_steps = self.config.parameters.get("output_steps", 1)
+
+    def get_lookback(self) -> int:
+        # Rolling sums of up to output_steps rows of pctChgclose, which needs the previous close
+        return self.output_steps + 1
+
+    def get_lookahead(self) -> int:
+        return self.output_steps
+
+    def get_input_columns(self) -> List[str]:
+        return ['pctChgclose', 'close']
+
+    def get_output_columns(self) -> List[str]:
+        steps = range(1, self.output_steps + 1)
+        return ['pctChgclose+' + str(lag) for lag in reversed(steps)] + \
+            ['cumPctChg+' + str(roll) for roll in steps] + \
+            ['close+' + str(lag) for lag in reversed(steps)]
+
+    def compute(self, columns: Mapping[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        pct_chg, close = columns['pctChgclose'], columns['close']
+        out = {}
+        for step in range(1, self.output_steps + 1):
+            out['pctChgclose+' + str(step)] = fill(shift(pct_chg, -step), -999)
+            rolling_sum = fill(rolling(pct_chg, step, 'sum'), -999)
+            out['cumPctChg+' + str(step)] = fill(shift(rolling_sum, -step), -999)
+            out['close+' + str(step)] = fill(shift(close, -step), -999)
+        return out
     
     def add_features(self, df: pd.DataFrame) -> pd.DataFrame:
         if not df.index.is_unique:
@@ -0,0 +1,214 @@
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections
+
+from dataset_manager.feature_engine import FeatureEngine
+from dataset_manager.services import DataSetService, StockDataSetService, MAX_LOOKBACK
+from dataset_manager.sources import get_data_source
+
+
+def init_worker():
+    # Spawned workers need the app registry to unpickle the factory configs, forked ones inherit it
+    if not apps.ready:
+        django.setup()
+
+
+def compute_features(data_source, factories, start_date, end_date, metadata, min_rows):
+    '''
+    Runs in a worker process: fetch the bars of one dataset and compute its features. Does not touch the
+    database.
+    '''
+    df = data_source.fetch(start_date, end_date, **metadata)
+    if len(df) < min_rows:
+        raise ValueError(f"Not enough data points for {metadata}: {len(df)} rows")
+    return FeatureEngine(factories).apply(df)
+
+
+class IngestionJob:
+    def __init__(self, ticker, metadata, start_date, end_date=None, dataset=None, rewrite_from=None):
+        self.ticker = ticker
+        self.metadata = metadata
+        self.start_date = start_date
+        self.end_date = end_date
+        # Set when updating an existing dataset, see DataSetService.get_update_window
+        self.dataset = dataset
+        self.rewrite_from = rewrite_from
+
+
+class IngestionReport:
+    '''
+    Outcome of a batch ingestion per ticker. Failures keep the stage (fetch/compute or write) and the error.
+    '''
+
+    def __init__(self):
+        self.succeeded = {}
+        self.failed = {}
+        self.skipped = {}
+        self.started = time.perf_counter()
+        self.elapsed = None
+        self.lock = threading.Lock()
+
+    def add_success(self, ticker, rows, seconds):
+        with self.lock:
+            self.succeeded[ticker] = {'rows': rows, 'seconds': round(seconds, 3)}
+
+    def add_failure(self, ticker, stage, error):
+        with self.lock:
+            self.failed[ticker] = {
+                'stage': stage,
+                'error': f"{type(error).__name__}: {error}",
+                'traceback': ''.join(traceback.format_exception(type(error), error, error.__traceback__)),
+            }
+
+    def add_skipped(self, ticker, reason):
+        with self.lock:
+            self.skipped[ticker] = reason
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.started
+        return self
+
+    def to_dict(self):
+        return {
+            'succeeded': self.succeeded,
+            'failed': {ticker: {key: value for key, value in failure.items() if key != 'traceback'}
+                       for ticker, failure in self.failed.items()},
+            'skipped': self.skipped,
+            'elapsed': self.elapsed,
+        }
+
+    def summary(self):
+        lines = [f"Ingested {len(self.succeeded)} tickers, {len(self.failed)} failed, {len(self.skipped)} skipped"
+                 + (f" in {self.elapsed:.1f} s" if self.elapsed is not None else "")]
+        for ticker, result in self.succeeded.items():
+            lines.append(f"  ok      {ticker}: {result['rows']} rows")
+        for ticker, reason in self.skipped.items():
+            lines.append(f"  skipped {ticker}: {reason}")
+        for ticker, failure in self.failed.items():
+            lines.append(f"  failed  {ticker} ({failure['stage']}): {failure['error']}")
+        return '\n'.join(lines)
+
+
+class BatchIngestionService:
+    '''
+    Creates or updates the datasets of many tickers at once.
+
+    Fetching and feature computation, the CPU-bound part, run in a ProcessPoolExecutor with one task per
+    ticker. The computed frames are handed to a small pool of writer threads, the only place the database is
+    written. A ticker holds one of max_pending slots from its submission until its frame is written, so at most
+    max_pending frames are in memory when writes are slower than computation. A ticker failing at any stage is recorded in the IngestionReport and does not stop the
+    others.
+
+    on_written(ticker, dataset) is called in the writer thread after a dataset is written, e.g. to build
+    its sequence sets.
+    '''
+
+    dataset_service = StockDataSetService
+
+    def __init__(self, processes=None, writers=None, max_pending=None, data_source=None, on_written=None):
+        self.processes = processes or getattr(settings, 'DATASET_INGEST_PROCESSES', None)
+        self.writers = writers or getattr(settings, 'DATASET_INGEST_WRITERS', 2)
+        self.max_pending = max_pending or 2 * self.writers
+        self.data_source = data_source or get_data_source()
+        self.on_written = on_written
+
+    def add_tickers(self, tickers, start_date, end_date=None, interval="1d", dataset_type="stock"):
+        '''
+        Create the datasets of tickers that don't have one yet
+        '''
+        report = IngestionReport()
+        jobs = []
+        for ticker in tickers:
+            metadata = {'dataset_type': dataset_type, 'ticker': ticker, 'interval': interval}
+            if DataSetService.dataset_exists(**metadata):
+                report.add_skipped(ticker, "dataset exists")
+                continue
+            jobs.append(IngestionJob(ticker, metadata, start_date, end_date))
+        return self.run(jobs, report)
+
+    def update_tickers(self, tickers, interval="1d", dataset_type="stock", full=False):
+        '''
+        Update the datasets of tickers with their recent data, see DataSetService.update_recent_data
+        '''
+        report = IngestionReport()
+        history_window = None if full else self.dataset_service.get_feature_factory_service().get_history_window()
+        jobs = []
+        for ticker in tickers:
+            dataset = DataSetService.get_data_set(dataset_type=dataset_type, ticker=ticker, interval=interval)
+            if dataset is None:
+                report.add_skipped(ticker, "no dataset")
+                continue
+            try:
+                start_date, rewrite_from = DataSetService.get_update_window(dataset, history_window)
+            except Exception as e:
+                report.add_failure(ticker, 'plan', e)
+                continue
+            jobs.append(IngestionJob(ticker, dataset.metadata, start_date, dataset=dataset, rewrite_from=rewrite_from))
+        return self.run(jobs, report)
+
+    def run(self, jobs, report=None):
+        report = report or IngestionReport()
+        if not jobs:
+            return report.finish()
+
+        factories = self.dataset_service.get_feature_factory_service().load_factories_from_db()
+        # Forked workers must not share the connections of this process
+        connections.close_all()
+
+        pending = threading.BoundedSemaphore(self.max_pending)
+        processes = min(len(jobs), self.processes) if self.processes else None
+        with ProcessPoolExecutor(max_workers=processes, initializer=init_worker) as pool, \
+                ThreadPoolExecutor(max_workers=self.writers, thread_name_prefix='dataset_writer') as writer_pool:
+            queued = list(jobs)
+            futures = {}
+            writes = []
+            # Computed frames come back whether or not a writer is free, so a job is only submitted when a
+            # pending slot is taken for its result. At most max_pending frames are computed or waiting.
+            while queued or futures:
+                while queued and pending.acquire(blocking=not futures):
+                    job = queued.pop(0)
+                    # Updates only need the tail of the history, new datasets a full lookback
+                    min_rows = 1 if job.dataset is not None else MAX_LOOKBACK
+                    future = pool.submit(compute_features, self.data_source, factories, job.start_date,
+                                         job.end_date, job.metadata, min_rows)
+                    futures[future] = (job, time.perf_counter())
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, started = futures.pop(future)
+                    try:
+                        df = future.result()
+                    except Exception as e:
+                        report.add_failure(job.ticker, 'compute', e)
+                        pending.release()
+                        continue
+                    writes.append(writer_pool.submit(self.write, job, df, started, report, pending))
+                    del df
+
+            for write in writes:
+                write.result()
+
+        return report.finish()
+
+    def write(self, job, df, started, report, pending):
+        try:
+            if job.dataset is None:
+                dataset = DataSetService.save_new_dataset(df, **job.metadata)
+            else:
+                dataset = job.dataset
+                DataSetService.save_recent_data(dataset, df, job.rewrite_from)
+            if self.on_written:
+                self.on_written(job.ticker, dataset)
+            report.add_success(job.ticker, len(df), time.perf_counter() - started)
+        except Exception as e:
+            report.add_failure(job.ticker, 'write', e)
+        finally:
+            pending.release()
+            # Every writer thread opens its own connection
+            connection.close()
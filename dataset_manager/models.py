@@ -17,6 +17,8 @@ class DataSet(models.Model):
     end_timestamp = models.DateTimeField()
     features = models.JSONField()
     metadata = models.JSONField()
+    # Manifest of the columnar data files (see ColumnarDataStore), null for datasets still stored as DataRows
+    storage = models.JSONField(blank=True, null=True)
 
 class DataRow(models.Model):
     dataset = models.ForeignKey(DataSet, on_delete=models.CASCADE)
@@ -1,10 +1,12 @@
 from abc import ABC
 
 import numpy as np
-import yfinance as yf
 import pandas as pd
 from dataset_manager.models import FeatureFactoryConfig, DataSet, DataRow
-from django.db import transaction 
+from dataset_manager.feature_engine import FeatureEngine
+from dataset_manager.sources import get_data_source
+from dataset_manager.storage import ColumnarDataStore
+from django.db import transaction
 from dataset_manager.stock_config import STOCK_FACTORY_CONFIG_LIST
 import importlib
 import queue
@@ -22,11 +24,8 @@ class FeatureFactoryService(ABC):
 
     def apply_feature_factories(self, df):
         factories = self.load_factories_from_db()
-        for factory in factories:
-            print(f"Applying {factory.config.name} to {df.index[0]} - {df.index[-1]}")
-            df = factory.add_features(df)
-
-        return df
+        print(f"Applying {', '.join(factory.config.name for factory in factories)} to {df.index[0]} - {df.index[-1]}")
+        return FeatureEngine(factories).apply(df)
 
     def load_factories_from_db(self):
         self.update_factory_configs()
@@ -43,6 +42,17 @@ class FeatureFactoryService(ABC):
 
         return factories
 
+    def get_history_window(self):
+        '''
+        (lookback, lookahead): the rows before a row needed to compute its features from a tail of the data,
+        and the rows after it its features depend on. Lookbacks are counted from the raw columns, so the
+        largest one covers every factory.
+        '''
+        factories = self.load_factories_from_db()
+        lookback = max([factory.get_lookback() for factory in factories], default=0)
+        lookahead = max([factory.get_lookahead() for factory in factories], default=0)
+        return lookback, lookahead
+
     def update_factory_configs(self):
         updated_configs_queue = queue.Queue()
         config_list = self.get_config_list()
@@ -142,10 +152,13 @@ class DataSetService(ABC):
     def get_feature_factory_service():
         pass
 
+    @staticmethod
+    def dataset_exists(**kwargs):
+        return DataSet.objects.filter(dataset_type=kwargs.get('dataset_type'), metadata__contains=kwargs).exists()
+
     @classmethod
     def create_new_dataset(cls, start_date, end_date = None, **kwargs):
-        if DataSet.objects.filter(dataset_type=kwargs.get('dataset_type'),
-                                  metadata__contains = kwargs).exists():
+        if DataSetService.dataset_exists(**kwargs):
             print(f"Dataset {kwargs.get('dataset_type')} already exists in the database")
             return
 
@@ -159,7 +172,15 @@ class DataSetService(ABC):
             raise ValueError("Not enough data points to create a new dataset")
 
         df = cls.get_feature_factory_service().apply_feature_factories(df)
+        DataSetService.save_new_dataset(df, **kwargs)
 
+        return df
+
+    @staticmethod
+    def save_new_dataset(df, **kwargs):
+        '''
+        Create a DataSet with the metadata kwargs from a DataFrame of computed features
+        '''
         with transaction.atomic():
             dataset = DataSet.objects.create(
                 dataset_type=kwargs.get('dataset_type'),
@@ -170,9 +191,9 @@ class DataSetService(ABC):
             )
 
             dataset.save()
-            DataSetService.dataframe_to_datarows(df, dataset)
+            ColumnarDataStore().write(dataset, df)
 
-        return df
+        return dataset
 
     @staticmethod
     def get_data_set(dataset_type, **kwargs):
@@ -180,66 +201,123 @@ class DataSetService(ABC):
 
     @staticmethod
     def get_df_range(dataset, start_timestamp, end_timestamp):
-        df = DataSetService.datarows_to_dataframe(dataset, start_timestamp, end_timestamp)
+        df = DataSetService.load_dataframe(dataset, start_timestamp, end_timestamp)
         return df
 
     @staticmethod
-    def update_existing_dataset(df, dataset):
+    def load_dataframe(dataset, start_timestamp=None, end_timestamp=None, columns=None):
         '''
-        Update an existing DataSet object with new data
+        Load the rows of a DataSet between two timestamps from its columnar storage. Datasets still stored as
+        DataRow objects are converted the first time they are read.
         '''
-        existing_records = DataRow.objects.filter(dataset=dataset)
+        store = ColumnarDataStore()
+        if not store.has_data(dataset):
+            DataSetService.migrate_to_columnar(dataset)
+        return store.load(dataset, start_timestamp, end_timestamp, columns)
 
-        existing_records_map = {record.timestamp: record for record in existing_records}
-
-        upddated_records = []
-
-        df.fillna(-999, inplace=True)
-
-        for index, row in df.iterrows():
-            timestamp = index
-            data_record = existing_records_map.get(timestamp)
+    @staticmethod
+    def load_timestamps(dataset):
+        '''
+        Timestamps of every row of a DataSet, without loading the features
+        '''
+        store = ColumnarDataStore()
+        if not store.has_data(dataset):
+            DataSetService.migrate_to_columnar(dataset)
+        return store.timestamps(dataset)
 
-            if data_record:
-                data_record.features = row.to_dict()
-                upddated_records.append(data_record)
+    @staticmethod
+    def migrate_to_columnar(dataset):
+        '''
+        Move the DataRow objects of a DataSet to columnar storage
+        '''
+        store = ColumnarDataStore()
+        with transaction.atomic():
+            # Another reader may have migrated the dataset while this one waited for the lock
+            current = DataSet.objects.select_for_update().only('storage').get(pk=dataset.pk)
+            if store.has_data(current):
+                dataset.storage = current.storage
+                return
+            df = DataSetService.datarows_to_dataframe(dataset)
+            store.write(dataset, df)
+            DataRow.objects.filter(dataset=dataset).delete()
+        print(f"Migrated {len(df)} rows of dataset {dataset.pk} to columnar storage")
 
-            else:
-                DataRow.objects.create(
-                    dataset=dataset,
-                    timestamp=timestamp,
-                    features=row.to_dict(),
-                )
+    @staticmethod
+    def update_existing_dataset(df, dataset):
+        '''
+        Update an existing DataSet object with new data. Rows of df replace the stored rows with the same
+        timestamp, other stored rows are kept.
+        '''
+        existing_df = DataSetService.load_dataframe(dataset)
+        combined_df = pd.concat([existing_df[~existing_df.index.isin(df.index)], df]).sort_index()
 
-        if upddated_records:
-            with transaction.atomic():
-                DataRow.objects.bulk_update(upddated_records, ['features'])
+        with transaction.atomic():
+            ColumnarDataStore().write(dataset, combined_df)
+            dataset.features = combined_df.columns.tolist()
+            dataset.save(update_fields=['features'])
 
     @classmethod
-    def update_recent_data(cls, dataset):
+    def update_recent_data(cls, dataset, full=False):
         '''
-        Update the most recent data in the database
+        Update the most recent data in the database.
+
+        Only the tail of the history the feature factories need is fetched again: the rows whose features
+        change with new data (the last bar and the rows with targets that were cut off), preceded by the
+        factories' lookback. Features are computed on that tail and only the changed and new rows are
+        written. With full set the whole history is fetched and recomputed.
         '''
-        last_data_point = DataRow.objects.filter(dataset=dataset).order_by('-timestamp').first()
-        first_data_point = DataRow.objects.filter(dataset=dataset).order_by('timestamp').first()
+        feature_factory_service = cls.get_feature_factory_service()
+        start_date, rewrite_from = DataSetService.get_update_window(
+            dataset, None if full else feature_factory_service.get_history_window())
+
         try:
             # add start_timestamp to meta_data with key 'start_date'
 
-            new_data = cls.retreive_external_df(start_date = first_data_point.timestamp, **dataset.metadata)
+            new_data = cls.retreive_external_df(start_date = start_date, **dataset.metadata)
         except Exception as e:
             print(f"Error fetching data for {dataset.dataset_type}: {e}")
             return
 
-        # historical_df = DataSetService.datarows_to_dataframe(dataset)
-        #
-        # combined_df = pd.concat([historical_df[:-1][new_data.columns], new_data])
-        combined_df = new_data
+        df = feature_factory_service.apply_feature_factories(new_data)
+        DataSetService.save_recent_data(dataset, df, rewrite_from)
 
-        df = cls.get_feature_factory_service().apply_feature_factories(combined_df)
+    @staticmethod
+    def get_update_window(dataset, history_window=None):
+        '''
+        (start_date, rewrite_from) of an update of a dataset: the date to fetch the data from and the first
+        row to write back, None to write every row. Without the (lookback, lookahead) history_window of the
+        feature factories the whole history is fetched.
+        '''
+        if history_window is None:
+            return dataset.start_timestamp, None
+
+        lookback, lookahead = history_window
+        timestamps = DataSetService.load_timestamps(dataset)
+        # The last stored bar may have been incomplete when it was fetched
+        rewrite = max(lookahead, 1)
+        first_row = len(timestamps) - rewrite - lookback
+        if first_row <= 0:
+            return dataset.start_timestamp, None
+        return timestamps[first_row], timestamps[len(timestamps) - rewrite]
+
+    @staticmethod
+    def save_recent_data(dataset, df, rewrite_from=None):
+        '''
+        Write the features computed for an update of a dataset, see get_update_window
+        '''
         dataset.end_timestamp = df.index[-1]
+        if rewrite_from is None:
+            with transaction.atomic():
+                DataSetService.update_existing_dataset(df, dataset)
+                dataset.save()
+            return
 
+        # Rows before rewrite_from only served as lookback, the stored ones are kept. The fetched tail replaces
+        # every stored row from rewrite_from on and is written without reading or rewriting the history.
+        df = df[df.index >= rewrite_from]
+        print(f"Updating {len(df)} rows of {dataset.dataset_type} dataset {dataset.pk}")
         with transaction.atomic():
-            DataSetService.update_existing_dataset(df, dataset)
+            dataset.features = ColumnarDataStore().append(dataset, df)['columns']
             dataset.save()
 
     @staticmethod
@@ -258,32 +336,17 @@ class DataSetService(ABC):
         '''
         Add a new feature to the existing dataset
         '''
-        df = DataSetService.datarows_to_dataframe(dataset)
+        df = DataSetService.load_dataframe(dataset)
         df = cls.get_feature_factory_service().apply_feature_factories(df)
 
-        DataSetService.update_existing_data(df, dataset)
+        DataSetService.update_existing_dataset(df, dataset)
 
 
-    @staticmethod
-    def dataframe_to_datarows(df, dataset):
-        '''
-        Save a DataFrame to the database as DataRow objects
-        '''
-        # replace nans with -999
-        df.fillna(-999, inplace=True)
-
-        with transaction.atomic():
-            for _, row in df.iterrows():
-                DataRow.objects.create(
-                    dataset=dataset,
-                    timestamp=row.name,
-                    features=row.to_dict(),
-                )
-
     @staticmethod
     def datarows_to_dataframe(dataset, start_timestamp=None, end_timestamp=None):
         '''
-        Retrieve DataRow objects from the database and convert them to a DataFrame
+        Retrieve DataRow objects from the database and convert them to a DataFrame. Only used to read datasets
+        not yet migrated to columnar storage, see load_dataframe
         '''
 
         data_rows = DataRow.objects.filter(dataset=dataset)
@@ -311,36 +374,9 @@ class StockDataSetService(DataSetService):
     @staticmethod
     def retreive_external_df(start_date, end_date = None, **kwargs):
         '''
-        Retrieve stock data from the yfinance package
+        Retrieve stock data from the configured DataSource, yfinance by default
         '''
-        ticker = kwargs.get('ticker')
-        interval = kwargs.get('interval')
-
-        df = pd.DataFrame()
-        if end_date:
-            df = yf.download([ticker], start=start_date, end=end_date, interval=interval, multi_level_index=False)
-        else:
-            df = yf.download([ticker], start=start_date, interval=interval, multi_level_index=False)
-
-        print(df.head())
-        if df.index.tzinfo is None:
-            df.index = pd.to_datetime(df.index).tz_localize('UTC')
-
-        df.index = pd.to_datetime(df.index).tz_convert('UTC')
-
-        print(df.head())
-
-        df = df.rename(
-            columns={
-                "Open": "open",
-                "High": "high",
-                "Low": "low",
-                "Close": "close",
-                "Volume": "volume",
-            }
-        )
-
-        return df
+        return get_data_source().fetch(start_date, end_date, **kwargs)
 
     @staticmethod
     def get_feature_factory_service():
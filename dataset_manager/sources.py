@@ -0,0 +1,103 @@
+import importlib
+from abc import ABC, abstractmethod
+from pathlib import Path
+
+import pandas as pd
+import yfinance as yf
+from django.conf import settings
+
+OHLCV_COLUMNS = {
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Volume": "volume",
+}
+
+
+class DataSource(ABC):
+    '''
+    External source of the raw bars of a dataset. Sources are pickled into the ingestion worker processes, so
+    they should only hold plain configuration.
+    '''
+
+    @abstractmethod
+    def fetch(self, start_date, end_date=None, **kwargs) -> pd.DataFrame:
+        '''
+        Bars from start_date up to (excluding) end_date as a DataFrame indexed by UTC timestamps, with open,
+        high, low, close and volume columns. kwargs is the dataset metadata (ticker, interval, ...).
+        '''
+        pass
+
+    @staticmethod
+    def normalize(df):
+        df = df.rename(columns=OHLCV_COLUMNS)
+        df.index = pd.to_datetime(df.index)
+        if df.index.tzinfo is None:
+            df.index = df.index.tz_localize('UTC')
+        df.index = df.index.tz_convert('UTC')
+        return df
+
+    @staticmethod
+    def to_utc(timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        return timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+
+
+class YFinanceDataSource(DataSource):
+    '''
+    Stock data from the yfinance package
+    '''
+
+    def fetch(self, start_date, end_date=None, **kwargs):
+        ticker = kwargs.get('ticker')
+        interval = kwargs.get('interval')
+
+        if end_date:
+            df = yf.download([ticker], start=start_date, end=end_date, interval=interval, multi_level_index=False)
+        else:
+            df = yf.download([ticker], start=start_date, interval=interval, multi_level_index=False)
+
+        print(df.head())
+        return self.normalize(df)
+
+
+class FileDataSource(DataSource):
+    '''
+    Bars read from <ticker>.parquet or <ticker>.csv files in a directory, a local stand-in for yfinance in
+    tests and offline runs. The first column (or the index of a parquet file) holds the timestamps, the OHLCV
+    columns may use the yfinance or the lowercase names. The interval is not checked.
+    '''
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    def fetch(self, start_date, end_date=None, **kwargs):
+        ticker = kwargs.get('ticker')
+        parquet_path = self.directory / f"{ticker}.parquet"
+        csv_path = self.directory / f"{ticker}.csv"
+        if parquet_path.exists():
+            df = pd.read_parquet(parquet_path)
+        elif csv_path.exists():
+            df = pd.read_csv(csv_path, index_col=0)
+        else:
+            raise ValueError(f"No data file for {ticker} in {self.directory}")
+
+        df = self.normalize(df).sort_index()
+        if start_date:
+            df = df[df.index >= self.to_utc(start_date)]
+        if end_date:
+            df = df[df.index < self.to_utc(end_date)]
+        return df
+
+
+def get_data_source():
+    '''
+    The DataSource configured with DATASET_DATA_SOURCE, a dict with the class_path of the source and the
+    parameters passed to it. yfinance by default.
+    '''
+    config = getattr(settings, 'DATASET_DATA_SOURCE', None) or {}
+    class_path = config.get('class_path', 'dataset_manager.sources.YFinanceDataSource')
+    module_name, class_name = class_path.rsplit(".", 1)
+    source_class = getattr(importlib.import_module(module_name), class_name)
+    return source_class(**config.get('parameters', {}))
@@ -0,0 +1,255 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from dataset_manager.models import DataSet
+
+STORAGE_FORMAT = 'npy-columnar'
+# Missing value marker of the feature factories (targets past the end of the data) and of DataRow features
+MISSING_VALUE = -999
+
+
+class ColumnarDataStore:
+    '''
+    Columnar storage of DataSet rows on the local filesystem, under DATASET_STORE_DIR.
+
+    Each version of a dataset is a directory with two .npy files: the timestamps as int64 UTC nanoseconds and
+    a float64 matrix with one contiguous column per feature (Fortran order). The manifest on the DataSet row
+    (DataSet.storage) names the current version, its columns and row count. Reads memory-map the files and
+    slice the time range with a binary search, so no per-row decoding is done.
+
+    A dataset is made of one or more segments, version directories of which the first rows are used. write
+    replaces the data with a single segment. append only writes the rows from its first timestamp on as a new
+    segment and keeps the stored rows before it, using a prefix of the segment they are in, so an update costs
+    the size of the update rather than of the history. Once a dataset has MAX_SEGMENTS segments the next
+    append rewrites it as one.
+
+    Writes never modify a version in place: a new version is written next to the current one and the manifest is
+    switched to it while the DataSet row is locked, so concurrent writers pick versions one after another. The
+    versions the new manifest no longer uses are only marked as superseded once the transaction commits and
+    removed DATASET_STORE_GRACE_SECONDS later, so readers holding the previous manifest keep working. Like the
+    entity ArrayStore this assumes the web server and workers share a filesystem.
+    '''
+
+    TIMESTAMPS_FILE = 'timestamps.npy'
+    VALUES_FILE = 'values.npy'
+    SUPERSEDED_FILE = 'superseded'
+    MAX_SEGMENTS = 16
+
+    def __init__(self, root=None):
+        self.root = Path(root or getattr(settings, 'DATASET_STORE_DIR', Path(settings.BASE_DIR) / 'dataset_store'))
+
+    def dataset_dir(self, dataset):
+        return self.root / f"dataset_{dataset.pk}"
+
+    def version_dir(self, dataset, version):
+        return self.dataset_dir(dataset) / f"v{version}"
+
+    @staticmethod
+    def has_data(dataset):
+        return bool(dataset.storage) and dataset.storage.get('format') == STORAGE_FORMAT
+
+    @staticmethod
+    def get_segments(manifest):
+        '''
+        [{'path', 'rows'}] of the segments of a manifest, manifests written before segments have a single one
+        '''
+        return manifest.get('segments') or [{'path': manifest['path'], 'rows': manifest['rows']}]
+
+    @staticmethod
+    def to_arrays(df):
+        df = df.sort_index()
+        index = pd.DatetimeIndex(df.index)
+        index = index.tz_localize('UTC') if index.tz is None else index.tz_convert('UTC')
+        timestamps = index.asi8.astype(np.int64)
+        values = np.asfortranarray(df.to_numpy(dtype=np.float64, na_value=np.nan))
+        # Readers mask missing targets with np.isnan, like datarows_to_dataframe did
+        values[values == MISSING_VALUE] = np.nan
+        return timestamps, values
+
+    def write(self, dataset, df):
+        '''
+        Write a DataFrame indexed by timestamp as the new version of a dataset and save its manifest.
+        Every column has to be numeric, missing values (NaN or MISSING_VALUE) are stored as NaN.
+        '''
+        timestamps, values = self.to_arrays(df)
+        with transaction.atomic():
+            # The row lock orders concurrent writers, the version is read after it is taken
+            current = DataSet.objects.select_for_update().only('storage').get(pk=dataset.pk)
+            previous = current.storage if self.has_data(current) else None
+            return self.save_version(dataset, previous, [], timestamps, values, df.columns)
+
+    def append(self, dataset, df):
+        '''
+        Replace the stored rows of a dataset from the first timestamp of df on with the rows of df. Only df is
+        written, unless its columns differ from the stored ones, it starts before the stored rows or the
+        dataset has MAX_SEGMENTS segments; the dataset is then rewritten as a whole.
+        '''
+        df = df.sort_index()
+        timestamps, values = self.to_arrays(df)
+        with transaction.atomic():
+            current = DataSet.objects.select_for_update().only('storage').get(pk=dataset.pk)
+            if not self.has_data(current):
+                return self.write(dataset, df)
+            previous = current.storage
+            segments = self.get_segments(previous)
+
+            # Stored rows before the first new one, the segments keep their files and may lose their tail
+            kept = []
+            for segment in segments:
+                segment_timestamps = np.load(self.root / segment['path'] / self.TIMESTAMPS_FILE, mmap_mode='r')
+                rows = int(np.searchsorted(segment_timestamps[:segment['rows']], timestamps[0], side='left'))
+                if rows > 0:
+                    kept.append({'path': segment['path'], 'rows': rows})
+                if rows < segment['rows']:
+                    break
+
+            columns = [str(column) for column in df.columns]
+            if kept and columns == previous['columns'] and len(kept) < self.MAX_SEGMENTS:
+                return self.save_version(dataset, previous, kept, timestamps, values, df.columns)
+
+            dataset.storage = previous
+            existing_df = self.load(dataset)
+            return self.write(dataset, pd.concat([existing_df[existing_df.index < df.index[0]], df]))
+
+    def save_version(self, dataset, previous, kept, timestamps, values, columns):
+        '''
+        Write timestamps and values as a new segment following the kept segments and switch the manifest to
+        it. Called with the DataSet row locked.
+        '''
+        version = previous['version'] + 1 if previous else 1
+        # A directory left by a writer whose transaction rolled back keeps its number, it is never overwritten
+        while self.version_dir(dataset, version).exists():
+            version += 1
+        path = self.version_dir(dataset, version)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # Write into a temporary directory and rename it, so a version directory is always complete
+        tmp_dir = tempfile.mkdtemp(dir=path.parent, suffix='.tmp')
+        try:
+            np.save(os.path.join(tmp_dir, self.TIMESTAMPS_FILE), timestamps, allow_pickle=False)
+            np.save(os.path.join(tmp_dir, self.VALUES_FILE), values, allow_pickle=False)
+            # Fails instead of replacing a directory that appeared since the check
+            os.rename(tmp_dir, path)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        relative_path = str(path.relative_to(self.root))
+        segments = kept + [{'path': relative_path, 'rows': len(timestamps)}]
+        dataset.storage = {
+            'format': STORAGE_FORMAT,
+            'version': version,
+            'path': relative_path,
+            'segments': segments,
+            'columns': [str(column) for column in columns],
+            'rows': sum(segment['rows'] for segment in segments),
+        }
+        dataset.save(update_fields=['storage'])
+
+        if previous:
+            used = {segment['path'] for segment in segments}
+            unused = [self.root / segment['path'] for segment in self.get_segments(previous)
+                      if segment['path'] not in used]
+            transaction.on_commit(lambda: self.retire(dataset, unused))
+        return dataset.storage
+
+    def retire(self, dataset, paths):
+        '''
+        Mark version directories as superseded and remove the versions of the dataset superseded longer than
+        DATASET_STORE_GRACE_SECONDS ago
+        '''
+        for path in paths:
+            if path.exists():
+                (path / self.SUPERSEDED_FILE).touch()
+        grace = getattr(settings, 'DATASET_STORE_GRACE_SECONDS', 600)
+        for version_dir in self.dataset_dir(dataset).glob('v*'):
+            marker = version_dir / self.SUPERSEDED_FILE
+            try:
+                if time.time() - marker.stat().st_mtime >= grace:
+                    shutil.rmtree(version_dir, ignore_errors=True)
+            except FileNotFoundError:
+                continue
+
+    def open_segments(self, dataset):
+        '''
+        (timestamps, values) memory maps of the rows of every segment of a dataset. A manifest loaded before
+        a later write may name a version that was already removed, it is reloaded from the database then.
+        '''
+        if not self.has_data(dataset):
+            raise ValueError(f"DataSet {dataset.pk} has no columnar data")
+        segments = self.get_segments(dataset.storage)
+        if not all((self.root / segment['path']).exists() for segment in segments):
+            dataset.refresh_from_db(fields=['storage'])
+            segments = self.get_segments(dataset.storage)
+
+        arrays = []
+        for segment in segments:
+            path = self.root / segment['path']
+            arrays.append((np.load(path / self.TIMESTAMPS_FILE, mmap_mode='r')[:segment['rows']],
+                           np.load(path / self.VALUES_FILE, mmap_mode='r')[:segment['rows']]))
+        return arrays
+
+    def load(self, dataset, start_timestamp=None, end_timestamp=None, columns=None):
+        '''
+        Load the rows of a dataset between two timestamps (inclusive) as a DataFrame indexed by 'Date'
+
+        :param columns: features to load, all of them by default
+        '''
+        segments = self.open_segments(dataset)
+        all_columns = dataset.storage['columns']
+        if columns is None:
+            columns = all_columns
+            positions = None
+        else:
+            column_positions = {column: i for i, column in enumerate(all_columns)}
+            missing = [column for column in columns if column not in column_positions]
+            if missing:
+                raise ValueError(f"Features {missing} not in DataSet {dataset.pk}")
+            positions = [column_positions[column] for column in columns]
+
+        timestamp_parts = []
+        value_parts = []
+        for timestamps, values in segments:
+            start = np.searchsorted(timestamps, self.to_nanoseconds(start_timestamp), side='left') \
+                if start_timestamp is not None else 0
+            end = np.searchsorted(timestamps, self.to_nanoseconds(end_timestamp), side='right') \
+                if end_timestamp is not None else len(timestamps)
+            if start >= end:
+                continue
+            timestamp_parts.append(timestamps[start:end])
+            # Copy out of the memory map, callers modify the frame in place
+            value_parts.append(np.array(values[start:end]) if positions is None else values[start:end, positions])
+
+        if value_parts:
+            data = np.concatenate(value_parts) if len(value_parts) > 1 else value_parts[0]
+            index = pd.to_datetime(np.concatenate(timestamp_parts), utc=True)
+        else:
+            data = np.empty((0, len(columns)))
+            index = pd.to_datetime(np.empty(0, dtype=np.int64), utc=True)
+        df = pd.DataFrame(data, index=index, columns=list(columns))
+        df.index.name = 'Date'
+        return df
+
+    def timestamps(self, dataset):
+        '''
+        Timestamps of every row of a dataset, in order
+        '''
+        timestamps = np.concatenate([segment_timestamps for segment_timestamps, _ in self.open_segments(dataset)])
+        return pd.to_datetime(timestamps, utc=True)
+
+    def delete(self, dataset):
+        shutil.rmtree(self.dataset_dir(dataset), ignore_errors=True)
+
+    @staticmethod
+    def to_nanoseconds(timestamp):
+        timestamp = pd.Timestamp(timestamp)
+        timestamp = timestamp.tz_localize('UTC') if timestamp.tzinfo is None else timestamp.tz_convert('UTC')
+        return timestamp.value
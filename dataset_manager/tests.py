@@ -1,14 +1,20 @@
+import shutil
+import tempfile
 from datetime import datetime
 
 import numpy as np
 import pandas as pd
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
 from keras.src.legacy.backend import update
 import pandas.testing as pdt
 
 from dataset_manager.models import FeatureFactoryConfig, DataSet, DataRow
 from dataset_manager.services import FeatureFactoryService, StockDataSetService, StockFeatureFactoryService, \
     DataSetService
+from dataset_manager.storage import ColumnarDataStore
+from dataset_manager.feature_engine import FeatureEngine, ENGINE_RTOL, ENGINE_ATOL
+from dataset_manager.ingestion import BatchIngestionService, compute_features
+from dataset_manager.sources import FileDataSource
 from dataset_manager.factories import MovingAverageFeatureFactory, OHLCVFeatureFactory, BandFeatureFactory, MomentumFeatureFactory,TargetFeatureFactory
 
 
@@ -475,20 +481,6 @@ class TestStockDataSetService(TestCase):
         df = StockDataSetService.retreive_external_df(ticker = "AAPL", start_date = "2020-01-01", interval = "1d")
         self.assertEqual(sorted(df.columns.tolist()), sorted(["open", "high", "low", "close", "volume"]))
 
-    def test_dataframe_to_datarows(self):
-        df = StockDataSetService.retreive_external_df(ticker = "SPY", start_date = "2020-01-01", end_date = "2021-01-10", interval = "1d")
-        dataset = DataSet.objects.create(dataset_type="stock", start_timestamp="2020-01-01", end_timestamp="2021-01-10", features = self.all_columns, metadata = {"ticker": "SPY", "timeframe": "1d"})
-        StockDataSetService.dataframe_to_datarows(df, dataset)
-
-        self.assertEqual(DataRow.objects.count(), len(df))
-
-        df.index = pd.DatetimeIndex(df.index)
-
-        datarows = DataRow.objects.all()
-        for datarow in datarows:
-            # assert that the data is the same
-            self.assertEqual(datarow.features, df.loc[datarow.timestamp].to_dict())
-
     def test_create_new_dataset(self):
         StockDataSetService.create_new_dataset(dataset_type="stock", start_date="2020-01-01", end_date="2021-01-10", ticker="SPY", interval="1d")
         df = StockDataSetService.retreive_external_df(ticker="SPY", start_date="2020-01-01", end_date="2021-01-10",
@@ -501,10 +493,11 @@ class TestStockDataSetService(TestCase):
         self.assertEqual(dataset.end_timestamp, df.iloc[-1].name)
         self.assertEqual(sorted(dataset.features), sorted(self.all_columns))
 
-        datarows = DataRow.objects.filter(dataset=dataset)
-        self.assertEqual(len(datarows), len(df))
-        for datarow in datarows:
-            self.assertEqual(sorted(datarow.features.items()), sorted(df.loc[datarow.timestamp].to_dict().items()))
+        df_db = StockDataSetService.load_dataframe(dataset)
+        self.assertEqual(dataset.storage['rows'], len(df))
+        self.assertEqual(df_db.index.tolist(), df.index.tolist())
+        self.assertTrue(np.allclose(df_db[df.columns].values, df.replace({-999: np.nan}).values.astype(np.float64),
+                                    equal_nan=True))
 
 
     def test_update_existing_dataset(self):
@@ -518,10 +511,11 @@ class TestStockDataSetService(TestCase):
         df[new_cols] = 1
         StockDataSetService.update_existing_dataset(df, dataset)
 
-        datarows = DataRow.objects.filter(dataset=dataset)
-        self.assertEqual(len(datarows), len(df))
-        for datarow in datarows:
-            self.assertEqual(sorted(datarow.features.items()), sorted(df.loc[datarow.timestamp].to_dict().items()))
+        df_db = StockDataSetService.load_dataframe(dataset)
+        self.assertEqual(len(df_db), len(df))
+        self.assertIn("new_column", df_db.columns)
+        self.assertTrue(np.allclose(df_db[df.columns].values, df.replace({-999: np.nan}).values.astype(np.float64),
+                                    equal_nan=True))
 
     def test_update_recent_data(self):
 
@@ -541,7 +535,7 @@ class TestStockDataSetService(TestCase):
         self.assertEqual(updated_dataset.end_timestamp, df.index.max())
         self.assertEqual(sorted(updated_dataset.features), sorted(self.all_columns))
 
-        df_db = StockDataSetService.datarows_to_dataframe(dataset)
+        df_db = StockDataSetService.load_dataframe(updated_dataset)
         df_db = df_db[sorted(df_db.columns)]
         df = df[sorted(df.columns)]
         df.replace({-999: np.nan}, inplace=True)
@@ -553,13 +547,14 @@ class TestStockDataSetService(TestCase):
         self.assertTrue(np.allclose(df_db.values, df.values, equal_nan=True, atol=1e-2))
 
 
-    def test_datarows_to_dataframe(self):
+    def test_load_dataframe(self):
         StockDataSetService.create_new_dataset(dataset_type="stock", start_date="2020-01-01", end_date="2021-01-10", ticker="SPY", interval="1d")
         truth_df = StockDataSetService.retreive_external_df(ticker="SPY", start_date="2020-01-01", end_date="2021-01-10", interval="1d")
         truth_df = self.feature_factory.apply_feature_factories(truth_df)
         truth_df.replace({-999: np.nan}, inplace=True)
+        truth_df = truth_df.astype(np.float64)
         dataset = DataSet.objects.first()
-        df = StockDataSetService.datarows_to_dataframe(dataset)
+        df = StockDataSetService.load_dataframe(dataset)
 
         df = df[sorted(df.columns)]
         truth_df = truth_df[sorted(truth_df.columns)]
@@ -569,15 +564,296 @@ class TestStockDataSetService(TestCase):
         self.assertTrue(np.array_equal(df.values, truth_df.values, equal_nan=True))
 
 
+def create_datarows(df, dataset):
+    # Rows in the legacy DataRow format, missing values stored as -999
+    DataRow.objects.bulk_create([DataRow(dataset=dataset, timestamp=timestamp, features=features)
+                                 for timestamp, features in df.fillna(-999).to_dict('index').items()])
 
 
+class TestColumnarDataStore(TestCase):
+    def setUp(self):
+        self.store_dir = tempfile.mkdtemp()
+        self.store = ColumnarDataStore(self.store_dir)
+        index = pd.date_range("2020-01-01", periods=300, freq="D", tz="UTC")
+        self.df = pd.DataFrame({
+            "close": np.arange(300, dtype=np.float64),
+            "volume": np.arange(300, dtype=np.int64) * 10,
+        }, index=index)
+        self.df.iloc[5, 0] = np.nan
+        self.dataset = DataSet.objects.create(dataset_type="stock", start_timestamp=index[0], end_timestamp=index[-1],
+                                              features=self.df.columns.tolist(), metadata={"ticker": "SPY", "interval": "1d"})
+
+    def tearDown(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def test_round_trip(self):
+        self.store.write(self.dataset, self.df)
+        df = self.store.load(DataSet.objects.get(pk=self.dataset.pk))
+
+        self.assertEqual(df.index.tolist(), self.df.index.tolist())
+        self.assertEqual(df.index.name, "Date")
+        self.assertTrue(np.array_equal(df.values, self.df.values.astype(np.float64), equal_nan=True))
+
+    def test_missing_value_sentinel(self):
+        self.df.iloc[-3:, 0] = -999
+        self.store.write(self.dataset, self.df)
+        df = self.store.load(self.dataset)
+
+        self.assertTrue(df["close"].iloc[-3:].isna().all())
+        self.assertFalse((df.values == -999).any())
+
+    def test_load_range_and_columns(self):
+        self.store.write(self.dataset, self.df)
+        df = self.store.load(self.dataset, "2020-01-10", "2020-01-19", columns=["volume"])
+
+        self.assertEqual(len(df), 10)
+        self.assertEqual(df.columns.tolist(), ["volume"])
+        self.assertEqual(df.iloc[0]["volume"], 90)
+
+    def test_new_version_replaces_old(self):
+        self.store.write(self.dataset, self.df)
+        first_path = self.store.root / self.dataset.storage["path"]
+        self.store.write(self.dataset, self.df.iloc[:10])
+
+        self.assertEqual(self.dataset.storage["version"], 2)
+        self.assertTrue(first_path.exists())
+        self.assertEqual(len(self.store.load(self.dataset)), 10)
+
+    def test_existing_version_directory_kept(self):
+        leftover = self.store.version_dir(self.dataset, 1)
+        leftover.mkdir(parents=True)
+        (leftover / "data").touch()
+        self.store.write(self.dataset, self.df)
+
+        self.assertEqual(self.dataset.storage["version"], 2)
+        self.assertTrue((leftover / "data").exists())
+        self.assertEqual(len(self.store.load(self.dataset)), len(self.df))
+
+    def test_old_version_removed_after_commit(self):
+        self.store.write(self.dataset, self.df)
+        first_path = self.store.root / self.dataset.storage["path"]
+        stale = DataSet.objects.get(pk=self.dataset.pk)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.write(self.dataset, self.df.iloc[:10])
+        # Superseded, kept for the grace period
+        self.assertTrue((first_path / ColumnarDataStore.SUPERSEDED_FILE).exists())
+
+        with override_settings(DATASET_STORE_GRACE_SECONDS=0), self.captureOnCommitCallbacks(execute=True):
+            self.store.write(self.dataset, self.df.iloc[:20])
+        self.assertFalse(first_path.exists())
+        # A manifest loaded before the writes is reloaded
+        self.assertEqual(len(self.store.load(stale)), 20)
+
+    def test_append_writes_only_the_tail(self):
+        self.store.write(self.dataset, self.df.iloc[:200])
+        first_path = self.store.root / self.dataset.storage["path"]
+        tail = self.df.iloc[190:].copy()
+        tail["close"] += 1000
+        self.store.append(self.dataset, tail)
+
+        segments = self.dataset.storage["segments"]
+        self.assertEqual([segment["rows"] for segment in segments], [190, 110])
+        self.assertEqual(self.dataset.storage["rows"], 300)
+        # The first segment is shared with the previous version, its files are untouched
+        self.assertEqual(len(np.load(first_path / ColumnarDataStore.TIMESTAMPS_FILE)), 200)
+
+        expected = pd.concat([self.df.iloc[:190], tail]).astype(np.float64)
+        df = self.store.load(DataSet.objects.get(pk=self.dataset.pk))
+        self.assertEqual(df.index.tolist(), expected.index.tolist())
+        self.assertTrue(np.array_equal(df.values, expected.values, equal_nan=True))
+        self.assertEqual(self.store.load(self.dataset, "2020-07-05", "2020-07-12")["close"].tolist(),
+                         expected.loc["2020-07-05":"2020-07-12", "close"].tolist())
+        self.assertEqual(self.store.timestamps(self.dataset).tolist(), expected.index.tolist())
+
+    def test_append_keeps_used_segments(self):
+        self.store.write(self.dataset, self.df.iloc[:100])
+        first_path = self.store.root / self.dataset.storage["path"]
+        with override_settings(DATASET_STORE_GRACE_SECONDS=0), self.captureOnCommitCallbacks(execute=True):
+            self.store.append(self.dataset, self.df.iloc[100:200])
+        with override_settings(DATASET_STORE_GRACE_SECONDS=0), self.captureOnCommitCallbacks(execute=True):
+            self.store.append(self.dataset, self.df.iloc[150:])
+
+        self.assertTrue(first_path.exists())
+        self.assertEqual(len(self.dataset.storage["segments"]), 3)
+        self.assertEqual(len(self.store.load(self.dataset)), 300)
+
+    def test_append_rewrites_on_new_columns(self):
+        self.store.write(self.dataset, self.df.iloc[:200])
+        tail = self.df.iloc[190:].copy()
+        tail["new_column"] = 1.0
+        self.store.append(self.dataset, tail)
+
+        self.assertEqual(len(self.dataset.storage["segments"]), 1)
+        df = self.store.load(self.dataset)
+        self.assertEqual(len(df), 300)
+        self.assertTrue(df["new_column"].iloc[:190].isna().all())
+        self.assertTrue((df["new_column"].iloc[190:] == 1).all())
+
+    def test_migrate_datarows(self):
+        with override_settings(DATASET_STORE_DIR=self.store_dir):
+            create_datarows(self.df, self.dataset)
+            df = DataSetService.load_dataframe(self.dataset)
+
+        self.assertEqual(DataRow.objects.filter(dataset=self.dataset).count(), 0)
+        self.assertEqual(len(df), len(self.df))
+        self.assertTrue(np.isnan(df.iloc[5]["close"]))
+
+
+class TestFeatureFactoryLookback(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        index = pd.date_range("2000-01-01", periods=3000, freq="D", tz="UTC")
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(index))))
+        self.df = pd.DataFrame({
+            "open": close * (1 + rng.normal(0, 0.002, size=len(index))),
+            "high": close * 1.01,
+            "low": close * 0.99,
+            "close": close,
+            "volume": rng.integers(1000, 2000, size=len(index)).astype(np.float64),
+        }, index=index)
+
+    def assert_tail_matches(self, factory, rows=5):
+        full = factory.add_features(self.df.copy())
+        tail = factory.add_features(self.df.iloc[-(factory.get_lookback() + rows):].copy())
+        full = full.iloc[-rows:]
+        tail = tail.iloc[-rows:][full.columns]
+        self.assertTrue(np.allclose(tail.values, full.values, rtol=1e-3, atol=1e-2, equal_nan=True))
+
+    def test_moving_average_tail(self):
+        factory = MovingAverageFeatureFactory(FeatureFactoryConfig(parameters={"windows": [5, 20, 50]}))
+        self.assertGreaterEqual(factory.get_lookback(), 99)
+        self.assertEqual(factory.get_lookahead(), 0)
+        self.assert_tail_matches(factory)
+
+    def test_momentum_tail(self):
+        self.assert_tail_matches(MomentumFeatureFactory(FeatureFactoryConfig(parameters={"rsi_periods": [5, 20]})))
+
+    def test_band_tail(self):
+        self.assert_tail_matches(BandFeatureFactory(FeatureFactoryConfig(parameters={"windows": [10, 20]})))
+
+    def test_target_lookahead(self):
+        factory = TargetFeatureFactory(FeatureFactoryConfig(parameters={"output_steps": 3}))
+        self.assertEqual(factory.get_lookahead(), 3)
+
+
+class TestFeatureEngine(TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        index = pd.date_range("2010-01-01", periods=600, freq="D", tz="UTC")
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=len(index))))
+        self.df = pd.DataFrame({
+            "open": close * (1 + rng.normal(0, 0.002, size=len(index))),
+            "high": close * (1 + rng.uniform(0, 0.02, size=len(index))),
+            "low": close * (1 - rng.uniform(0, 0.02, size=len(index))),
+            "close": close,
+            "volume": rng.integers(1000, 2000, size=len(index)).astype(np.float64),
+        }, index=index)
+        self.factories = [
+            MovingAverageFeatureFactory(FeatureFactoryConfig(name="ma", parameters={"windows": [5, 20, 50]})),
+            OHLCVFeatureFactory(FeatureFactoryConfig(name="ohlcv", parameters={})),
+            BandFeatureFactory(FeatureFactoryConfig(name="band", parameters={"windows": [10, 20]})),
+            MomentumFeatureFactory(FeatureFactoryConfig(name="momentum", parameters={"rsi_periods": [5, 14, 100]})),
+            TargetFeatureFactory(FeatureFactoryConfig(name="target", parameters={"output_steps": 5})),
+        ]
 
+    def test_matches_add_features(self):
+        expected = self.df.copy()
+        for factory in self.factories:
+            expected = factory.add_features(expected)
+
+        result = FeatureEngine(self.factories).apply(self.df.copy())
+
+        self.assertEqual(sorted(result.columns), sorted(expected.columns))
+        added = [column for column in expected.columns if column not in self.df.columns]
+        self.assertEqual(sorted(FeatureEngine(self.factories).get_output_columns()), sorted(added))
+        np.testing.assert_allclose(result[expected.columns].values, expected.values,
+                                   rtol=ENGINE_RTOL, atol=ENGINE_ATOL)
+
+    def test_orders_by_dependencies(self):
+        target, ohlcv = self.factories[4], self.factories[1]
+        engine = FeatureEngine([target, ohlcv])
+        self.assertEqual(engine.order, [ohlcv, target])
+        self.assertEqual(engine.get_input_columns(), ["open", "high", "low", "close", "volume"])
+
+    def test_missing_input(self):
+        engine = FeatureEngine([self.factories[4]])
+        with self.assertRaises(ValueError):
+            engine.apply(self.df.copy())
+
+
+def write_ohlcv_csv(directory, ticker, rows=400, seed=0):
+    rng = np.random.default_rng(seed)
+    index = pd.date_range("2015-01-01", periods=rows, freq="D", tz="UTC", name="Date")
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, size=rows)))
+    pd.DataFrame({
+        "Open": close * (1 + rng.normal(0, 0.002, size=rows)),
+        "High": close * 1.01,
+        "Low": close * 0.99,
+        "Close": close,
+        "Volume": rng.integers(1000, 2000, size=rows),
+    }, index=index).to_csv(f"{directory}/{ticker}.csv")
+
+
+class TestFileDataSource(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        write_ohlcv_csv(self.directory, "SPY")
+        self.source = FileDataSource(self.directory)
 
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
 
+    def test_fetch(self):
+        df = self.source.fetch("2015-02-01", "2015-03-01", ticker="SPY", interval="1d")
+        self.assertEqual(list(df.columns), ["open", "high", "low", "close", "volume"])
+        self.assertEqual(str(df.index.tz), "UTC")
+        self.assertEqual(df.index[0], pd.Timestamp("2015-02-01", tz="UTC"))
+        self.assertEqual(len(df), 28)
 
+    def test_missing_ticker(self):
+        with self.assertRaises(ValueError):
+            self.source.fetch("2015-01-01", ticker="NOPE")
 
+    def test_compute_features(self):
+        factories = [OHLCVFeatureFactory(FeatureFactoryConfig(name="ohlcv", parameters={}))]
+        df = compute_features(self.source, factories, "2015-01-01", None, {"ticker": "SPY"}, min_rows=250)
+        self.assertIn("pctChgclose", df.columns)
+        with self.assertRaises(ValueError):
+            compute_features(self.source, factories, "2015-12-01", None, {"ticker": "SPY"}, min_rows=250)
 
 
-        
-
-    
+class TestBatchIngestionService(TransactionTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store_dir = tempfile.mkdtemp()
+        for seed, ticker in enumerate(["AAPL", "SPY", "QQQ"]):
+            write_ohlcv_csv(self.directory, ticker, seed=seed)
+        source = {'class_path': 'dataset_manager.sources.FileDataSource', 'parameters': {'directory': self.directory}}
+        self.settings_override = override_settings(DATASET_DATA_SOURCE=source, DATASET_STORE_DIR=self.store_dir)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.directory, ignore_errors=True)
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def test_add_and_update_tickers(self):
+        written = []
+        service = BatchIngestionService(processes=2, writers=1, on_written=lambda ticker, dataset: written.append(ticker))
+        report = service.add_tickers(["SPY", "QQQ", "NOPE"], start_date="2015-01-01")
+
+        self.assertEqual(sorted(report.succeeded), ["QQQ", "SPY"])
+        self.assertEqual(report.failed["NOPE"]["stage"], "compute")
+        self.assertEqual(sorted(written), ["QQQ", "SPY"])
+        dataset = DataSetService.get_data_set(dataset_type="stock", ticker="SPY", interval="1d")
+        self.assertEqual(len(DataSetService.load_dataframe(dataset)), 400)
+
+        report = service.add_tickers(["SPY"], start_date="2015-01-01")
+        self.assertIn("SPY", report.skipped)
+
+        report = service.update_tickers(["SPY", "AAPL"])
+        self.assertEqual(list(report.succeeded), ["SPY"])
+        self.assertIn("AAPL", report.skipped)
+        self.assertEqual(report.failed, {})
+        self.assertTrue(report.summary().startswith("Ingested 1 tickers, 0 failed, 1 skipped"))
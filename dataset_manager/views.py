@@ -50,7 +50,7 @@ def create_stock_data(request):
             return JsonResponse({'message': 'Data already exists for this ticker'}, status=400)
 
         df = StockDataSetService.create_new_dataset(dataset_type='stock', ticker=ticker, interval=interval, start_date=start_date, end_date=end_date)
-        df.replace({-999: None}, inplace=True)
+        df = df.astype(object).where(df.notna(), None)
 
         df.index = df.index.astype(str)
 
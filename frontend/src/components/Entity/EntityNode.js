@@ -7,6 +7,7 @@ import StrategyRequest from '../../utils/StrategyRequest';
 import NodeStrategyPanel from './Strategy/NodeStrategyPanel';
 import { EntityMenuTrigger } from './EntityMenu';
 import BaseEntity from './BaseEntity';
+import { strategyApi } from '../../services/strategyApi';
 
 const MIN_WIDTH = 250;
 const MIN_HEIGHT = 100;
@@ -65,6 +66,19 @@ function EntityNode({ data }) {
     }
   }, [data.strategy_requests]);
 
+  // Entities of a loaded session come without their history, fetch it once for the node
+  useEffect(() => {
+    if (Array.isArray(data.strategy_requests)) return;
+    let cancelled = false;
+    strategyApi.getHistory(data.id)
+      .then((history) => {
+        if (!cancelled) setLocalRequests(history.strategy_requests || []);
+      })
+      .catch((error) => console.error('Failed to load strategy history:', error));
+    return () => { cancelled = true; };
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, [data.id]);
+
   // Called to show the strategy list
   const handleNewStrategy = () => setShowStrategyList(true);
 
@@ -1,6 +1,7 @@
 import { useEffect, useRef, useState, useCallback } from 'react';
 import { BACKEND_WS_URL } from '../config';
 import StrategyRequest from '../utils/StrategyRequest';
+import { EntityPatchTracker } from 'entity-patches';
 
 export default function useEntityWebSocket({ 
   sessionStarted, 
@@ -14,6 +15,8 @@ export default function useEntityWebSocket({
   const reconnectTimeoutRef = useRef(null);
   const [isConnected, setIsConnected] = useState(false);
   const reconnectAttemptsRef = useRef(0);
+  // Server state and version of every entity, used to apply patch updates.
+  const patchTrackerRef = useRef(new EntityPatchTracker());
   const MAX_RECONNECT_ATTEMPTS = 5;
 
   // 1. Maintain a ref that always holds the latest entity list.
@@ -132,6 +135,7 @@ export default function useEntityWebSocket({
     console.log('[WS] Creating new global WebSocket connection...');
     const socket = new WebSocket(`ws://${BACKEND_WS_URL}/ws/entities/`);
     globalSocketRef.current = socket;
+    patchTrackerRef.current.reset();
 
     socket.onopen = () => {
       console.log('[WS] Global WebSocket connected!', {
@@ -155,13 +159,20 @@ export default function useEntityWebSocket({
         if (msg.type === 'connected' && msg.request_subscriptions) {
           setupEntitySubscriptions(initialEntities);
           processMessageQueue();
-        } else if (msg.type === 'entity_update' && msg.entities) {
-          Object.keys(msg.entities).forEach(entityId => {
+        } else if (msg.type === 'entity_update' && (msg.entities || msg.patches)) {
+          const { entities, resyncIds } = patchTrackerRef.current.handleUpdate(msg);
+          Object.keys(entities).forEach(entityId => {
             if (!entitySocketsRef.current[entityId]) {
               connectEntitySocket(entityId);
             }
           });
-          onEntityUpdate(msg.entities);
+          if (Object.keys(entities).length > 0) {
+            onEntityUpdate(entities);
+          }
+          if (resyncIds.length > 0) {
+            // An update was missed, ask for the full state of these entities
+            socket.send(JSON.stringify({ command: 'resync', entity_ids: resyncIds }));
+          }
         } else if (msg.type === 'strategy_executed') {
           console.log('Strategy execution confirmed:', msg);
         } else if (msg.type === 'session_deleted') {
@@ -1,8 +1,11 @@
 const API_BASE_URL = 'http://localhost:8000';
 
 class StrategyApi {
-  async getHistory() {
-    const response = await fetch(`${API_BASE_URL}/training_session/api/get_strategy_history/`);
+  // Strategy requests of an entity, the current session when no entity is given. Entities of a loaded
+  // session don't include them until they are requested here.
+  async getHistory(entityId) {
+    const query = entityId ? `?entity_id=${encodeURIComponent(entityId)}` : '';
+    const response = await fetch(`${API_BASE_URL}/training_session/api/get_strategy_history/${query}`);
     if (!response.ok) {
       const error = await response.json();
       throw new Error(error.error || 'Failed to fetch strategy history');
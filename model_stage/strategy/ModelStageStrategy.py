@@ -6,6 +6,7 @@ from torch.utils.data import DataLoader, TensorDataset
 from model_stage.criterion_loss import MSLELoss, GuissLoss, MinOfNSequenceLoss, SoftInverseProfitLoss, SequenceNLLLoss
 from model_stage.strategy.RL.RLUtils import TradingEnv, ReplayBuffer, epsilon_by_frame
 from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 from shared_utils.entities.Entity import Entity
 from shared_utils.strategy_executor.StrategyExecutor import StrategyExecutor
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
@@ -79,6 +80,7 @@ class FitModelStrategy(Strategy):
     Strategy that trains (fits) a model for a given number of epochs,
     using provided training and validation dataloaders and an optional gradient clip value.
     """
+    queue = StrategyQueue.TRAINING
     strategy_description = 'Trains the model over a specified number of epochs using given dataloaders.'
 
     def verify_executable(self, entity: Entity, strategy_request: StrategyRequestEntity):
@@ -131,6 +133,7 @@ class FitModelStrategy(Strategy):
             entity.get_attribute('val_loss').append(val_loss)
             print(f"Epoch {epoch + 1} | Train Loss: {train_loss:.3f} | Val Loss: {val_loss:.3f}")
 
+        entity.mark_attributes_dirty(['model', 'optimizer', 'train_loss', 'val_loss'])
         entity.set_attribute('gradients', self.get_gradients_with_names(model))
 
         self.strategy_request.ret_val['status'] = 'model_fit_completed'
@@ -520,6 +523,7 @@ class LoadModelWeightsStrategy(ModelStageStrategy):
         model = entity.get_attribute('model')
         load_path = entity.get_attribute('model_path')
         model.load_state_dict(torch.load(load_path))
+        entity.mark_attributes_dirty(['model'])
         return self.strategy_request
 
     @staticmethod
@@ -529,6 +533,7 @@ class LoadModelWeightsStrategy(ModelStageStrategy):
 
 
 class ConfigureDQNModel(ModelStageStrategy):
+    queue = StrategyQueue.INTERACTIVE
     def verify_executable(self, entity: Entity, strategy_request: StrategyRequestEntity):
         if not entity.has_attribute('close'):
             raise ValueError('Close price not found in strategy request.')
@@ -600,6 +605,7 @@ class ConfigureDQNModel(ModelStageStrategy):
         }
 
 class TrainDQNModel(ModelStageStrategy):
+    queue = StrategyQueue.TRAINING
     def verify_executable(self, entity: Entity, strategy_request: StrategyRequestEntity):
         if not entity.has_attribute('trading_env'):
             raise ValueError('Trading environment not found in entity.')
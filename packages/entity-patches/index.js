@@ -0,0 +1,93 @@
+// entity-patches
+// Applies the versioned JSON-patch entity updates sent by the server.
+// The server sends full entities the first time it broadcasts them and afterwards only the changed
+// fields as JSON-patch operations with the version they apply to. When a patch does not apply to the
+// version we hold, an update was missed and the entity has to be resynced.
+
+const unescapeToken = (token) => token.replace(/~1/g, '/').replace(/~0/g, '~');
+
+// Apply JSON-patch operations (add / replace / remove) to a document, copying only the changed paths.
+export const applyPatch = (document, ops) => {
+  let result = document;
+  ops.forEach(({ op, path, value }) => {
+    if (path === '') {
+      result = op === 'remove' ? undefined : value;
+      return;
+    }
+    const tokens = path.split('/').slice(1).map(unescapeToken);
+    const root = Array.isArray(result) ? [...result] : { ...result };
+    let target = root;
+    tokens.slice(0, -1).forEach((token) => {
+      const child = target[token];
+      if (child === null || typeof child !== 'object') {
+        throw new Error(`Cannot apply patch, missing path ${path}`);
+      }
+      target[token] = Array.isArray(child) ? [...child] : { ...child };
+      target = target[token];
+    });
+    const last = tokens[tokens.length - 1];
+    if (op === 'remove') {
+      delete target[last];
+    } else if (op === 'add' || op === 'replace') {
+      target[last] = value;
+    } else {
+      throw new Error(`Unsupported patch operation ${op}`);
+    }
+    result = root;
+  });
+  return result;
+};
+
+export class EntityPatchTracker {
+  constructor() {
+    this.versions = {};
+    this.entities = {};
+  }
+
+  // Turn an entity_update message into full entities to merge and the ids that need a resync.
+  handleUpdate(msg) {
+    const entities = {};
+    const resyncIds = [];
+    const versions = msg.versions || {};
+
+    Object.entries(msg.entities || {}).forEach(([entityId, data]) => {
+      if (data && data.deleted) {
+        delete this.versions[entityId];
+        delete this.entities[entityId];
+      } else {
+        this.entities[entityId] = data;
+        if (versions[entityId] !== undefined) {
+          this.versions[entityId] = versions[entityId];
+        }
+      }
+      entities[entityId] = data;
+    });
+
+    Object.entries(msg.patches || {}).forEach(([entityId, patch]) => {
+      const current = this.versions[entityId];
+      if (current !== undefined && current >= patch.version) {
+        return;
+      }
+      if (current !== patch.base_version || !this.entities[entityId]) {
+        resyncIds.push(entityId);
+        return;
+      }
+      try {
+        const updated = applyPatch(this.entities[entityId], patch.ops);
+        this.entities[entityId] = updated;
+        this.versions[entityId] = patch.version;
+        entities[entityId] = updated;
+      } catch (error) {
+        console.error(`Error applying patch to entity ${entityId}:`, error);
+        resyncIds.push(entityId);
+      }
+    });
+
+    return { entities, resyncIds };
+  }
+
+  reset() {
+    this.versions = {};
+    this.entities = {};
+  }
+}
@@ -6,6 +6,7 @@ import { notificationAtom } from '../state/notificationAtom';
 import { useSession } from '../hooks/useSession';
 import { useEntities } from '../hooks/useEntities';
 import { BACKEND_WS_URL } from '../utils/config';
+import { EntityPatchTracker } from 'entity-patches';
 
 export const WebSocketProvider = ({ children }) => {
   // Get the current session active status
@@ -20,6 +21,8 @@ export const WebSocketProvider = ({ children }) => {
   const reconnectAttemptsRef = useRef(0);
   // To store a pending reconnect timer so we can cancel it if needed.
   const reconnectTimeoutRef = useRef(null);
+  // Server state and version of every entity, used to apply patch updates.
+  const patchTrackerRef = useRef(new EntityPatchTracker());
 
   // Function to establish a new connection.
   const connect = useCallback(() => {
@@ -28,6 +31,8 @@ export const WebSocketProvider = ({ children }) => {
     const wsUrl = `${protocol}//${BACKEND_WS_URL}/ws/entities/`;
     const ws = new WebSocket(wsUrl);
     wsRef.current = ws;
+    // A new connection may have missed updates, patches for unknown versions trigger a resync.
+    patchTrackerRef.current.reset();
 
     ws.onopen = () => {
       console.log('WebSocket connection opened');
@@ -42,7 +47,13 @@ export const WebSocketProvider = ({ children }) => {
         const msg = JSON.parse(event.data);
         console.log('WebSocket message received:', msg.type);
         if (msg.type === 'entity_update') {
-          mergeEntities(msg.entities);
+          const { entities, resyncIds } = patchTrackerRef.current.handleUpdate(msg);
+          if (Object.keys(entities).length > 0) {
+            mergeEntities(entities);
+          }
+          if (resyncIds.length > 0 && ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ command: 'resync', entity_ids: resyncIds }));
+          }
         } else if (msg.type === 'error') {
           const errorMessage =
             typeof msg.error === 'object'
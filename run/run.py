@@ -32,24 +32,33 @@ def start_daphne():
     logger.info("Starting Daphne on port 8000")
     cli.run(['-b', '0.0.0.0', '-p', '8000', 'TradeLens.asgi:application'])
 
-def start_celery_worker():
+def start_celery_worker(queue, queue_config):
     # Check if DEBUG_MODE is set to '1' to determine concurrency.
-    concurrency = 1 if os.environ.get('DEBUG_MODE') == '1' else 4  # Default to 4 workers in non-debug mode.
-    logger.info("Starting Celery worker with concurrency=%d", concurrency)
+    concurrency = 1 if os.environ.get('DEBUG_MODE') == '1' else queue_config.get('concurrency', 4)
+    pool = queue_config.get('pool', 'threads')
+    logger.info("Starting Celery worker for queue %s with concurrency=%d", queue, concurrency)
     cmd = [
         "python", "-m", "run.celery_worker", "worker",
-        "--loglevel=debug", "--pool=threads", f"--concurrency={concurrency}"
+        "--loglevel=debug", f"--pool={pool}", f"--concurrency={concurrency}",
+        "-Q", queue, "-n", f"{queue}@%h"
     ]
     logger.info("Running command: %s", " ".join(cmd))
     subprocess.call(cmd, cwd=parent_dir)
 
 if __name__ == '__main__':
-    logger.info("Starting both Daphne and Celery worker")
+    from django.conf import settings
+
+    # One worker per strategy queue, so training can't take the slots interactive requests need
+    queues = getattr(settings, 'STRATEGY_QUEUES', {'cpu': {}})
+    logger.info("Starting Daphne and Celery workers for queues: %s", ", ".join(queues))
     daphne_thread = threading.Thread(target=start_daphne)
-    celery_thread = threading.Thread(target=start_celery_worker)
+    celery_threads = [threading.Thread(target=start_celery_worker, args=(queue, queue_config))
+                      for queue, queue_config in queues.items()]
 
     daphne_thread.start()
-    celery_thread.start()
+    for celery_thread in celery_threads:
+        celery_thread.start()
 
     daphne_thread.join()
-    celery_thread.join()
\ No newline at end of file
+    for celery_thread in celery_threads:
+        celery_thread.join()
\ No newline at end of file
@@ -5,6 +5,7 @@ from typing import Optional
 
 class SequenceSetEntity(Entity):
     entity_name = EntityEnum.SEQUENCE_SET
+    split_attributes = ['sequences']
 
     def __init__(self, entity_id: Optional[str] = None):
         super().__init__(entity_id)
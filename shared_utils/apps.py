@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class SharedUtilsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shared_utils'
+
+    def ready(self):
+        # Import every strategy once per process, so executor services and strategies share one registry
+        from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import get_strategy_registry
+        get_strategy_registry()
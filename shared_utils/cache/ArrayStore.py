@@ -0,0 +1,90 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from shared_utils.cache.AttributeReference import AttributeReference
+
+
+class ArrayHandle(AttributeReference):
+    """
+    Reference to an array kept in the on-disk ArrayStore. Resolving it memory-maps the file read-only,
+    so every thread and worker process on the host shares the same pages.
+    """
+
+    def resolve(self):
+        return ArrayStore().load(self.key)
+
+    def __repr__(self):
+        return f"ArrayHandle(key={self.key}, shape={self.shape}, dtype={self.dtype})"
+
+
+class ArrayStore:
+    """
+    Content-addressed store of numpy arrays saved as .npy files under ENTITY_ARRAY_STORE_DIR. Arrays are
+    written once and shared by every entity that holds the same data. The store lives on the local
+    filesystem, so it assumes the web server and Celery workers run on the same host.
+    """
+
+    def __init__(self, root=None):
+        self.root = Path(root or getattr(settings, 'ENTITY_ARRAY_STORE_DIR', Path(settings.BASE_DIR) / 'array_store'))
+
+    @staticmethod
+    def can_store(value) -> bool:
+        """Check if a value can be stored as a .npy file and memory-mapped back"""
+        return isinstance(value, np.ndarray) and not value.dtype.hasobject
+
+    @staticmethod
+    def key_for(array: np.ndarray) -> str:
+        """Compute the content key of an array from its dtype, shape and data"""
+        array = np.ascontiguousarray(array)
+        digest = hashlib.sha1(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(memoryview(array).cast('B'))
+        return digest.hexdigest()
+
+    def path(self, key: str) -> Path:
+        return self.root / key[:2] / f"{key}.npy"
+
+    def exists(self, key: str) -> bool:
+        return self.path(key).exists()
+
+    def save(self, array: np.ndarray) -> ArrayHandle:
+        """Write an array to the store if it is not already there and return a handle to it"""
+        key = self.key_for(array)
+        path = self.path(key)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write to a temporary file and rename so readers never see a partially written array
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    np.save(f, array, allow_pickle=False)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+        return ArrayHandle(key, shape=array.shape, dtype=str(array.dtype), nbytes=array.nbytes)
+
+    def load(self, key: str) -> np.ndarray:
+        """Memory-map an array from the store read-only"""
+        path = self.path(key)
+        if not path.exists():
+            raise ValueError(f"Array {key} not found in array store")
+        return np.load(path, mmap_mode='r')
+
+    def delete(self, key: str):
+        """Delete an array from the store"""
+        path = self.path(key)
+        if path.exists():
+            path.unlink()
+
+    def clear(self):
+        """Delete every array in the store. Arrays already memory-mapped stay readable until closed"""
+        if self.root.exists():
+            shutil.rmtree(self.root)
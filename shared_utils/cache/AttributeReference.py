@@ -0,0 +1,25 @@
+class AttributeReference:
+    """
+    Placeholder stored in an entity's attributes in place of a large value that lives under its own
+    cache key. The value is fetched the first time the attribute is read through Entity.get_attribute.
+    """
+
+    def __init__(self, key, shape=None, dtype=None, nbytes=None):
+        self.key = key
+        self.shape = shape
+        self.dtype = dtype
+        self.nbytes = nbytes
+
+    def resolve(self):
+        """Load the referenced value from the cache"""
+        from shared_utils.cache.CacheService import CacheService
+        return CacheService().load_attribute(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, AttributeReference) and other.key == self.key
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __repr__(self):
+        return f"AttributeReference(key={self.key}, shape={self.shape}, dtype={self.dtype})"
@@ -0,0 +1,89 @@
+import pickle
+import struct
+
+MAGIC = b'TLEC1'
+CONTENT_TYPE = 'application/x-entity-codec'
+# Buffers are padded to this alignment inside the frame so decoded arrays are aligned for vectorized reads
+ALIGNMENT = 64
+
+_COUNT = struct.Struct('<I')
+_LENGTH = struct.Struct('<Q')
+
+
+class EntityCodec:
+    """
+    Serializer for entities and other objects holding large numpy arrays.
+
+    Objects are pickled with protocol 5 and every contiguous array buffer is taken out-of-band, so
+    the pickle stream only holds dtype/shape headers. The frame written is:
+
+        MAGIC | buffer count | buffer lengths | pickle length | pickle stream | aligned raw buffers
+
+    Decoding hands memoryview slices of the frame back to pickle, so numpy rebuilds the arrays with
+    np.frombuffer on top of the frame without copying. Arrays decoded from an immutable payload
+    (bytes) are read-only; code that needs to modify them in place must copy first.
+    """
+
+    @staticmethod
+    def encode(obj) -> bytes:
+        buffers = []
+        stream = pickle.dumps(obj, protocol=5, buffer_callback=buffers.append)
+        raw_buffers = [buffer.raw() for buffer in buffers]
+
+        header = [MAGIC, _COUNT.pack(len(raw_buffers))]
+        header.extend(_LENGTH.pack(raw.nbytes) for raw in raw_buffers)
+        header.append(_LENGTH.pack(len(stream)))
+        header.append(stream)
+
+        parts = header
+        offset = sum(len(part) for part in header)
+        for raw in raw_buffers:
+            padding = -offset % ALIGNMENT
+            if padding:
+                parts.append(b'\0' * padding)
+                offset += padding
+            parts.append(raw)
+            offset += raw.nbytes
+
+        return b''.join(parts)
+
+    @staticmethod
+    def decode(payload):
+        if not EntityCodec.is_encoded(payload):
+            # Values written before the codec was introduced are plain pickles
+            return pickle.loads(payload)
+
+        view = memoryview(payload)
+        offset = len(MAGIC)
+        (count,) = _COUNT.unpack_from(view, offset)
+        offset += _COUNT.size
+
+        lengths = []
+        for _ in range(count):
+            (length,) = _LENGTH.unpack_from(view, offset)
+            lengths.append(length)
+            offset += _LENGTH.size
+
+        (stream_length,) = _LENGTH.unpack_from(view, offset)
+        offset += _LENGTH.size
+        stream = view[offset:offset + stream_length]
+        offset += stream_length
+
+        buffers = []
+        for length in lengths:
+            offset += -offset % ALIGNMENT
+            buffers.append(view[offset:offset + length])
+            offset += length
+
+        return pickle.loads(stream, buffers=buffers)
+
+    @staticmethod
+    def is_encoded(payload) -> bool:
+        return bytes(payload[:len(MAGIC)]) == MAGIC
+
+
+def register_kombu_serializer(name='entity_codec'):
+    """Register the codec with kombu so Celery tasks can use serializer='entity_codec'"""
+    from kombu.serialization import register
+    register(name, EntityCodec.encode, EntityCodec.decode,
+             content_type=CONTENT_TYPE, content_encoding='binary')
@@ -0,0 +1,6 @@
+class EntityVersionConflict(ValueError):
+    """Raised when entities are written back to the cache after another writer stored a newer version"""
+
+    def __init__(self, entity_ids):
+        self.entity_ids = list(entity_ids)
+        super().__init__(f"Entities changed in cache since they were loaded: {self.entity_ids}")
@@ -0,0 +1,114 @@
+import threading
+from collections import OrderedDict
+
+
+class LocalEntityCache:
+    """
+    Bounded in-process LRU cache used by CacheService in front of Redis.
+
+    Values are stored as pickled bytes so every read hands out an independent copy and callers can
+    mutate what they get back without affecting the cached entry. Each entry carries the version it
+    was stored with, which CacheService compares against the version stamp kept in Redis.
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, version=None):
+        """
+        Get the payload stored for a key. When a version is given the entry is only returned if it
+        was stored with that version, otherwise it is dropped and counted as stale.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            entry_version, payload = entry
+            if version is not None and entry_version != version:
+                self._remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def set(self, key, payload, version=None):
+        """Store a payload, evicting the least recently used entries to stay within bounds"""
+        if len(payload) > self.max_bytes:
+            self.invalidate(key)
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (version, payload)
+            self._size += len(payload)
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """Drop a key from the cache"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_many(self, keys):
+        """Drop multiple keys from the cache"""
+        for key in keys:
+            self.invalidate(key)
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self):
+        """Get hit/miss/eviction counters and the current size of the cache"""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'entries': len(self._entries),
+                'bytes': self._size,
+            }
+
+    def reset_stats(self):
+        """Reset the hit/miss/eviction counters"""
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.stale = 0
+            self.evictions = 0
+            self.invalidations = 0
+
+    def _remove(self, key):
+        _, payload = self._entries.pop(key)
+        self._size -= len(payload)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -5,10 +5,18 @@ from shared_utils.entities.EnityEnum import EntityEnum
 from uuid import uuid4, UUID
 import numpy as np
 from django.db import models
+from shared_utils.cache.AttributeReference import AttributeReference
 from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.LazyStrategyRequests import LazyStrategyRequests
 class Entity():
     entity_name = EntityEnum.ENTITY
     db_attributes = []
+    # Attributes that are always stored under their own cache key regardless of their size
+    split_attributes = []
+    # The core fields live in slots so large graphs of entities don't carry an instance dict each.
+    # Subclasses that do not declare __slots__ still get a dict for their own fields.
+    __slots__ = ('entity_id', '_attributes', '_dirty_attributes', '_attribute_refs', 'children_ids',
+                 '_child_types', 'parent_ids', '_strategy_requests', 'deleted', '_cache_version', '_stored_links')
 
     def __init__(self, entity_id: Optional[str] = None):
         # Validate entity_id if provided
@@ -22,9 +30,32 @@ class Entity():
         # Generate new UUID if none provided
         self.entity_id = entity_id if entity_id is not None else str(uuid4())
         self._attributes: Dict[str, Any] = {}
+        self._dirty_attributes = set()
+        self._attribute_refs: Dict[str, AttributeReference] = {}
         self.children_ids = []
+        # entity_id -> entity type of children, so children can be filtered by type without loading them
+        self._child_types: Dict[str, str] = {}
         self.parent_ids = []
-        self.strategy_requests = []
+        self._strategy_requests = []
+        # Cache version the entity was loaded or last stored at, checked when it is written back
+        self._cache_version = None
+        # (children_ids, parent_ids) as of that version, to merge link changes into a newer copy
+        self._stored_links = None
+
+    @property
+    def strategy_requests(self):
+        '''Strategy requests applied to the entity. Requests of entities loaded from the database are queried on first access'''
+        if isinstance(self._strategy_requests, LazyStrategyRequests):
+            self._strategy_requests = self._strategy_requests.load()
+        return self._strategy_requests
+
+    @strategy_requests.setter
+    def strategy_requests(self, strategy_requests):
+        self._strategy_requests = strategy_requests
+
+    def strategy_requests_loaded(self) -> bool:
+        '''Check if the strategy requests are in memory, without loading them'''
+        return not isinstance(self._strategy_requests, LazyStrategyRequests)
 
     def on_create(self, param_config: Optional[Dict[str, Any]] = None):
         pass
@@ -33,6 +64,7 @@ class Entity():
         '''Add a child to the entity'''
         if child.entity_id not in self.children_ids:
             self.children_ids.append(child.entity_id)
+        self._child_types[child.entity_id] = child.entity_name.value
         if self.entity_id not in child.parent_ids:
             child.add_parent(self)
 
@@ -40,6 +72,7 @@ class Entity():
         '''Remove a child from the entity'''
         if child.entity_id in self.children_ids:
             self.children_ids.remove(child.entity_id)
+        self._child_types.pop(child.entity_id, None)
 
     def add_parent(self, parent):
         '''Add a parent to the entity'''
@@ -63,10 +96,21 @@ class Entity():
         '''Remove a child from the entity by its ID'''
         if child_id in self.children_ids:
             self.children_ids.remove(child_id)
+        self._child_types.pop(child_id, None)
+
+    def get_child_types(self) -> Dict[str, str]:
+        '''Get the known entity types of the children, keyed by child ID'''
+        return self._child_types
+
+    def set_child_type(self, child_id: str, entity_type: str):
+        '''Record the entity type of a child'''
+        if child_id in self.children_ids:
+            self._child_types[child_id] = entity_type
 
     def set_attribute(self, name: str, value: Any):
         '''Set an attribute on the entity'''
         self._attributes[name] = value
+        self._dirty_attributes.add(name)
 
     def set_attributes(self, attributes: Dict[str, Any]):
         '''Set multiple attributes on the entity'''
@@ -75,15 +119,32 @@ class Entity():
 
     def get_attributes(self) -> Dict[str, Any]:
         '''Get all attributes on the entity'''
+        for name in list(self._attributes.keys()):
+            self.get_attribute(name)
         return self._attributes
 
     def get_attribute(self, name: str) -> Any:
         '''Get an attribute from the entity'''
-        return self._attributes[name]
+        value = self._attributes[name]
+        if isinstance(value, AttributeReference):
+            # Large attributes are stored under their own cache key and loaded on first read
+            self._attribute_refs[name] = value
+            value = value.resolve()
+            self._attributes[name] = value
+        return value
+
+    def get_attribute_shape(self, name: str):
+        '''Get the shape of an array attribute without loading it from the cache'''
+        value = self._attributes[name]
+        if isinstance(value, AttributeReference) and value.shape is not None:
+            return value.shape
+        return self.get_attribute(name).shape
 
     def remove_attribute(self, name: str):
         '''Remove an attribute from the entity'''
         del self._attributes[name]
+        self._dirty_attributes.discard(name)
+        self._attribute_refs.pop(name, None)
 
     def remove_attributes(self, names: List[str]):
         '''Remove multiple attributes from the entity'''
@@ -98,6 +159,111 @@ class Entity():
         '''Get a list of all attributes on the entity'''
         return list(self._attributes.keys())
 
+    def get_raw_attributes(self) -> Dict[str, Any]:
+        '''Get all attributes without loading values that are stored under their own cache key'''
+        return self._attributes
+
+    def get_dirty_attributes(self) -> set:
+        '''Get the names of attributes set since the entity was last stored in or loaded from cache'''
+        return self._dirty_attributes
+
+    def mark_attributes_dirty(self, names: List[str]):
+        '''
+        Mark attributes changed in place (a list appended to, a model trained) as set, so they are written
+        to the cache and keep their value when the entity is rebased onto a newer copy
+        '''
+        self._dirty_attributes.update(name for name in names if name in self._attributes)
+
+    def get_attribute_references(self) -> Dict[str, AttributeReference]:
+        '''Get the cache references of large attributes as of the last time they were stored or loaded'''
+        return self._attribute_refs
+
+    def replace_raw_attributes(self, attributes: Dict[str, Any], references: Dict[str, AttributeReference]):
+        '''Replace the attribute storage without marking anything dirty (used when building cache copies)'''
+        self._attributes = attributes
+        self._attribute_refs = dict(references)
+        self._dirty_attributes = set()
+
+    def mark_attributes_stored(self, references: Dict[str, AttributeReference]):
+        '''Record that the current attributes have been written to the cache'''
+        self._attribute_refs = dict(references)
+        self._dirty_attributes = set()
+
+    def get_cache_version(self):
+        '''Get the cache version the entity was loaded or last stored at, None if it never was'''
+        return self._cache_version
+
+    def mark_stored_version(self, version):
+        '''Record the cache version of the entity, as it was just read from or written to the cache'''
+        self._cache_version = version
+        self._stored_links = (list(self.children_ids), list(self.parent_ids))
+
+    def rebase_onto(self, current: 'Entity'):
+        '''
+        Re-apply the changes made to this entity since it was loaded on top of a newer copy from the cache.
+
+        Attributes set since the load keep their new value, all other attributes are taken from the newer
+        copy. Attributes changed in place are only kept when marked with mark_attributes_dirty. Children and parents added or removed since the load are added to or removed from the links
+        of the newer copy. Strategy requests of both copies are kept, this entity's version winning on
+        duplicates. Afterwards the entity carries the version of the newer copy.
+        '''
+        dirty = self.get_dirty_attributes()
+        attributes = {name: value for name, value in current.get_raw_attributes().items() if name not in dirty}
+        attributes.update({name: value for name, value in self._attributes.items() if name in dirty})
+        references = {name: reference for name, reference in current.get_attribute_references().items()
+                      if name not in dirty}
+        self._attributes = attributes
+        self._attribute_refs = references
+
+        stored_children, stored_parents = self._stored_links or ([], [])
+        self.children_ids = self.merge_links(stored_children, self.children_ids, current.children_ids)
+        self.parent_ids = self.merge_links(stored_parents, self.parent_ids, current.parent_ids)
+        child_types = dict(current.get_child_types())
+        child_types.update(self._child_types)
+        self._child_types = {child_id: child_type for child_id, child_type in child_types.items()
+                             if child_id in self.children_ids}
+
+        if self.strategy_requests_loaded() and current.strategy_requests_loaded():
+            own_requests = self._strategy_requests
+            self._strategy_requests = list(current.strategy_requests)
+            for strategy_request in own_requests:
+                self.update_strategy_requests(strategy_request)
+        elif not self.strategy_requests_loaded():
+            self._strategy_requests = current._strategy_requests
+
+        self._cache_version = current.get_cache_version()
+        self._stored_links = (list(current.children_ids), list(current.parent_ids))
+
+    @staticmethod
+    def merge_links(stored, own, current):
+        '''Apply the ids added to and removed from stored to get own, to current'''
+        added = [link_id for link_id in own if link_id not in stored]
+        removed = {link_id for link_id in stored if link_id not in own}
+        merged = [link_id for link_id in current if link_id not in removed]
+        merged += [link_id for link_id in added if link_id not in merged]
+        return merged
+
+    def __setstate__(self, state):
+        # Pickles hold (instance dict, slot values); entities pickled before __slots__ was added hold a single dict
+        if isinstance(state, tuple):
+            instance_state, slot_state = state
+            state = dict(instance_state or {}, **(slot_state or {}))
+        if 'strategy_requests' in state:
+            state['_strategy_requests'] = state.pop('strategy_requests')
+        # Entities pickled before attribute and child type tracking was added do not carry the tracking fields
+        state.setdefault('_dirty_attributes', set(state.get('_attributes', {}).keys()))
+        state.setdefault('_attribute_refs', {})
+        state.setdefault('_child_types', {})
+        state.setdefault('_strategy_requests', [])
+        state.setdefault('_cache_version', None)
+        state.setdefault('_stored_links', None)
+        for name, value in state.items():
+            try:
+                setattr(self, name, value)
+            except AttributeError:
+                # Fields dropped from a slotted class
+                pass
+
     def get_configured_strategies(self) -> List[str]:
         '''Get a list of all configured strategies on the entity'''
         return self.configured_strategies
@@ -128,8 +294,11 @@ class Entity():
 
 
     def serialize(self):
-
-        return {
+        '''
+        State sent to the frontend. Strategy requests are only included when they are in memory, entities
+        loaded from the database don't query their history for it (see api_get_strategy_history)
+        '''
+        data = {
             'entity_name': self.entity_name.value,
             'meta_data': {},
             'class_path': self.__class__.__module__ + '.' + self.__class__.__name__,
@@ -137,20 +306,22 @@ class Entity():
             'entity_type': self.entity_name.value,
             'child_ids': self.get_children(),
             'parent_ids': self.get_parents(),
-            'strategy_requests': [request.serialize() for request in self.strategy_requests],
             'position': self.get_attribute('position') if self.has_attribute('position') else None,
             'width': self.get_attribute('width') if self.has_attribute('width') else None,
             'height': self.get_attribute('height') if self.has_attribute('height') else None,
         }
+        if self.strategy_requests_loaded():
+            data['strategy_requests'] = [request.serialize() for request in self.strategy_requests]
+        return data
 
     def to_db(self, model=None):
         """Convert entity to database model"""
         return EntityAdapter.entity_to_model(self, model)
 
     @classmethod
-    def from_db(cls, model):
+    def from_db(cls, model, strategy_requests=None):
         """Create entity from database model"""
-        return EntityAdapter.model_to_entity(model, cls)
+        return EntityAdapter.model_to_entity(model, cls, strategy_requests)
 
     @staticmethod
     def get_maximum_members():
@@ -168,8 +339,14 @@ class EntityAdapter:
     """
 
     @classmethod
-    def model_to_entity(cls, model: EntityModel, entity_class: Type['Entity'] = Entity) -> 'Entity':
-        """Convert a Django model instance to an Entity"""
+    def model_to_entity(cls, model: EntityModel, entity_class: Type['Entity'] = Entity,
+                        strategy_requests: Optional[List] = None) -> 'Entity':
+        """
+        Convert a Django model instance to an Entity
+
+        :param strategy_requests: strategy requests already loaded for this model (see
+            StrategyRequestAdapter.load_for_entity_models). They are queried when not given.
+        """
         entity = entity_class(entity_id=str(model.entity_id))
 
         # Set attributes from JSON field
@@ -183,7 +360,10 @@ class EntityAdapter:
         if hasattr(model, 'parent_ids'):
             entity.parent_ids = model.parent_ids
 
-        entity.strategy_requests = cls.load_strategy_requests(model)
+        if strategy_requests is None:
+            # Queried on first access, so loading an entity does not pull in its strategy history
+            strategy_requests = LazyStrategyRequests(model.pk)
+        entity.strategy_requests = strategy_requests
 
         return entity
 
@@ -200,6 +380,22 @@ class EntityAdapter:
             else:
                 model = model_class(entity.entity_id)
 
+        cls.populate_model(entity, model)
+
+        # Rows saved one by one are not covered by the bulk save state hash, so force the next bulk save to write them
+        if hasattr(model, 'state_hash'):
+            model.state_hash = ''
+
+        model.save()
+
+        cls.save_strategy_requests(entity, model)
+
+
+        return model
+
+    @classmethod
+    def populate_model(cls, entity: 'Entity', model: models.Model) -> models.Model:
+        """Copy the entity fields onto a model instance without saving it"""
         # Update core fields
         if hasattr(model, 'attributes'):
             attributes = {}
@@ -245,22 +441,18 @@ class EntityAdapter:
         if hasattr(model, 'class_path'):
             model.class_path = entity.get_class_path()
 
-        model.save()
-
-        cls.save_strategy_requests(entity, model)
-
-
         return model
 
     @classmethod
     def load_strategy_requests(cls, model: models.Model):
-        from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
-        from shared_utils.models import StrategyRequest
-        strategy_requests = StrategyRequest.objects.filter(entity_model=model)
-        return [StrategyRequestEntity.from_db(strategy_request) for strategy_request in strategy_requests]
+        from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter
+        return StrategyRequestAdapter.load_for_entity_models([model.pk]).get(str(model.pk), [])
 
     @classmethod
     def save_strategy_requests(cls, entity, model: models.Model):
+        if not entity.strategy_requests_loaded():
+            # Requests that were never loaded can't have changed
+            return
         for strategy_entity in entity.strategy_requests:
             strategy_model = strategy_entity.to_db()
             strategy_model.entity_model = model
@@ -15,3 +15,4 @@ class EntityModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     class_path = models.CharField(max_length=255)  # Full path to entity class
+    state_hash = models.CharField(max_length=64, blank=True, default='')  # Hash of the row as last written by a bulk save
@@ -0,0 +1,61 @@
+import threading
+
+
+class StrategyRequestBatch:
+    """
+    Strategy requests of entities that were loaded together, e.g. by EntityService.load_subtree.
+
+    Nothing is queried until the requests of one of the entities are accessed. The requests of every
+    entity in the batch are then loaded at once, so walking the graph costs the same queries as loading
+    it eagerly, while displaying it without the strategy history costs none.
+    """
+
+    def __init__(self, entity_ids=None):
+        self.entity_ids = list(entity_ids or [])
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def add(self, entity_ids):
+        self.entity_ids.extend(entity_ids)
+
+    def get(self, entity_id):
+        if self._loaded is None:
+            with self._lock:
+                if self._loaded is None:
+                    from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter
+                    self._loaded = StrategyRequestAdapter.load_for_entity_models(self.entity_ids)
+        return list(self._loaded.get(str(entity_id), []))
+
+
+class LazyStrategyRequests:
+    """Placeholder for the strategy requests of an entity loaded from the database. Resolved on first access"""
+    __slots__ = ('entity_id', 'batch')
+
+    def __init__(self, entity_id, batch=None):
+        self.entity_id = str(entity_id)
+        self.batch = batch
+
+    def load(self):
+        if self.batch is not None:
+            return self.batch.get(self.entity_id)
+        from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter
+        return StrategyRequestAdapter.load_for_entity_models([self.entity_id]).get(self.entity_id, [])
+
+    def __reduce__(self):
+        # The batch holds the requests of other entities, so it is not stored with a cached copy of this one
+        return LazyStrategyRequests, (self.entity_id,)
+
+
+class LazyNestedRequests:
+    """Placeholder for the nested requests of a strategy request loaded from the database"""
+    __slots__ = ('request_id',)
+
+    def __init__(self, request_id):
+        self.request_id = str(request_id)
+
+    def load(self):
+        from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter
+        return StrategyRequestAdapter.load_nested_requests(self.request_id)
+
+    def __reduce__(self):
+        return LazyNestedRequests, (self.request_id,)
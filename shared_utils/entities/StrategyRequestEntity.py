@@ -1,12 +1,18 @@
+from collections import defaultdict
+
 from shared_utils.entities.EnityEnum import EntityEnum
 from shared_utils.entities.Entity import Entity
 from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.LazyStrategyRequests import LazyNestedRequests
 from shared_utils.models import StrategyRequest
-from typing import List, Optional
+from typing import Dict, List, Optional
 
 
 class StrategyRequestEntity(Entity):
     entity_name = EntityEnum.STRATEGY_REQUEST
+    __slots__ = ('strategy_name', 'param_config', '_nested_requests', 'created_at', 'updated_at', 'id', 'ret_val',
+                 'is_applied', 'add_to_history', 'target_entity_id', 'parent_request', 'entity_model', 'strategy_path',
+                 'depends_on', 'trace')
 
     def __init__(self, entity_id: Optional[str] = None):
         super().__init__(entity_id)
@@ -20,6 +26,10 @@ class StrategyRequestEntity(Entity):
         self.is_applied = False  # Flag to indicate if the strategy has been applied
         self.add_to_history = False  # Flag to indicate if the strategy should be added to the history
         self.target_entity_id = self.parent_ids[0] if self.parent_ids else None
+        # entity_ids of sibling nested requests that must be executed before this one
+        self.depends_on: List[str] = []
+        # Span tree of the last top-level execution (see StrategyTracer)
+        self.trace: Optional[Dict] = None
         self.set_attribute('width', 700)
         self.set_attribute('height', 500)
     def add_nested_request(self, request: 'StrategyRequestEntity'):
@@ -27,11 +37,12 @@ class StrategyRequestEntity(Entity):
         if not isinstance(request, StrategyRequestEntity):
             raise ValueError("Nested request must be a StrategyRequestEntity")
 
-        nested_request_ids = [nested.entity_id for nested in self._nested_requests]
+        nested_requests = self.get_nested_requests()
+        nested_request_ids = [nested.entity_id for nested in nested_requests]
         if request.entity_id in nested_request_ids:
-            old_request = self._nested_requests[nested_request_ids.index(request.entity_id)]
-            self._nested_requests.remove(old_request)
-        self._nested_requests.append(request)
+            old_request = nested_requests[nested_request_ids.index(request.entity_id)]
+            nested_requests.remove(old_request)
+        nested_requests.append(request)
 
     def add_nested_requests(self, requests: List['StrategyRequestEntity']):
         """Add a list of nested strategy requests"""
@@ -39,13 +50,28 @@ class StrategyRequestEntity(Entity):
             self.add_nested_request(request)
 
     def get_nested_requests(self) -> List['StrategyRequestEntity']:
-        """Get all nested strategy requests"""
+        """Get all nested strategy requests. Requests loaded from the database query them on first access"""
+        if isinstance(self._nested_requests, LazyNestedRequests):
+            self._nested_requests = self._nested_requests.load()
         return self._nested_requests
 
+    def nested_requests_loaded(self) -> bool:
+        """Check if the nested requests are in memory, without loading them"""
+        return not isinstance(self._nested_requests, LazyNestedRequests)
+
     def remove_nested_request(self, request: 'StrategyRequestEntity'):
         """Remove a nested strategy request"""
-        if request in self._nested_requests:
-            self._nested_requests.remove(request)
+        nested_requests = self.get_nested_requests()
+        if request in nested_requests:
+            nested_requests.remove(request)
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        # Requests pickled before dependencies and tracing were added
+        if not hasattr(self, 'depends_on'):
+            self.depends_on = []
+        if not hasattr(self, 'trace'):
+            self.trace = None
 
     def to_db(self):
         return StrategyRequestAdapter.entity_to_model(self)
@@ -60,8 +86,9 @@ class StrategyRequestEntity(Entity):
         sup_dict.update({
             'strategy_name': self.strategy_name,
             'param_config': self.param_config,
-            'nested_requests': [nested_request.serialize() for nested_request in self._nested_requests],
+            'nested_requests': [nested_request.serialize() for nested_request in self.get_nested_requests()],
             'add_to_history': self.add_to_history,
+            'depends_on': self.depends_on,
             'entity_id': self.entity_id,
             'target_entity_id': self.target_entity_id if self.target_entity_id else self.parent_ids[0] if self.parent_ids else None,
         })
@@ -75,6 +102,8 @@ class StrategyRequestEntity(Entity):
         strat_request.param_config = data['param_config']
         strat_request.add_to_history = data['add_to_history']
         strat_request.target_entity_id = data['target_entity_id']
+        strat_request.depends_on = list(data.get('depends_on', []))
+        strat_request.trace = data.get('trace')
         if 'entity_id' in data:
             strat_request.entity_id = data['entity_id']
 
@@ -87,8 +116,14 @@ class StrategyRequestEntity(Entity):
 
 class StrategyRequestAdapter:
     @staticmethod
-    def model_to_entity(model: StrategyRequest) -> StrategyRequestEntity:
-        """Convert a StrategyRequest model to a StrategyRequestEntity"""
+    def model_to_entity(model: StrategyRequest, nested_models: Optional[Dict] = None) -> StrategyRequestEntity:
+        """
+        Convert a StrategyRequest model to a StrategyRequestEntity
+
+        :param nested_models: optional map of parent request id -> nested StrategyRequest rows, as built by
+            load_nested_models. When given, nested requests are taken from it, otherwise they are queried
+            the first time they are accessed.
+        """
         entity_id = model.entity_id
         if type(model) != StrategyRequest:
             model = StrategyRequest.objects.get(entity_id=entity_id)
@@ -101,22 +136,82 @@ class StrategyRequestAdapter:
         entity.updated_at = model.updated_at
         entity.add_to_history = model.add_to_history
         entity.target_entity_id = model.target_entity_id
+        entity.depends_on = list(model.depends_on or [])
+        entity.trace = model.trace
 
-        # Map parent request (if it exists)
-        if model.parent_request:
-            entity.parent_request = str(model.parent_request.entity_id)
+        # Map parent request (if it exists). Foreign keys point at entity_id so the ids are read without a query
+        if model.parent_request_id:
+            entity.parent_request = str(model.parent_request_id)
 
         # Map training session (entity_model as a UUID)
-        if model.entity_model:
-            entity.entity_model = str(model.entity_model.entity_id)
+        if model.entity_model_id:
+            entity.entity_model = str(model.entity_model_id)
 
         # Convert nested requests
-        for nested_request in model.nested_requests.all():  # related_name='nested_requests'
-            nested_entity = StrategyRequestAdapter.model_to_entity(nested_request)
+        if nested_models is None:
+            entity._nested_requests = LazyNestedRequests(model.pk)
+            return entity
+        for nested_request in nested_models.get(model.pk, []):
+            nested_entity = StrategyRequestAdapter.model_to_entity(nested_request, nested_models)
             entity.add_nested_request(nested_entity)
 
         return entity
 
+    @staticmethod
+    def load_nested_requests(request_id) -> List[StrategyRequestEntity]:
+        """Load the nested requests directly below a request. Their own nested requests stay lazy"""
+        # related_name='nested_requests'
+        return [StrategyRequestAdapter.model_to_entity(model)
+                for model in StrategyRequest.objects.filter(parent_request_id=request_id)]
+
+    @staticmethod
+    def load_nested_models(models: List[StrategyRequest]) -> Dict:
+        """
+        Fetch every nested request below the given requests with one query per level of nesting.
+
+        :return: map of parent request id -> list of nested StrategyRequest rows
+        """
+        nested_models = defaultdict(list)
+        seen = {model.pk for model in models}
+        frontier = list(seen)
+        while frontier:
+            level = StrategyRequest.objects.filter(parent_request_id__in=frontier)
+            frontier = []
+            for nested_model in level:
+                nested_models[nested_model.parent_request_id].append(nested_model)
+                if nested_model.pk not in seen:
+                    seen.add(nested_model.pk)
+                    frontier.append(nested_model.pk)
+        return nested_models
+
+    @staticmethod
+    def load_for_entity_models(entity_model_ids) -> Dict[str, List[StrategyRequestEntity]]:
+        """
+        Load the strategy requests attached to several entity models at once.
+
+        :return: map of entity id -> list of StrategyRequestEntity
+        """
+        models = list(StrategyRequest.objects.filter(entity_model_id__in=entity_model_ids))
+        nested_models = StrategyRequestAdapter.load_nested_models(models)
+
+        strategy_requests = defaultdict(list)
+        for model in models:
+            strategy_requests[str(model.entity_model_id)].append(
+                StrategyRequestAdapter.model_to_entity(model, nested_models)
+            )
+        return strategy_requests
+
+    @staticmethod
+    def load_many(entity_ids) -> Dict[str, StrategyRequestEntity]:
+        """
+        Load several strategy requests by id, with their nested requests.
+
+        :return: map of entity id -> StrategyRequestEntity
+        """
+        models = list(StrategyRequest.objects.filter(entity_id__in=entity_ids))
+        nested_models = StrategyRequestAdapter.load_nested_models(models)
+        return {str(model.entity_id): StrategyRequestAdapter.model_to_entity(model, nested_models) for model in models}
+
     @staticmethod
     def entity_to_model(entity: StrategyRequestEntity, model: Optional[StrategyRequest] = None) -> StrategyRequest:
         """Convert a StrategyRequestEntity to a StrategyRequest model"""
@@ -128,21 +223,9 @@ class StrategyRequestAdapter:
                 # Create a new model instance if it does not exist
                 model = StrategyRequest(entity_id=entity.entity_id)
 
-        # Map basic attributes
-        model.strategy_name = entity.strategy_name
-        model.param_config = entity.param_config
-        model.add_to_history = entity.add_to_history
-        if len(entity.parent_ids) == 0:
-            model.target_entity_id = entity.target_entity_id
-        else:
-            model.target_entity_id = entity.target_entity_id if entity.target_entity_id else entity.parent_ids[0]
-        model.parent_ids = entity.parent_ids
-        model.class_path = entity.get_class_path()
-
-
-
-        if model.strategy_name == None:
-            model.strategy_name = "None"
+        StrategyRequestAdapter.populate_model(entity, model)
+        # Rows saved one by one are not covered by the bulk save state hash, so force the next bulk save to write them
+        model.state_hash = ''
 
         # Map parent request (if it exists)
         if hasattr(entity, 'parent_request') and entity.parent_request:
@@ -163,7 +246,9 @@ class StrategyRequestAdapter:
         # Save the updated or newly created model
         model.save()
 
-        # Handle nested requests
+        # Handle nested requests. Requests that were never loaded can't have changed
+        if not entity.nested_requests_loaded():
+            return model
         existing_nested_request_ids = set(model.nested_requests.values_list('entity_id', flat=True))
         for nested_request in entity.get_nested_requests():
             nested_model = StrategyRequestAdapter.entity_to_model(nested_request)
@@ -173,3 +258,23 @@ class StrategyRequestAdapter:
 
         return model
 
+    @staticmethod
+    def populate_model(entity: StrategyRequestEntity, model: StrategyRequest) -> StrategyRequest:
+        """Copy the basic request fields onto a model instance without saving it or resolving foreign keys"""
+        model.strategy_name = entity.strategy_name
+        model.param_config = entity.param_config
+        model.add_to_history = entity.add_to_history
+        model.depends_on = entity.depends_on
+        model.trace = entity.trace
+        if len(entity.parent_ids) == 0:
+            model.target_entity_id = entity.target_entity_id
+        else:
+            model.target_entity_id = entity.target_entity_id if entity.target_entity_id else entity.parent_ids[0]
+        model.parent_ids = entity.parent_ids
+        model.class_path = entity.get_class_path()
+
+        if model.strategy_name == None:
+            model.strategy_name = "None"
+
+        return model
+
@@ -2,6 +2,7 @@ from langchain.chat_models import init_chat_model
 from langchain_core.messages import AIMessage
 
 from shared_utils.strategy.BaseStrategy import Strategy, CreateEntityStrategy, HTTPGetRequestStrategy
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 from shared_utils.entities.EnityEnum import EntityEnum
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 import os
@@ -30,6 +31,7 @@ class Message:
 
 
 class ConfigureApiModelStrategy(Strategy):
+    queue = StrategyQueue.INTERACTIVE
     entity_type = EntityEnum.API_MODEL
     strategy_description = 'Configures an API model with connection details and parameters'
 
@@ -96,6 +98,7 @@ class ConfigureApiModelStrategy(Strategy):
     
 
 class CallApiModelStrategy(Strategy):
+    queue = StrategyQueue.IO
     entity_type = EntityEnum.API_MODEL
     strategy_description = 'Makes a call to the configured API model using LangChain'
 
@@ -394,6 +397,7 @@ class CallApiModelStrategy(Strategy):
 
 
 class ClearChatHistoryStrategy(Strategy):
+    queue = StrategyQueue.INTERACTIVE
     entity_type = EntityEnum.API_MODEL
     strategy_description = 'Clears the chat history for an API model'
 
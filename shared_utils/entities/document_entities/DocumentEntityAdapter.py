@@ -12,10 +12,11 @@ class DocumentEntityAdapter(EntityAdapter):
     """
     
     @classmethod
-    def model_to_entity(cls, model: DocumentEntityModel, entity_class: Type[DocumentEntity] = DocumentEntity) -> DocumentEntity:
+    def model_to_entity(cls, model: DocumentEntityModel, entity_class: Type[DocumentEntity] = DocumentEntity,
+                        strategy_requests=None) -> DocumentEntity:
         """Convert a DocumentEntityModel to a DocumentEntity"""
         # First use parent class to handle basic conversion
-        entity = super().model_to_entity(model, entity_class)
+        entity = super().model_to_entity(model, entity_class, strategy_requests)
         
         # If vector exists in model, add it to attributes
         if model.vector is not None:
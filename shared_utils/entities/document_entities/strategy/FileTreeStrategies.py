@@ -1,11 +1,14 @@
 from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 from shared_utils.entities.EnityEnum import EntityEnum
 from shared_utils.entities.document_entities.DocumentEntity import DocumentEntity
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 import os
+from uuid import uuid4
 
 class ScrapeFilePathStrategy(Strategy):
     """Strategy for scraping text content from a file path"""
+    queue = StrategyQueue.IO
     
     entity_type = EntityEnum.ENTITY  # Will be DOCUMENT once added
     strategy_description = 'Scrapes text content from a file or directory path'
@@ -64,6 +67,7 @@ class ScrapeFilePathStrategy(Strategy):
 
 class RecursiveFileScrapeStrategy(Strategy):
     """Strategy for recursively scraping a directory and creating a document tree"""
+    queue = StrategyQueue.IO
     
     entity_type = EntityEnum.DOCUMENT
     strategy_description = 'Recursively scrapes files and creates a document tree'
@@ -87,35 +91,39 @@ class RecursiveFileScrapeStrategy(Strategy):
         self.strategy_request.add_nested_request(scrape_response)
         entity = scrape_response.ret_val['entity']
         
-        # If directory, process each item as a new document
+        # If directory, process each item as a new document. The children are created one after another as they
+        # all change this entity, then sibling directories are scraped concurrently
         if os.path.isdir(path):
+            requests = []
             for item in os.listdir(path):
                 item_path = os.path.join(path, item)
                 if self.should_process_path(item_path):
-                    # Create new document entity as child
+                    # Create new document entity as child, with its id chosen up front so the recursive
+                    # request can target it before it exists
+                    child_id = str(uuid4())
                     create_request = StrategyRequestEntity()
                     create_request.strategy_name = 'CreateEntityStrategy'
                     create_request.param_config = {
-                        'entity_class': 'shared_utils.entities.document_entities.DocumentEntity.DocumentEntity'
+                        'entity_class': 'shared_utils.entities.document_entities.DocumentEntity.DocumentEntity',
+                        'entity_uuid': child_id
                     }
                     create_request.target_entity_id = entity.entity_id
-                    
-                    response = self.executor_service.execute_request(create_request)
-                    child_entity = response.ret_val['child_entity']
-                    entity = response.ret_val['entity']
-                    self.strategy_request.add_nested_request(create_request)
-                    
+
                     # Recursively process the child
                     child_request = StrategyRequestEntity()
                     child_request.strategy_name = 'RecursiveFileScrapeStrategy'
                     child_request.param_config = {'root_path': item_path}
-                    child_request.target_entity_id = child_entity.entity_id
-                    child_response = self.executor_service.execute_request(child_request)
-                    child_entity = child_response.ret_val['entity']
-                    self.strategy_request.add_nested_request(child_response)
+                    child_request.target_entity_id = child_id
+                    child_request.depends_on = [create_request.entity_id]
+                    requests += [create_request, child_request]
 
-                    # entity.add_child(child_entity)
-                    # self.entity_service.save_entity(child_entity)
+            responses = self.executor_service.execute_requests(requests)
+            for request, response in zip(requests, responses):
+                if request.strategy_name == 'CreateEntityStrategy':
+                    entity = response.ret_val['entity']
+                    self.strategy_request.add_nested_request(request)
+                else:
+                    self.strategy_request.add_nested_request(response)
         self.strategy_request.ret_val['entity'] = entity
 
     def apply(self, entity: DocumentEntity) -> StrategyRequestEntity:
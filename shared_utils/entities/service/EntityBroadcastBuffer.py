@@ -0,0 +1,192 @@
+import atexit
+import copy
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from shared_utils.entities.service.EntitySnapshotStore import EntitySnapshotStore
+
+logger = logging.getLogger(__name__)
+
+GLOBAL_GROUP = "global_entities"
+
+_broadcast_buffer = None
+_broadcast_buffer_pid = None
+_broadcast_buffer_lock = threading.Lock()
+
+
+def get_broadcast_buffer():
+    """Get the broadcast buffer of the current process, creating it on first use"""
+    global _broadcast_buffer, _broadcast_buffer_pid
+    pid = os.getpid()
+    if _broadcast_buffer is None or _broadcast_buffer_pid != pid:
+        with _broadcast_buffer_lock:
+            if _broadcast_buffer is None or _broadcast_buffer_pid != pid:
+                _broadcast_buffer = EntityBroadcastBuffer(
+                    window_seconds=getattr(settings, 'ENTITY_BROADCAST_WINDOW_SECONDS', 0.05),
+                    max_updates_per_second=getattr(settings, 'ENTITY_BROADCAST_MAX_PER_SECOND', 10),
+                    snapshot_store=EntitySnapshotStore() if getattr(settings, 'ENTITY_BROADCAST_DELTAS', True) else None,
+                )
+                _broadcast_buffer_pid = pid
+                atexit.register(_broadcast_buffer.flush, True)
+    return _broadcast_buffer
+
+
+class EntityBroadcastBuffer:
+    """
+    Coalesces entity updates before they are broadcast to the frontend.
+
+    A copy of the entity shell is queued on each save, so the state sent is the one saved, and saves within the
+    same window replace each other. When the window closes each entity is serialized once and every entity
+    ready goes out in a single group_send to the global group, and each one with its full state to its own entity group for the clients subscribed
+    to that entity alone. Each entity is sent at most max_updates_per_second times; later updates wait in the
+    buffer for the next allowed slot and only their latest state is sent.
+
+    With a snapshot store, entities already known to clients are sent as JSON-patch deltas against their
+    previous version (see EntitySnapshotStore) and unchanged entities are not sent at all.
+    """
+
+    def __init__(self, channel_layer=None, window_seconds=0.05, max_updates_per_second=10, snapshot_store=None):
+        self._channel_layer = channel_layer
+        self.snapshot_store = snapshot_store
+        self.window_seconds = window_seconds
+        self.min_interval = 1.0 / max_updates_per_second if max_updates_per_second else 0
+        self._pending = {}
+        self._last_sent = {}
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def channel_layer(self):
+        if self._channel_layer is None:
+            self._channel_layer = get_channel_layer()
+        return self._channel_layer
+
+    def add(self, entity):
+        """
+        Queue an entity update. Only the shell of the entity is copied here, so later attribute changes on the
+        object are not sent with this update; values changed in place still are
+        """
+        self._add(entity.entity_id, ('update', self._copy_shell(entity)))
+
+    @staticmethod
+    def _copy_shell(entity):
+        shell = copy.copy(entity)
+        shell.replace_raw_attributes(dict(entity.get_raw_attributes()), entity.get_attribute_references())
+        shell.children_ids = list(entity.children_ids)
+        shell.parent_ids = list(entity.parent_ids)
+        return shell
+
+    def add_deletion(self, entity_id):
+        """Queue a deletion message, replacing any pending update of the entity"""
+        self._add(entity_id, ('delete', {'deleted': True, 'id': entity_id}))
+
+    def _add(self, entity_id, item):
+        if self.window_seconds <= 0:
+            with self._lock:
+                self._pending[entity_id] = item
+            self.flush()
+            return
+
+        with self._lock:
+            self._pending[entity_id] = item
+            if self._timer is None:
+                self._schedule(self.window_seconds)
+
+    def _schedule(self, delay):
+        # Called with the lock held
+        self._timer = threading.Timer(delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self, force=False):
+        """
+        Broadcast every pending entity that is not rate limited.
+
+        :param force: also send rate limited entities (used at shutdown)
+        """
+        with self._lock:
+            now = time.monotonic()
+            ready = {}
+            next_allowed = None
+            for entity_id, item in self._pending.items():
+                allowed_at = self._last_sent.get(entity_id, float('-inf')) + self.min_interval
+                if force or item[0] == 'delete' or allowed_at <= now:
+                    ready[entity_id] = item
+                elif next_allowed is None or allowed_at < next_allowed:
+                    next_allowed = allowed_at
+
+            for entity_id in ready:
+                del self._pending[entity_id]
+                self._last_sent[entity_id] = now
+            self._prune_last_sent(now)
+
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = None
+            if self._pending and next_allowed is not None:
+                self._schedule(max(next_allowed - now, self.window_seconds))
+
+        if not ready:
+            return
+
+        deletions = {entity_id: data for entity_id, (kind, data) in ready.items() if kind == 'delete'}
+        entities_data = {}
+        for entity_id, (kind, entity) in ready.items():
+            if kind != 'update':
+                continue
+            try:
+                entities_data[entity_id] = entity.serialize()
+            except Exception as e:
+                logger.error(f"Error serializing entity {entity_id} for broadcast: {str(e)}")
+
+        message = {"type": "entity_update"}
+        if self.snapshot_store is not None:
+            try:
+                if deletions:
+                    self.snapshot_store.delete(deletions.keys())
+                full, patches, versions = self.snapshot_store.record(entities_data)
+            except Exception as e:
+                # Without snapshots clients still get consistent full entities, they resync on the next patch
+                logger.error(f"Error recording entity snapshots: {str(e)}")
+                full, patches, versions = dict(entities_data), {}, {}
+            if patches:
+                message["patches"] = patches
+            if versions:
+                message["versions"] = versions
+        else:
+            full = dict(entities_data)
+
+        full.update(deletions)
+        message["entities"] = full
+        if full or "patches" in message:
+            try:
+                async_to_sync(self.channel_layer.group_send)(GLOBAL_GROUP, message)
+            except Exception as e:
+                logger.error(f"Error broadcasting to global socket: {str(e)}")
+
+        # Entity sockets don't track versions, they get the full state of every changed entity
+        changed = {entity_id: data for entity_id, data in entities_data.items()
+                   if entity_id in full or entity_id in message.get('patches', {})}
+        changed.update(deletions)
+        for entity_id, data in changed.items():
+            try:
+                async_to_sync(self.channel_layer.group_send)(
+                    f"entity_{entity_id}", {"type": "entity_update", "entity": data})
+            except Exception as e:
+                logger.error(f"Error broadcasting to entity socket {entity_id}: {str(e)}")
+
+    def _prune_last_sent(self, now):
+        # Entities that have not been sent for a while are no longer rate limited and can be forgotten
+        if len(self._last_sent) > 1000:
+            self._last_sent = {entity_id: sent for entity_id, sent in self._last_sent.items()
+                               if now - sent < self.min_interval}
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending)
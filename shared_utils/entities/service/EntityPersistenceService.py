@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+
+from django.db import connection, transaction
+
+from shared_utils.entities.Entity import EntityAdapter
+from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter, StrategyRequestEntity
+from shared_utils.models import StrategyRequest
+
+logger = logging.getLogger(__name__)
+
+ENTITY_FIELDS = ['entity_type', 'attributes', 'children_ids', 'parent_ids', 'class_path']
+REQUEST_FIELDS = ['strategy_name', 'param_config', 'target_entity_id', 'add_to_history', 'depends_on', 'trace',
+                  'entity_model_id', 'parent_request_id']
+# Fields written through the raw upsert that have to be encoded as JSON
+REQUEST_JSON_FIELDS = ['param_config', 'depends_on', 'trace']
+
+
+class EntityPersistenceService:
+    """
+    Writes many entities and their strategy requests to the database in one transaction.
+
+    Every row is hashed from the values it would be written with. Rows whose hash matches the state_hash
+    stored by the previous bulk save are skipped. EntityModel rows are upserted with
+    bulk_create(update_conflicts=True). StrategyRequest uses multi-table inheritance, which bulk_create does
+    not support, so its base row is upserted with the entities and its own row with one executemany upsert.
+    """
+
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+
+    def save_entities(self, entities):
+        """
+        Save entities, their strategy requests and nested requests.
+
+        :return: dict with the number of rows written and skipped
+        """
+        entity_rows = {}
+        request_rows = {}
+        for entity in entities:
+            if isinstance(entity, StrategyRequestEntity):
+                self.collect_request(entity, entity_rows, request_rows)
+                continue
+
+            model = EntityAdapter.populate_model(entity, EntityModel(entity_id=entity.entity_id))
+            entity_rows[entity.entity_id] = model
+            if not entity.strategy_requests_loaded():
+                # Requests that were never loaded can't have changed
+                continue
+            for strategy_request in entity.strategy_requests:
+                self.collect_request(strategy_request, entity_rows, request_rows, entity_model_id=entity.entity_id)
+
+        for entity_id, model in entity_rows.items():
+            model.state_hash = self.compute_state_hash(model, request_rows.get(entity_id))
+
+        stored_hashes = {
+            str(entity_id): state_hash
+            for entity_id, state_hash in EntityModel.objects.filter(entity_id__in=list(entity_rows.keys()))
+            .values_list('entity_id', 'state_hash')
+        }
+        changed_ids = [entity_id for entity_id, model in entity_rows.items()
+                       if stored_hashes.get(entity_id) != model.state_hash]
+
+        with transaction.atomic():
+            self.upsert_entity_models([entity_rows[entity_id] for entity_id in changed_ids])
+            self.upsert_strategy_requests([(entity_id, request_rows[entity_id]) for entity_id in changed_ids
+                                           if entity_id in request_rows])
+
+        skipped = len(entity_rows) - len(changed_ids)
+        logger.info(f"Bulk saved {len(changed_ids)} entity rows, skipped {skipped} unchanged rows")
+        return {'saved': len(changed_ids), 'skipped': skipped}
+
+    def collect_request(self, strategy_request, entity_rows, request_rows, entity_model_id=None, parent_request_id=None):
+        """Build the rows of a strategy request and its nested requests"""
+        entity_id = strategy_request.entity_id
+        model = StrategyRequestAdapter.populate_model(strategy_request, StrategyRequest(entity_id=entity_id))
+        existing = request_rows.get(entity_id, {})
+
+        # Foreign keys are kept from other places the request was seen, as one by one saves never clear them
+        entity_model_id = entity_model_id or getattr(strategy_request, 'entity_model', None) or existing.get('entity_model_id')
+        parent_request_id = parent_request_id or getattr(strategy_request, 'parent_request', None) or existing.get('parent_request_id')
+
+        entity_rows[entity_id] = EntityModel(
+            entity_id=entity_id,
+            entity_type=model.entity_type,
+            attributes=model.attributes,
+            children_ids=model.children_ids,
+            parent_ids=model.parent_ids,
+            class_path=model.class_path,
+        )
+        request_rows[entity_id] = {
+            'strategy_name': model.strategy_name,
+            'param_config': model.param_config,
+            'target_entity_id': model.target_entity_id,
+            'add_to_history': model.add_to_history,
+            'depends_on': list(model.depends_on or []),
+            'trace': model.trace,
+            'entity_model_id': str(entity_model_id) if entity_model_id else None,
+            'parent_request_id': str(parent_request_id) if parent_request_id else None,
+        }
+
+        if not strategy_request.nested_requests_loaded():
+            return
+        for nested_request in strategy_request.get_nested_requests():
+            self.collect_request(nested_request, entity_rows, request_rows, parent_request_id=entity_id)
+
+    @staticmethod
+    def compute_state_hash(model, request_row=None):
+        """Hash the values a row is written with"""
+        state = {field: getattr(model, field) for field in ENTITY_FIELDS}
+        if request_row is not None:
+            state.update(request_row)
+        encoded = json.dumps(state, sort_keys=True, default=str)
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def upsert_entity_models(self, models):
+        if not models:
+            return
+        EntityModel.objects.bulk_create(
+            models,
+            batch_size=self.batch_size,
+            update_conflicts=True,
+            unique_fields=['entity_id'],
+            update_fields=ENTITY_FIELDS + ['state_hash', 'updated_at'],
+        )
+
+    def upsert_strategy_requests(self, rows):
+        """Upsert the StrategyRequest rows. Their EntityModel rows must already be written."""
+        if not rows:
+            return
+
+        meta = StrategyRequest._meta
+        quote = connection.ops.quote_name
+        pk_column = meta.pk.column
+        columns = [meta.get_field(field).column for field in REQUEST_FIELDS]
+        insert_columns = ', '.join(quote(column) for column in [pk_column] + columns)
+        placeholders = ', '.join(['%s'] * (len(columns) + 1))
+        updates = ', '.join(f"{quote(column)} = EXCLUDED.{quote(column)}" for column in columns)
+        sql = (f"INSERT INTO {quote(meta.db_table)} ({insert_columns}) VALUES ({placeholders}) "
+               f"ON CONFLICT ({quote(pk_column)}) DO UPDATE SET {updates}")
+
+        params = []
+        for entity_id, row in rows:
+            values = [row[field] for field in REQUEST_FIELDS]
+            for field in REQUEST_JSON_FIELDS:
+                values[REQUEST_FIELDS.index(field)] = json.dumps(row[field])
+            params.append([str(entity_id)] + values)
+
+        with connection.cursor() as cursor:
+            for start in range(0, len(params), self.batch_size):
+                cursor.executemany(sql, params[start:start + self.batch_size])
@@ -8,6 +8,9 @@ from shared_utils.cache.CacheService import CacheService
 from shared_utils.entities import Entity
 from shared_utils.entities.EnityEnum import EntityEnum
 from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.service.EntityBroadcastBuffer import get_broadcast_buffer
+from shared_utils.entities.service.EntitySnapshotStore import EntitySnapshotStore
+from shared_utils.strategy_executor.service.StrategyTracer import StrategyTracer
 import logging
 
 logger = logging.getLogger(__name__)
@@ -16,11 +19,14 @@ class EntityService:
     def __init__(self):
         self.cache_service = CacheService()
         self.channel_layer = get_channel_layer()
+        self.broadcast_buffer = get_broadcast_buffer()
+        self.snapshot_store = EntitySnapshotStore()
 
     def get_entity(self, entity_id):
         """Get an entity by its ID from cache or database"""
         logger.info(f"Getting entity {entity_id}")
-        entity = self.load_from_cache(entity_id)
+        with StrategyTracer.span('get_entity', 'cache', entity_id=entity_id):
+            entity = self.load_from_cache(entity_id)
         logger.info(f"Entity {entity_id} loaded from cache")
         if entity is None:
             logger.info(f"Entity {entity_id} not found in cache, loading from database")
@@ -36,28 +42,51 @@ class EntityService:
         """Save an entity to cache and broadcast update via WebSocket"""
         # Save entity to cache
         logger.info(f"Saving entity {entity.entity_id} to cache")
-        self.cache_service.set(entity.entity_id, entity)
+        with StrategyTracer.span('save_entity', 'cache', entity_id=entity.entity_id):
+            self.cache_service.set_entity(entity)
         logger.info(f"Entity {entity.entity_id} saved to cache")
-        
-        # Check if entity socket exists
-        socket_exists = self._check_entity_socket_exists(entity.entity_id)
 
         if hasattr(entity, 'deleted') and entity.deleted:
             self.clear_entity(entity.entity_id)
             return
-        # Broadcast update
-        # if not socket_exists:
-        # No socket exists, broadcast to global to establish connection
-        # print(f"No socket exists for entity {entity.entity_id}, broadcasting to global")
-        self._broadcast_to_global_socket({
-            entity.entity_id: entity.serialize()
-        })
-        # else:
-            # Socket exists, send update through entity-specific socket
-        print(f"Socket exists for entity {entity.entity_id}, broadcasting to entity socket")
-        self._broadcast_to_entity_socket(entity)
-            
-        print(f"Entity {entity.entity_id} saved and broadcast")
+
+        # Updates are coalesced per entity and sent to the global socket in batches, so an entity saved
+        # many times in a burst is serialized and sent once per window
+        self.broadcast_buffer.add(entity)
+        StrategyTracer.count('broadcasts_queued')
+        logger.info(f"Entity {entity.entity_id} saved and queued for broadcast")
+
+    def entity_lock(self, entity_id):
+        """Exclusive lock on an entity across workers, used as a context manager"""
+        return self.cache_service.lock(entity_id)
+
+    def get_entity_snapshots(self, entity_ids, refresh=False):
+        """
+        Get the full broadcast state of entities with its version, for new subscriptions and resync requests.
+
+        Stored snapshots are returned as they are, so they line up with the patches already sent. Entities
+        without a snapshot, or all entities when refresh is set, are serialized again and stored as a new version.
+
+        :return: (entities, versions) maps keyed by entity id
+        """
+        entities = {}
+        versions = {}
+        stored = {} if refresh else self.snapshot_store.get_snapshots(entity_ids)
+        for entity_id, (version, snapshot) in stored.items():
+            entities[entity_id] = snapshot
+            versions[entity_id] = version
+
+        missing = [entity_id for entity_id in entity_ids if entity_id not in stored]
+        serialized = {}
+        for entity_id in missing:
+            try:
+                serialized[entity_id] = self.get_entity(entity_id).serialize()
+            except ValueError:
+                entities[entity_id] = {'deleted': True, 'id': entity_id}
+        if serialized:
+            versions.update(self.snapshot_store.reset(serialized))
+            entities.update(serialized)
+        return entities, versions
 
     def _check_entity_socket_exists(self, entity_id):
         """Check if an entity-specific socket group exists"""
@@ -84,22 +113,11 @@ class EntityService:
     def clear_entity(self, entity_id):
         """Remove an entity from cache and broadcast deletion"""
         print(f"Clearing entity {entity_id} from cache")
-        self.cache_service.delete(entity_id)
-        
-        # Always broadcast deletion to both sockets to ensure cleanup
-        deletion_message = {
-            entity_id: {
-                'deleted': True,
-                'id': entity_id
-            }
-        }
-        
-        # Check if entity socket exists before broadcasting
-        if self._check_entity_socket_exists(entity_id):
-            self._broadcast_to_entity_socket_by_id(entity_id, deletion_message)
+        self.cache_service.delete_entity(entity_id)
         
-        # Always broadcast to global to ensure all clients know about deletion
-        self._broadcast_to_global_socket(deletion_message)
+        # Broadcast deletion to the global socket so all clients know about it. This replaces any update
+        # of the entity still waiting in the broadcast buffer
+        self.broadcast_buffer.add_deletion(entity_id)
         
         try:
             print(f"Deleting entity {entity_id} from database")
@@ -166,22 +184,34 @@ class EntityService:
 
     def load_from_cache(self, entity_id):
         """Load an entity from cache"""
-        return self.cache_service.get(entity_id)
+        return self.cache_service.get_entity(entity_id)
 
     def load_entities_from_cache(self, entity_ids):
         """Load multiple entities from cache"""
-        return self.cache_service.get_many(entity_ids)
+        return self.cache_service.get_entities(entity_ids)
 
     def get_children_ids_by_type(self, entity, entity_type: EntityEnum):
-        """Get children IDs of a specific type from an entity"""
-        ##TODO this kind of bad but easy
-        children_ids = []
-        for child_id in entity.get_children():
-            child_entity = self.load_from_cache(child_id)
-            if child_entity:
-                if child_entity.entity_name == entity_type:
-                    children_ids.append(child_id)
-        return children_ids
+        """
+        Get children IDs of a specific type from an entity. Child types come from the entity itself, then
+        from the type index kept next to the cache, and only children missing from both are loaded.
+        """
+        children = entity.get_children()
+        child_types = dict(entity.get_child_types())
+
+        unknown_ids = [child_id for child_id in children if child_id not in child_types]
+        if unknown_ids:
+            child_types.update(self.cache_service.get_entity_types(unknown_ids))
+
+        unknown_ids = [child_id for child_id in unknown_ids if child_id not in child_types]
+        if unknown_ids:
+            for child_id, child_entity in self.load_entities_from_cache(unknown_ids).items():
+                child_types[child_id] = child_entity.entity_name.value
+
+        for child_id in children:
+            if child_id in child_types:
+                entity.set_child_type(child_id, child_types[child_id])
+
+        return [child_id for child_id in children if child_types.get(child_id) == entity_type.value]
 
     def load_from_db(self, entity_id):
         """Load an entity from database"""
@@ -195,7 +225,7 @@ class EntityService:
 
     def clear_entities(self, entity_ids):
         """Remove multiple entities from cache"""
-        self.cache_service.delete_many(entity_ids)
+        self.cache_service.delete_entities(entity_ids)
 
     def clear_all_entities(self):
         """Remove all entities from cache"""
@@ -232,42 +262,112 @@ class EntityService:
 
     def delete_session_db(self, session_id):
         """Delete the current session from the database"""
-        all_entities = self.recurse_children(session_id)
-        for entity in all_entities:
-            try:
-                entity_model = EntityModel.objects.get(entity_id=entity.entity_id)
-                entity_model.delete()
-            except EntityModel.DoesNotExist:
-                pass
+        entity_ids = [model.entity_id for level in self.iter_subtree_models(session_id, fields=['entity_id', 'children_ids'])
+                      for model in level]
+        EntityModel.objects.filter(entity_id__in=entity_ids).delete()
 
         self.clear_all_entities()
 
     def recurse_children(self, entity_id, entity_type = None):
         """Recursively get all children of a specific type until no children are left."""
-        entity = self.load_from_db(entity_id)
-
-        if not entity:
-            return []
-
-        entities = []
-
-        # Add the current entity if it matches the type
+        entities = list(self.load_subtree(entity_id, fill_cache=False).values())
         if entity_type:
-            if entity.entity_name == entity_type:
-                entities.append(entity)
-        else:
-            entities.append(entity)
+            entities = [entity for entity in entities if entity.entity_name == entity_type]
+        return entities
 
-        # If there are no children, return the current entities
-        if not entity.children_ids:
-            return entities
+    def save_subtree_to_db(self, root_id):
+        """
+        Save an entity and all of its descendants to the database in one transaction. Rows that have not
+        changed since the last bulk save are skipped.
 
-        # Recursively get children entities
-        for child_id in entity.children_ids:
-            child_entities = self.recurse_children(child_id, entity_type)
-            entities.extend(child_entities)
+        :return: dict with the number of rows written and skipped
+        """
+        from shared_utils.entities.service.EntityPersistenceService import EntityPersistenceService
 
-        return entities
+        entities = self.load_subtree(root_id, use_cache=True, fill_cache=False)
+        if str(root_id) not in entities:
+            raise ValueError(f"Entity with ID {root_id} not found")
+        return EntityPersistenceService().save_entities(entities.values())
 
+    def iter_subtree_models(self, root_id, fields=None):
+        """
+        Walk the entity graph below root_id in the database one level at a time.
 
+        :param fields: optional list of EntityModel fields to load (children_ids is always needed)
+        :return: generator of lists of EntityModel rows, one list per level
+        """
+        seen = set()
+        frontier = [str(root_id)]
+        while frontier:
+            seen.update(frontier)
+            queryset = EntityModel.objects.filter(entity_id__in=frontier)
+            if fields:
+                queryset = queryset.only(*fields)
+            models = list(queryset)
+            yield models
+
+            frontier = []
+            for model in models:
+                for child_id in model.children_ids:
+                    child_id = str(child_id)
+                    if child_id not in seen:
+                        seen.add(child_id)
+                        frontier.append(child_id)
+
+    def load_subtree(self, root_id, use_cache=False, fill_cache=True):
+        """
+        Load an entity and all of its descendants level by level. Each level costs one query for the
+        entity rows, instead of several queries per entity. Strategy requests are not loaded until the
+        requests of one of the entities are accessed; the requests of the whole subtree are then loaded
+        together (see StrategyRequestBatch).
+
+        :param use_cache: read entities from the cache first and only go to the database for the ones
+            that are missing
+        :param fill_cache: store the entities loaded from the database in the cache with one batched write
+        :return: dict of entity_id -> entity
+        """
+        from shared_utils.entities.LazyStrategyRequests import LazyStrategyRequests, StrategyRequestBatch
+        from shared_utils.entities.StrategyRequestEntity import StrategyRequestAdapter, StrategyRequestEntity
+
+        strategy_request_batch = StrategyRequestBatch()
+        entities = {}
+        loaded_from_db = []
+        frontier = [str(root_id)]
+        while frontier:
+            level = self.load_entities_from_cache(frontier) if use_cache else {}
+
+            missing_ids = [entity_id for entity_id in frontier if entity_id not in level]
+            if missing_ids:
+                models = list(EntityModel.objects.filter(entity_id__in=missing_ids))
+                entity_classes = {str(model.entity_id): self.create_instance_from_path(model.class_path) for model in models}
+
+                request_ids = {entity_id for entity_id, entity_class in entity_classes.items()
+                               if issubclass(entity_class, StrategyRequestEntity)}
+                level.update(StrategyRequestAdapter.load_many(request_ids) if request_ids else {})
+
+                other_models = [model for model in models if str(model.entity_id) not in request_ids]
+                strategy_request_batch.add([model.pk for model in other_models])
+                for model in other_models:
+                    entity_id = str(model.entity_id)
+                    level[entity_id] = entity_classes[entity_id].from_db(
+                        model, LazyStrategyRequests(entity_id, strategy_request_batch))
+
+                loaded_from_db.extend(level[entity_id] for entity_id in missing_ids if entity_id in level)
+
+            entities.update(level)
+            self.cache_service.remember_entity_types({entity_id: entity.entity_name.value for entity_id, entity in level.items()})
+
+            frontier = list(dict.fromkeys(
+                str(child_id) for entity in level.values() for child_id in entity.get_children()
+                if str(child_id) not in entities
+            ))
+
+        for entity in entities.values():
+            for child_id in entity.get_children():
+                if child_id in entities:
+                    entity.set_child_type(child_id, entities[child_id].entity_name.value)
+
+        if fill_cache and loaded_from_db:
+            self.cache_service.set_entities(loaded_from_db)
 
+        return entities
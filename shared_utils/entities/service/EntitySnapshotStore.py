@@ -0,0 +1,183 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+
+from shared_utils.cache.CacheService import _get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_KEY_PREFIX = "entity_snapshot"
+SNAPSHOT_VERSION_KEY_PREFIX = "entity_snapshot_version"
+
+# Store snapshots under new versions. For each entity KEYS holds its version and snapshot keys and ARGV the
+# encoded snapshot, after ARGV[1] = timeout in seconds (0 for none). The version is incremented and the
+# snapshot written in one step, so the stored snapshot is always the one of the stored version. The new
+# versions are returned in order.
+RECORD_SCRIPT = """
+local timeout = tonumber(ARGV[1])
+local versions = {}
+for i = 1, #KEYS / 2 do
+    local version = redis.call('INCR', KEYS[i * 2 - 1])
+    if timeout > 0 then
+        redis.call('EXPIRE', KEYS[i * 2 - 1], timeout)
+        redis.call('SET', KEYS[i * 2], ARGV[i + 1], 'EX', timeout)
+    else
+        redis.call('SET', KEYS[i * 2], ARGV[i + 1])
+    end
+    table.insert(versions, version)
+end
+return versions
+"""
+
+# Without redis, version allocation only covers the threads of this process
+_record_lock = threading.Lock()
+
+
+class EntitySnapshotStore:
+    """
+    Versioned copies of the last serialized state broadcast for each entity.
+
+    Snapshots are kept in the shared cache so every process broadcasting entities diffs against the same
+    state. When an entity is broadcast again only the changed fields are sent, as JSON-patch operations
+    (RFC 6902) with the version they apply to. A client whose version differs from the patch base version
+    has missed an update and asks for a resync, which is answered with the full snapshot.
+
+    Versions are allocated by incrementing a counter together with the snapshot write, so two processes
+    recording the same entity never hand out the same version. A patch is only sent when its version directly
+    follows the snapshot it was diffed against, otherwise another process recorded the entity in between and
+    the full state is sent instead.
+    """
+
+    def __init__(self, timeout=None):
+        self.timeout = timeout if timeout is not None else getattr(settings, 'ENTITY_SNAPSHOT_TIMEOUT', None)
+
+    @staticmethod
+    def snapshot_key(entity_id):
+        return f"{SNAPSHOT_KEY_PREFIX}:{entity_id}"
+
+    @staticmethod
+    def version_key(entity_id):
+        return f"{SNAPSHOT_VERSION_KEY_PREFIX}:{entity_id}"
+
+    def get_snapshots(self, entity_ids):
+        """
+        :return: map of entity id -> (version, snapshot) for the entities that have a snapshot
+        """
+        keys = []
+        for entity_id in entity_ids:
+            keys += [self.version_key(entity_id), self.snapshot_key(entity_id)]
+        # One read of the versions and snapshots, they are written together
+        stored = cache.get_many(keys)
+        snapshots = {}
+        for entity_id in entity_ids:
+            version = stored.get(self.version_key(entity_id))
+            if version is not None and self.snapshot_key(entity_id) in stored:
+                snapshots[entity_id] = (int(version), stored[self.snapshot_key(entity_id)])
+        return snapshots
+
+    def record(self, entities_data):
+        """
+        Store new snapshots and work out what has to be sent for each entity.
+
+        :param entities_data: map of entity id -> serialized entity
+        :return: (full, patches, versions). full maps ids of entities without a previous snapshot, or recorded
+            concurrently by another process, to their serialized state, patches maps ids to
+            {'base_version', 'version', 'ops'} and versions holds the new version of every entity. Unchanged
+            entities are left out of full and patches.
+        """
+        previous = self.get_snapshots(list(entities_data.keys()))
+        full, patches, versions, changed, changes = {}, {}, {}, {}, {}
+
+        for entity_id, data in entities_data.items():
+            if entity_id not in previous:
+                changed[entity_id] = data
+                continue
+
+            base_version, snapshot = previous[entity_id]
+            ops = self.diff(snapshot, data)
+            if not ops:
+                versions[entity_id] = base_version
+                continue
+            changed[entity_id] = data
+            changes[entity_id] = (base_version, ops)
+
+        for entity_id, version in self.store(changed).items():
+            versions[entity_id] = version
+            base_version, ops = changes.get(entity_id, (None, None))
+            if base_version is not None and version == base_version + 1:
+                patches[entity_id] = {'base_version': base_version, 'version': version, 'ops': ops}
+            else:
+                full[entity_id] = changed[entity_id]
+        return full, patches, versions
+
+    def reset(self, entities_data):
+        """Store full snapshots as the next version, without diffing. Used to answer resync requests"""
+        return self.store(entities_data)
+
+    def store(self, entities_data):
+        """
+        Write snapshots under newly allocated versions
+
+        :return: map of entity id -> new version
+        """
+        if not entities_data:
+            return {}
+        entity_ids = list(entities_data.keys())
+        connection = _get_redis_connection()
+        if connection is not None:
+            keys = []
+            args = [int(self.timeout or 0)]
+            for entity_id in entity_ids:
+                keys += [cache.make_key(self.version_key(entity_id)), cache.make_key(self.snapshot_key(entity_id))]
+                args.append(cache.client.encode(entities_data[entity_id]))
+            result = connection.eval(RECORD_SCRIPT, len(keys), *keys, *args)
+            return {entity_id: int(version) for entity_id, version in zip(entity_ids, result)}
+
+        with _record_lock:
+            current = cache.get_many([self.version_key(entity_id) for entity_id in entity_ids])
+            versions = {entity_id: int(current.get(self.version_key(entity_id)) or 0) + 1
+                        for entity_id in entity_ids}
+            updates = {}
+            for entity_id, data in entities_data.items():
+                updates[self.version_key(entity_id)] = versions[entity_id]
+                updates[self.snapshot_key(entity_id)] = data
+            cache.set_many(updates, timeout=self.timeout)
+        return versions
+
+    def delete(self, entity_ids):
+        cache.delete_many([key for entity_id in entity_ids
+                           for key in (self.snapshot_key(entity_id), self.version_key(entity_id))])
+
+    @staticmethod
+    def diff(old, new, path=''):
+        """
+        Build JSON-patch operations turning old into new. Dicts are compared key by key; lists and other
+        values are replaced as a whole when they differ.
+        """
+        if isinstance(old, dict) and isinstance(new, dict):
+            ops = []
+            for key, value in new.items():
+                key_path = f"{path}/{EntitySnapshotStore.escape(key)}"
+                if key not in old:
+                    ops.append({'op': 'add', 'path': key_path, 'value': value})
+                else:
+                    ops.extend(EntitySnapshotStore.diff(old[key], value, key_path))
+            for key in old:
+                if key not in new:
+                    ops.append({'op': 'remove', 'path': f"{path}/{EntitySnapshotStore.escape(key)}"})
+            return ops
+
+        try:
+            unchanged = type(old) == type(new) and bool(old == new)
+        except (ValueError, TypeError):
+            # Values without a plain truth value for == (e.g. numpy arrays) are always sent
+            unchanged = False
+        if unchanged:
+            return []
+        return [{'op': 'replace', 'path': path, 'value': new}]
+
+    @staticmethod
+    def escape(key):
+        return str(key).replace('~', '~0').replace('/', '~1')
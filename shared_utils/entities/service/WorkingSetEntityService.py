@@ -0,0 +1,91 @@
+import logging
+import threading
+
+from shared_utils.entities.service.EntityService import EntityService
+
+logger = logging.getLogger(__name__)
+
+
+class WorkingSetEntityService(EntityService):
+    """
+    EntityService keeping the entities of a batch of strategy requests in memory.
+
+    Entities are loaded from the cache the first time they are requested and every later get returns the same
+    object, so requests in the batch see each other's changes without reloading them. Saves and deletions only
+    update the working set; flush writes each touched entity to the cache once and sends a single coalesced
+    broadcast. Nothing reaches the cache if the batch is dropped without flushing.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.entities = {}
+        self.dirty = {}
+        self.deleted = set()
+        self._lock = threading.RLock()
+
+    def load_from_cache(self, entity_id):
+        with self._lock:
+            if entity_id in self.deleted:
+                return None
+            if entity_id not in self.entities:
+                entity = super().load_from_cache(entity_id)
+                if entity is None:
+                    return None
+                self.entities[entity_id] = entity
+            return self.entities[entity_id]
+
+    def load_from_db(self, entity_id):
+        entity = super().load_from_db(entity_id)
+        if entity is not None:
+            with self._lock:
+                entity = self.entities.setdefault(entity_id, entity)
+        return entity
+
+    def load_entities_from_cache(self, entity_ids):
+        with self._lock:
+            missing = [entity_id for entity_id in entity_ids
+                       if entity_id not in self.entities and entity_id not in self.deleted]
+            if missing:
+                self.entities.update(super().load_entities_from_cache(missing))
+            return {entity_id: self.entities[entity_id] for entity_id in entity_ids if entity_id in self.entities}
+
+    def save_entity(self, entity):
+        """Keep the entity in the working set, it is written to the cache on flush"""
+        if hasattr(entity, 'deleted') and entity.deleted:
+            self.clear_entity(entity.entity_id)
+            return
+        with self._lock:
+            self.entities[entity.entity_id] = entity
+            self.dirty[entity.entity_id] = entity
+            self.deleted.discard(entity.entity_id)
+
+    def clear_entity(self, entity_id):
+        """Drop the entity from the working set, it is removed from the cache and database on flush"""
+        with self._lock:
+            self.entities.pop(entity_id, None)
+            self.dirty.pop(entity_id, None)
+            self.deleted.add(entity_id)
+
+    def flush(self):
+        """
+        Write the touched entities to the cache in one batch, apply the deletions and broadcast the result.
+
+        :return: ids of the entities written
+        """
+        with self._lock:
+            dirty = list(self.dirty.values())
+            deleted = list(self.deleted)
+            self.dirty = {}
+            self.deleted = set()
+
+        if dirty:
+            self.cache_service.set_entities(dirty)
+        for entity in dirty:
+            self.broadcast_buffer.add(entity)
+        for entity_id in deleted:
+            super().clear_entity(entity_id)
+        # Send the whole batch now instead of waiting for the broadcast window
+        self.broadcast_buffer.flush()
+
+        logger.info(f"Flushed working set: {len(dirty)} entities written, {len(deleted)} deleted")
+        return [entity.entity_id for entity in dirty]
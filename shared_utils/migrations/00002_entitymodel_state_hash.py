@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_utils', '00001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='entitymodel',
+            name='state_hash',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
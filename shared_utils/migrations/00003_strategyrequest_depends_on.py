@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_utils', '00002_entitymodel_state_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='strategyrequest',
+            name='depends_on',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
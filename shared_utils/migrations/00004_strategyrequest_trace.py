@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shared_utils', '00003_strategyrequest_depends_on'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='strategyrequest',
+            name='trace',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
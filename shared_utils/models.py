@@ -29,6 +29,8 @@ class StrategyRequest(EntityModel):
     )
 
     add_to_history = models.BooleanField(default=True)  # Should this be in the top-level strategy history?
+    depends_on = models.JSONField(default=list, blank=True)  # Ids of sibling nested requests executed before this one
+    trace = models.JSONField(null=True, blank=True)  # Span tree of the last execution, see StrategyTracer
 
     def clean(self):
         """Enforce validation logic to prevent circular references and conflicting roles."""
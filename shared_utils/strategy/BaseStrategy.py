@@ -9,6 +9,8 @@ import numpy as np
 from tslearn.clustering import TimeSeriesKMeans
 import requests
 from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.ExecutionClass import ExecutionClass
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
 import inspect
 import logging
@@ -19,19 +21,45 @@ class Strategy(ABC):
 
     strategy_description = 'This is the base strategy class'
 
+    # Strategies whose changes can't be merged with concurrent saves of the same entity (see
+    # CacheService.set_entities) set this to run while holding the entity lock
+    exclusive = False
+
+    # Where execute_request runs the strategy outside a Celery task. Cheap metadata strategies run inline in
+    # the calling process instead of paying for the broker and result backend round trip
+    execution_class = ExecutionClass.CELERY
+
+    # Celery queue of the strategy and its priority in that queue (0 is highest, None for the queue default)
+    queue = StrategyQueue.CPU
+    priority = None
+
+    # Strategies whose only effect is setting output_attributes from input_attributes and param_config set
+    # cacheable, so re-running them on unchanged inputs restores the outputs (see StrategyResultCache)
+    cacheable = False
+    input_attributes = []
+    output_attributes = []
+
     logger = logging.getLogger(__name__)
     
     def __init__(self, strategy_executor, strategy_request: StrategyRequestEntity):
         self.strategy_request = strategy_request
         self.strategy_executor = strategy_executor
-        self.entity_service = EntityService()
-        self.executor_service = StrategyExecutorService()
+        # Strategies run by StrategyExecutorService share its services instead of building their own
+        if isinstance(strategy_executor, StrategyExecutorService):
+            self.executor_service = strategy_executor
+        else:
+            self.executor_service = StrategyExecutorService()
+        self.entity_service = self.executor_service.entity_service
 
     @abstractmethod
     def apply(self, entity):
         """Apply the strategy to the entity."""
         pass
 
+    def report_progress(self, progress, message=None):
+        """Publish the progress of this strategy (0 to 1) to the websocket clients"""
+        self.executor_service.result_stream.publish_progress(self.strategy_request, progress, message)
+
     def verify_executable(self, entity, strategy_request):
         """Base implementation that can be overridden by child classes"""
         return True
@@ -53,6 +81,7 @@ class GetEntityStrategy(Strategy):
     """Generic strategy for getting an entity from anywhere (cache, db, etc.)"""
 
     strategy_description = 'Retrieves an entity from the cache'
+    execution_class = ExecutionClass.INLINE
 
     def verify_executable(self, entity, strategy_request):
         pass
@@ -69,13 +98,13 @@ class GetEntityStrategy(Strategy):
 class SaveEntityStrategy(Strategy):
     """Generic strategy for saving an entity to anywhere (cache, db, etc.)"""
     strategy_description = 'Saves an entity to the cache'
+    execution_class = ExecutionClass.INLINE
 
     def verify_executable(self, entity, strategy_request):
         pass
 
     def apply(self, entity: Entity) -> StrategyRequestEntity:
-        entity_service = EntityService()
-        entity_service.save_entity(entity)
+        self.entity_service.save_entity(entity)
 
         return self.strategy_request
 
@@ -85,6 +114,7 @@ class SaveEntityStrategy(Strategy):
 
 class CreateEntityStrategy(Strategy):
     """Generic strategy for creating any entity type"""
+    queue = StrategyQueue.INTERACTIVE
     strategy_description = 'Creates a new entity and adds it as a child to the parent entity'
     
     def verify_executable(self, entity, strategy_request):
@@ -164,6 +194,7 @@ class AssignAttributesStrategy(Strategy):
     """Generic strategy for assigning attributes between entities"""
 
     strategy_description = 'Assigns attributes from parent to child entity based on mapping'
+    execution_class = ExecutionClass.INLINE
         
     def verify_executable(self, entity, strategy_request):
         config = strategy_request.param_config
@@ -212,6 +243,7 @@ class GetAttributesStrategy(Strategy):
     """Generic strategy for getting attributes from an entity"""
 
     strategy_description = 'Retrieves attributes from an entity and stores them in the request'
+    execution_class = ExecutionClass.INLINE
 
     def verify_executable(self, entity, strategy_request):
         return 'attribute_names' in strategy_request.param_config
@@ -243,6 +275,7 @@ class SetAttributesStrategy(Strategy):
     """Generic strategy for setting attributes on an entity"""
 
     strategy_description = 'Sets attributes on an entity'
+    execution_class = ExecutionClass.INLINE
 
 
     def verify_executable(self, entity, strategy_request):
@@ -276,6 +309,7 @@ class AddChildStrategy(Strategy):
     """Generic strategy for adding a child entity to its parent"""
 
     strategy_description = 'Adds a child entity to its parent'
+    execution_class = ExecutionClass.INLINE
 
     def apply(self, entity: Entity) -> StrategyRequestEntity:
         child_id = self.strategy_request.param_config.get('child_id')
@@ -298,6 +332,7 @@ class RemoveChildStrategy(Strategy):
     """Generic strategy for removing a child entity from its parent"""
 
     strategy_description = 'Removes a child entity from its parent'
+    execution_class = ExecutionClass.INLINE
 
     def apply(self, entity: Entity) -> StrategyRequestEntity:
 
@@ -318,6 +353,7 @@ class RemoveChildStrategy(Strategy):
 
 class UpdateChildrenStrategy(Strategy):
     """Generic strategy for updating all children of an entity"""
+    queue = StrategyQueue.INTERACTIVE
 
     strategy_description = 'Updates all children of an entity'
 
@@ -343,11 +379,10 @@ class ExecuteRequestChildren(Strategy):
         children = entity.get_children()
         request_child_ids = self.entity_service.get_children_ids_by_type(entity, EntityEnum.STRATEGY_REQUEST)
 
-        for child in children:
-            if child in request_child_ids:
-                request = self.entity_service.get_entity(child)
-                request = self.executor_service.execute_request(request)
-                self.entity_service.save_entity(request)
+        # Child requests on different targets without dependencies between them run concurrently
+        requests = [self.entity_service.get_entity(child) for child in children if child in request_child_ids]
+        for request in self.executor_service.execute_requests(requests):
+            self.entity_service.save_entity(request)
 
         return self.strategy_request
 
@@ -362,6 +397,7 @@ class ExecuteRequestChildren(Strategy):
 
 class RemoveEntityStrategy(Strategy):
     """Generic strategy for removing an entity"""
+    queue = StrategyQueue.INTERACTIVE
 
     strategy_description = 'Removes an entity from the parent entity'
 
@@ -390,6 +426,7 @@ class RemoveEntityStrategy(Strategy):
 
 class MergeEntitiesStrategy(Strategy):
     """Generic strategy for merging multiple entities"""
+    queue = StrategyQueue.INTERACTIVE
 
     strategy_description = 'Merges multiple entities into the single parent entity'
 
@@ -553,6 +590,7 @@ class RetreiveSequencesStrategy(Strategy):
     API call used by Get_Sequence_Sets. The data is stored as-is (list order
     matching the input IDs) in an entity attribute defined by 'target_attribute_name'.
     """
+    queue = StrategyQueue.IO
 
     entity_type = EntityEnum.ENTITY  # Adjust if necessary
 
@@ -716,6 +754,8 @@ class HTTPGetRequestStrategy(Strategy):
     """
 
     entity_type = EntityEnum.ENTITY  # Adjust if necessary
+    execution_class = ExecutionClass.THREAD
+    queue = StrategyQueue.IO
 
     def __init__(self, strategy_executor, strategy_request: StrategyRequestEntity):
         super().__init__(strategy_executor, strategy_request)
@@ -0,0 +1,8 @@
+from enum import Enum
+
+
+class ExecutionClass(Enum):
+    """Where StrategyExecutorService.execute_request runs a strategy when called outside a Celery task"""
+    INLINE = 'inline'  # In the calling web/ASGI process, blocking the caller
+    THREAD = 'thread'  # On the process-wide strategy thread pool, for I/O bound strategies
+    CELERY = 'celery'  # On a Celery worker
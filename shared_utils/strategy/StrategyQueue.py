@@ -0,0 +1,9 @@
+from enum import Enum
+
+
+class StrategyQueue(Enum):
+    """Celery queue a strategy is routed to, each served by its own workers (see STRATEGY_QUEUES in settings)"""
+    INTERACTIVE = 'interactive'  # Short requests from the UI that someone is waiting on
+    IO = 'io'  # Sequence fetches, scraping and external API calls, mostly waiting on the network or database
+    CPU = 'cpu'  # Array building, scaling and other heavy computation
+    TRAINING = 'training'  # Model training, which can run for hours
@@ -6,9 +6,11 @@ from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 from shared_utils.entities.VisualizationTypeEnum import VisualizationTypeEnum
 from shared_utils.strategy_executor.StrategyExecutor import StrategyExecutor
 from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 import numpy as np
 
 class VisualizationStrategy(Strategy):
+    queue = StrategyQueue.INTERACTIVE
     entity_type = EntityEnum.VISUALIZATION
 
     def __init__(self, strategy_executor: 'StrategyExecutor', strategy_request: 'StrategyRequestEntity'):
@@ -1,21 +1,93 @@
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 from shared_utils.entities.service.EntityService import EntityService
-from shared_utils.strategy_executor.service.strategy_directory.StrategyDirectory import StrategyDirectory
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import get_strategy_registry
+from shared_utils.strategy_executor.service.StrategyRequestGraph import StrategyRequestGraph
+from shared_utils.strategy_executor.service.StrategyResultCache import StrategyResultCache
+from shared_utils.strategy_executor.service.StrategyResultStream import StrategyResultStream
+from shared_utils.strategy_executor.service.StrategyTracer import StrategyTracer
+from shared_utils.strategy.ExecutionClass import ExecutionClass
+from shared_utils.strategy.StrategyQueue import StrategyQueue
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from celery import current_task
+from django.conf import settings
+from django.db import close_old_connections, connections
+import contextvars
 import logging
+import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+_thread_pool = None
+_thread_pool_pid = None
+_thread_pool_lock = threading.Lock()
+
+_request_pool = None
+_request_pool_pid = None
+_request_pool_thread = threading.local()
+
+
+def get_strategy_thread_pool():
+    """Get the pool running ExecutionClass.THREAD strategies in the current process, creating it on first use"""
+    global _thread_pool, _thread_pool_pid
+    pid = os.getpid()
+    if _thread_pool is None or _thread_pool_pid != pid:
+        with _thread_pool_lock:
+            if _thread_pool is None or _thread_pool_pid != pid:
+                _thread_pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'STRATEGY_THREAD_POOL_WORKERS', 4),
+                    thread_name_prefix='strategy-io',
+                )
+                _thread_pool_pid = pid
+    return _thread_pool
+
+
+def get_request_pool():
+    """
+    Get the pool running the concurrent requests of execute_requests in the current process. Shared by every
+    call, so STRATEGY_EXECUTOR_MAX_WORKERS bounds the threads of the whole process.
+    """
+    global _request_pool, _request_pool_pid
+    pid = os.getpid()
+    if _request_pool is None or _request_pool_pid != pid:
+        with _thread_pool_lock:
+            if _request_pool is None or _request_pool_pid != pid:
+                _request_pool = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'STRATEGY_EXECUTOR_MAX_WORKERS', 4),
+                    thread_name_prefix='strategy',
+                )
+                _request_pool_pid = pid
+    return _request_pool
+
+
+def is_request_pool_thread():
+    return getattr(_request_pool_thread, 'active', False)
 
 
 class StrategyExecutorService:
-    def __init__(self):
-        self.entity_service = EntityService()
-        self.strategies = {}
-        self.register_strategies(StrategyDirectory().get_strategy_classes())
+    def __init__(self, *, entity_service=None, registry=None, synchronous=False):
+        """
+        :param entity_service: shared EntityService, a new one is created when not given
+        :param registry: StrategyRegistry to resolve strategy names with, the process-wide one by default
+        :param synchronous: run every request in the calling process as if inside a task, used for batches
+            whose working set is not visible to other workers
+        """
+        self.entity_service = entity_service or EntityService()
+        self.registry = registry or get_strategy_registry()
+        self.strategies = self.registry.strategies
+        self.synchronous = synchronous
+        self.result_cache = StrategyResultCache()
+        self.result_stream = StrategyResultStream(self.entity_service)
 
-    def execute(self, entity, strategy_request):
-        """Execute a strategy on an entity after resolving its path"""
+    def execute(self, entity, strategy_request, locked=False):
+        """
+        Execute a strategy on an entity after resolving its path
+
+        :param locked: the caller already holds the lock of the entity (see execute_locked)
+
+        A top-level execution records a span tree of itself and its nested strategies (see StrategyTracer)
+        in the trace of the request.
+        """
 
         logger.info(f"Executing strategy {strategy_request.strategy_name} on entity {entity.entity_id}")
         strategy_name = strategy_request.strategy_name
@@ -23,53 +95,288 @@ class StrategyExecutorService:
         if not strategy_cls:
             raise ValueError(f"Strategy {strategy_name} is not registered.")
 
-        # Create and execute the strategy
-        strategy = strategy_cls(self, strategy_request)
-        strat_request = strategy.apply(entity)  # Store the result in the variable
+        root = StrategyTracer.current() is None
+        with StrategyTracer.span(strategy_name, 'strategy', root=True, request_id=strategy_request.entity_id,
+                                 entity_id=entity.entity_id) as span:
+            trace_span = span if root else None
+            # Create and execute the strategy
+            strategy = strategy_cls(self, strategy_request)
+            if getattr(strategy_cls, 'exclusive', False) and not locked:
+                with self.entity_service.entity_lock(entity.entity_id):
+                    strat_request = self.apply_strategy(strategy, entity, trace_span)
+            else:
+                strat_request = self.apply_strategy(strategy, entity, trace_span)
+
+        if trace_span is not None:
+            # The returned request gets the whole trace, the saved one ends before the final saves
+            strat_request.trace = trace_span.to_dict()
+
+        logger.info(f"Strategy {strategy_name} executed successfully")
+
+        return strat_request
+
+    def apply_strategy(self, strategy, entity, trace_span=None):
+        """
+        Apply a strategy and save the entity and the request. Cacheable strategies whose inputs were seen
+        before get their outputs restored from the result cache instead of running apply.
+
+        :param trace_span: root span of the execution, its trace so far is saved with the request
+        """
+        with StrategyTracer.span('result_cache', 'cache'):
+            result_key = self.result_cache.key_for(strategy, entity)
+            restored = result_key is not None and self.result_cache.restore(result_key, entity)
+        if restored:
+            logger.info(f"Restored cached result of {strategy.strategy_request.strategy_name} on entity {entity.entity_id}")
+            strat_request = strategy.strategy_request
+            strat_request.ret_val['result_cache_hit'] = True
+        else:
+            with StrategyTracer.span('apply', 'compute'):
+                strat_request = strategy.apply(entity)  # Store the result in the variable
+            if result_key is not None:
+                with StrategyTracer.span('result_cache_store', 'cache'):
+                    self.result_cache.store(result_key, strategy, entity)
 
         if 'entity' in strat_request.ret_val:
             entity = strat_request.ret_val['entity']
 
         if strat_request.add_to_history:
+            if trace_span is not None:
+                strat_request.trace = trace_span.to_dict()
             entity.update_strategy_requests(strat_request)
             self.entity_service.save_entity(strat_request)
 
 
         self.entity_service.save_entity(entity)
 
-        logger.info(f"Strategy {strategy_name} executed successfully")
-
         return strat_request
 
     def execute_request(self, strategy_request: StrategyRequestEntity, wait: bool = True):
         """
-        Enqueue a strategy request as a Celery task when called from outside a task.
+        Run a strategy request where its strategy's execution_class says when called from outside a task:
+        inline in this process, on the strategy thread pool or as a Celery task.
         If called from within a task (i.e. a nested call), run the strategy synchronously.
 
-        If wait is True, then wait for the result (if offloaded via Celery);
-        if wait is False, return immediately with the AsyncResult.
+        If wait is True, then wait for the result (if offloaded to a thread or Celery);
+        if wait is False, return immediately with the Future or AsyncResult. Inline strategies always
+        return the executed request. Celery tasks return a handle (see StrategyResultStream), the
+        executed request is then loaded from the cache.
         """
-        target_entity = self.entity_service.get_entity(strategy_request.target_entity_id)
-        if target_entity is None:
-            raise ValueError(f'Entity not found for id: {strategy_request.target_entity_id}')
         # Check if we're already inside a Celery task.
-        if self.is_running_in_task():
+        if self.synchronous or self.is_running_in_task():
+            target_entity = self.entity_service.get_entity(strategy_request.target_entity_id)
             # Already inside a task, so run synchronously.
             logger.info("Running strategy synchronously")
             return self.execute(target_entity, strategy_request)
+
+        execution_class = self.get_execution_class(strategy_request.strategy_name)
+        if execution_class == ExecutionClass.INLINE:
+            logger.info(f"Running strategy {strategy_request.strategy_name} inline")
+            return self.execute_locked(strategy_request)
+        elif execution_class == ExecutionClass.THREAD:
+            logger.info(f"Running strategy {strategy_request.strategy_name} on the strategy thread pool")
+            # The copied context carries the current trace span into the pool thread
+            context = contextvars.copy_context()
+            future = get_strategy_thread_pool().submit(context.run, self.execute_in_thread, strategy_request)
+            if wait:
+                return future.result(timeout=600)
+            return future
         else:
-            # Not inside a task; offload execution as a new Celery task.
-            from shared_utils.tasks import execute_strategy_request  # Import our Celery task.
-            logger.info("Offloading strategy execution to Celery")
+            # Fail before queueing when the target does not exist
+            self.entity_service.get_entity(strategy_request.target_entity_id)
+            # Not inside a task; offload execution as a new Celery task on the strategy's queue.
+            from shared_utils.tasks import QUEUE_TASKS  # Import our Celery tasks.
+            queue, priority = self.get_routing(strategy_request.strategy_name)
+            logger.info(f"Offloading strategy execution to Celery queue {queue.value} with priority {priority}")
             # If needed, serialize the strategy_request (e.g., using to_dict) for safe transport.
-            task = execute_strategy_request.delay(strategy_request)
+            task = QUEUE_TASKS[queue].apply_async((strategy_request,), priority=priority)
             if wait:
                 # For callers that need the result, wait for the task to complete.
-                result = task.get(timeout=600)
+                with StrategyTracer.span(f"wait {strategy_request.strategy_name}", 'dispatch', queue=queue.value,
+                                         priority=priority):
+                    result = task.get(timeout=600)
+                if self.result_stream.is_handle(result):
+                    return self.result_stream.from_handle(result)
                 return result
             else:
                 return task
 
+    def execute_locked(self, strategy_request: StrategyRequestEntity):
+        """
+        Execute a request while holding the lock of its target entity. The entity is loaded after the lock
+        is taken, so concurrent inline requests on one entity apply their changes one after another.
+        """
+        with self.entity_service.entity_lock(strategy_request.target_entity_id):
+            target_entity = self.entity_service.get_entity(strategy_request.target_entity_id)
+            return self.execute(target_entity, strategy_request, locked=True)
+
+    def execute_in_thread(self, strategy_request: StrategyRequestEntity):
+        """Run a request on a pool thread, which gets its own database connection"""
+        close_old_connections()
+        try:
+            return self.execute_locked(strategy_request)
+        finally:
+            close_old_connections()
+
+    def get_execution_class(self, strategy_name) -> ExecutionClass:
+        strategy_cls = self.strategies.get(strategy_name)
+        if not strategy_cls:
+            raise ValueError(f"Strategy {strategy_name} is not registered.")
+        return ExecutionClass(getattr(strategy_cls, 'execution_class', ExecutionClass.CELERY))
+
+    def get_routing(self, strategy_name):
+        """(StrategyQueue, priority) of a strategy. Strategies without a priority get their queue's default"""
+        strategy_cls = self.strategies.get(strategy_name)
+        if not strategy_cls:
+            raise ValueError(f"Strategy {strategy_name} is not registered.")
+        queue = StrategyQueue(getattr(strategy_cls, 'queue', StrategyQueue.CPU))
+        priority = getattr(strategy_cls, 'priority', None)
+        if priority is None:
+            queue_config = getattr(settings, 'STRATEGY_QUEUES', {}).get(queue.value, {})
+            priority = queue_config.get('priority', 5)
+        return queue, priority
+
+    def execute_requests(self, strategy_requests, entity=None, max_workers=None):
+        """
+        Execute sibling strategy requests, running independent ones concurrently.
+
+        The requests form a StrategyRequestGraph: a request waits for the requests in its depends_on and for
+        earlier requests on the same target entity, so changes to a shared parent are applied one at a time
+        on its latest saved state. Independent requests run on the process-wide request pool. Inside a Celery
+        task they are executed in the pool threads directly; outside one each thread offloads its request to
+        Celery and waits for the result.
+
+        Requests run one after another in the calling thread when the graph is a chain (e.g. every request
+        targets the same parent) or when called from a pool thread, so nested execute_requests calls neither
+        multiply threads nor wait on the pool they occupy.
+
+        :param entity: in-memory target entity. Requests targeting it (or with no target) are applied to this
+            object instead of a copy loaded from the cache, so the caller sees their changes.
+        :param max_workers: maximum number of concurrent requests of this call, STRATEGY_EXECUTOR_MAX_WORKERS
+            by default. The pool size bounds all calls together.
+        :return: the executed requests, in the order given
+        """
+        if entity is not None:
+            for strategy_request in strategy_requests:
+                if strategy_request.target_entity_id is None:
+                    strategy_request.target_entity_id = entity.entity_id
+        graph = StrategyRequestGraph(strategy_requests)
+        if not graph.ids:
+            return []
+        max_workers = max_workers or getattr(settings, 'STRATEGY_EXECUTOR_MAX_WORKERS', 4)
+        in_task = self.synchronous or self.is_running_in_task()
+
+        def run(strategy_request):
+            target_id = strategy_request.target_entity_id
+            if entity is not None and target_id == entity.entity_id:
+                return self.execute(entity, strategy_request)
+            if in_task:
+                # Celery's current task is thread-local, so the pool threads can't detect it themselves
+                return self.execute(self.entity_service.get_entity(target_id), strategy_request)
+            return self.execute_request(strategy_request)
+
+        results = {}
+        remaining = {request_id: len(dependencies) for request_id, dependencies in graph.dependencies.items()}
+        if max_workers <= 1 or graph.is_chain() or is_request_pool_thread():
+            for request_id in graph.order:
+                results[request_id] = run(graph.get_request(request_id))
+            return [results[request_id] for request_id in graph.ids]
+
+        pool = get_request_pool()
+        ready = list(graph.roots())
+        running = {}
+        while ready or running:
+            while ready and len(running) < max_workers:
+                request_id = ready.pop(0)
+                # Each submission runs in a copy of this context, so nested spans attach to the calling strategy
+                future = pool.submit(contextvars.copy_context().run, self.run_on_pool_thread, run,
+                                     graph.get_request(request_id))
+                running[future] = request_id
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                request_id = running.pop(future)
+                try:
+                    results[request_id] = future.result()
+                except Exception:
+                    for pending in running:
+                        pending.cancel()
+                    raise
+                for dependent in graph.dependents[request_id]:
+                    remaining[dependent] -= 1
+                    if remaining[dependent] == 0:
+                        ready.append(dependent)
+
+        logger.info(f"Executed {len(results)} strategy requests with up to {max_workers} workers")
+        return [results[request_id] for request_id in graph.ids]
+
+    @staticmethod
+    def run_on_pool_thread(run, strategy_request):
+        """Run a request on a request pool thread, which gets its own database connection"""
+        _request_pool_thread.active = True
+        close_old_connections()
+        try:
+            return run(strategy_request)
+        finally:
+            _request_pool_thread.active = False
+            # Pool threads live as long as the process, their connections are not reused between requests
+            connections.close_all()
+
+    def execute_batch(self, strategy_requests):
+        """
+        Execute an ordered list of requests in this process on a shared working set of entities.
+
+        Every request sees the changes of the ones before it without going through the cache. The touched
+        entities are written to the cache once, after the last request, with one coalesced broadcast. If a
+        request fails nothing is written.
+
+        :return: (executed requests, ids of the entities written)
+        """
+        # Imported here as the working set service depends on EntityService
+        from shared_utils.entities.service.WorkingSetEntityService import WorkingSetEntityService
+        working_set = WorkingSetEntityService()
+        batch_executor = StrategyExecutorService(entity_service=working_set, registry=self.registry, synchronous=True)
+        batch_executor.strategies = self.strategies
+
+        results = []
+        for index, strategy_request in enumerate(strategy_requests):
+            try:
+                target_entity = working_set.get_entity(strategy_request.target_entity_id)
+                results.append(batch_executor.execute(target_entity, strategy_request))
+            except Exception as e:
+                raise ValueError(f"Batch request {index} ({strategy_request.strategy_name}) failed: {e}") from e
+        entity_ids = working_set.flush()
+
+        logger.info(f"Executed batch of {len(results)} strategy requests, wrote {len(entity_ids)} entities")
+        return results, entity_ids
+
+    def execute_batch_request(self, strategy_requests, wait: bool = True):
+        """
+        Run an ordered list of requests as one batch: directly when inside a task, otherwise as a single Celery
+        task on the queue of its heaviest request.
+
+        If wait is True return the executed requests, otherwise the AsyncResult of the task.
+        """
+        if not strategy_requests:
+            return []
+        if self.synchronous or self.is_running_in_task():
+            return self.execute_batch(strategy_requests)[0]
+
+        # Fails before queueing on unknown strategies
+        queue, priority = self.get_batch_routing(strategy_requests)
+
+        from shared_utils.tasks import execute_strategy_batch
+        logger.info(f"Offloading batch of {len(strategy_requests)} strategy requests to Celery queue {queue.value}")
+        task = execute_strategy_batch.apply_async((strategy_requests,), queue=queue.value, priority=priority)
+        if not wait:
+            return task
+        with StrategyTracer.span('wait batch', 'dispatch', queue=queue.value, priority=priority):
+            handle = task.get(timeout=600)
+        return self.result_stream.from_batch_handle(handle)
+
+    def get_batch_routing(self, strategy_requests):
+        """Routing of a batch: the queue and priority of its lowest priority request"""
+        routes = [self.get_routing(strategy_request.strategy_name) for strategy_request in strategy_requests]
+        return max(routes, key=lambda route: route[1])
+
     @staticmethod
     def is_running_in_task():
         # current_task.request is available even when not in a task, so check its id.
@@ -77,17 +384,15 @@ class StrategyExecutorService:
 
 
     def register_strategies(self, directory):
-        for entity, strategies in directory.items():
-            for strategy in strategies:
-                self.strategies[strategy.__name__] = strategy
+        """Register extra strategies on this service only. The shared registry is left unchanged"""
+        strategies = dict(self.strategies)
+        for entity, strategies_of_entity in directory.items():
+            for strategy in strategies_of_entity:
+                strategies[strategy.__name__] = strategy
+        self.strategies = strategies
 
     def get_registry(self):
-        serialized_registry = {}
-        for entity, strategies in StrategyDirectory().get_strategy_classes().items():
-            if entity not in serialized_registry:
-                serialized_registry[entity] = []
-            serialized_registry[entity] += [s.serialize() for s in strategies]
-        return serialized_registry
+        return self.registry.serialize()
 
 
 
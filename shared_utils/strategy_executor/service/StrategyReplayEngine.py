@@ -0,0 +1,225 @@
+import logging
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# Reading or writing every attribute of an entity, for strategies that don't declare their attributes
+ALL_ATTRIBUTES = '*'
+ID_PARAM_SUFFIXES = ('_id', '_ids', '_uuid')
+
+
+class ReplayPlan:
+    """Recorded requests in execution order, with the requests that have to run again"""
+
+    def __init__(self, order: List[str], dependencies: Dict[str, Set[str]], dirty: Set[str]):
+        self.order = order
+        self.dependencies = dependencies
+        self.dirty = dirty
+        # Dirty requests not executed because their target entity no longer exists
+        self.skipped = set()
+
+    def dirty_requests(self) -> List[str]:
+        """Ids of the requests to execute again, in execution order"""
+        return [request_id for request_id in self.order if request_id in self.dirty]
+
+    def reused_requests(self) -> List[str]:
+        """Ids of the requests whose outputs are kept"""
+        return [request_id for request_id in self.order if request_id not in self.dirty]
+
+
+class StrategyReplayEngine:
+    """
+    Incremental replay of the strategy history recorded on an entity (see Entity.strategy_requests).
+
+    Each request reads and writes (entity, attribute) pairs: the attributes its strategy declares in
+    input_attributes and output_attributes on the target entity, or every attribute of the target entity
+    and of the entities named in its param_config (entity_uuid, child_id, ...) when the strategy declares
+    nothing. A request depends on the earlier requests that write what it reads or writes, so changing
+    a request invalidates exactly the requests downstream of it. Only that dirty frontier is executed
+    again; everything else keeps the outputs already stored on the entities.
+    """
+
+    def __init__(self, executor_service):
+        self.executor_service = executor_service
+        self.entity_service = executor_service.entity_service
+
+    def plan(self, strategy_requests, changed_request_ids=None, rebuild=False) -> ReplayPlan:
+        """
+        Order the recorded requests and find the ones invalidated by the changed requests
+
+        :param changed_request_ids: ids of requests whose param_config changed
+        :param rebuild: run every request again, for state that was lost. Cacheable strategies still
+            restore their outputs from the StrategyResultCache when their inputs are unchanged.
+        """
+        requests = self.order_requests(strategy_requests)
+        order = [request.entity_id for request in requests]
+        dependencies = self.build_dependencies(requests)
+
+        if rebuild:
+            return ReplayPlan(order, dependencies, set(order))
+
+        seeds = set(changed_request_ids or [])
+        unknown = seeds - set(order)
+        if unknown:
+            raise ValueError(f"Strategy requests not in history: {sorted(unknown)}")
+        seeds |= self.missing_target_requests(requests)
+
+        dependents = defaultdict(set)
+        for request_id, request_dependencies in dependencies.items():
+            for dependency in request_dependencies:
+                dependents[dependency].add(request_id)
+
+        dirty = set()
+        frontier = list(seeds)
+        while frontier:
+            request_id = frontier.pop()
+            if request_id in dirty:
+                continue
+            dirty.add(request_id)
+            frontier.extend(dependents[request_id])
+
+        return ReplayPlan(order, dependencies, dirty)
+
+    def replay(self, entity, param_changes: Optional[Dict[str, dict]] = None, rebuild=False) -> ReplayPlan:
+        """
+        Apply param changes to recorded requests of an entity and execute the invalidated requests again
+
+        :param param_changes: request id -> param_config values to update
+        :return: the executed plan
+        """
+        return self.replay_entities({entity.entity_id: entity}, param_changes, rebuild)
+
+    def replay_subtree(self, root_entity, param_changes: Optional[Dict[str, dict]] = None, rebuild=False) -> ReplayPlan:
+        """
+        Replay the histories of an entity and all of its descendants as one plan. Requests are recorded on
+        the entities they ran on, so the history of a session is spread over its subtree.
+        """
+        entities = self.entity_service.load_subtree(root_entity.entity_id, use_cache=True)
+        entities[root_entity.entity_id] = root_entity
+        return self.replay_entities(entities, param_changes, rebuild)
+
+    def replay_entities(self, entities: Dict[str, object], param_changes: Optional[Dict[str, dict]] = None,
+                        rebuild=False) -> ReplayPlan:
+        """
+        Plan the recorded requests of the given entities (entity id -> entity) together and execute the
+        invalidated ones
+        """
+        param_changes = param_changes or {}
+        strategy_requests = []
+        owners = {}
+        for entity_id, entity in entities.items():
+            for request in entity.strategy_requests:
+                if request.entity_id not in owners:
+                    owners[request.entity_id] = entity_id
+                    strategy_requests.append(request)
+        by_id = {request.entity_id: request for request in strategy_requests}
+        # Checked before any request is changed, so a bad call leaves the history as it was
+        unknown = [request_id for request_id in param_changes if request_id not in by_id]
+        if unknown:
+            raise ValueError(f"Strategy requests {unknown} not in history of entities {sorted(entities)}")
+
+        for request in strategy_requests:
+            if request.target_entity_id is None:
+                # Requests recorded without a target ran on the entity holding them
+                request.target_entity_id = owners[request.entity_id]
+        for request_id, changes in param_changes.items():
+            by_id[request_id].param_config.update(changes)
+
+        plan = self.plan(strategy_requests, param_changes.keys(), rebuild)
+
+        # Requests on deleted entities have nothing to run on. Their outputs are gone with the entity, the
+        # requests depending on them still run on the entities that exist
+        target_ids = {by_id[request_id].target_entity_id for request_id in plan.dirty} - set(entities)
+        missing = target_ids - self.existing_entity_ids(target_ids)
+        plan.skipped = {request_id for request_id in plan.dirty if by_id[request_id].target_entity_id in missing}
+        if plan.skipped:
+            logger.warning(f"Skipping strategy requests {sorted(plan.skipped)}, their target entities "
+                           f"{sorted(missing)} no longer exist")
+        logger.info(f"Replaying {len(plan.dirty) - len(plan.skipped)} of {len(plan.order)} strategy requests on "
+                    f"{len(entities)} entities")
+
+        for request_id in plan.dirty_requests():
+            if request_id in plan.skipped:
+                continue
+            request = by_id[request_id]
+            target = entities.get(request.target_entity_id)
+            if target is None:
+                target = self.entity_service.get_entity(request.target_entity_id)
+            self.executor_service.execute(target, request)
+
+        return plan
+
+    @staticmethod
+    def order_requests(strategy_requests):
+        """Recorded requests in the order they were first executed"""
+        strategy_requests = list(strategy_requests)
+        if all(request.created_at is not None for request in strategy_requests):
+            # Requests loaded from the database are ordered by creation, sorted() keeps ties in place
+            return sorted(strategy_requests, key=lambda request: request.created_at)
+        return strategy_requests
+
+    def build_dependencies(self, requests) -> Dict[str, Set[str]]:
+        dependencies = {}
+        writers = defaultdict(list)  # entity id -> [(request id, written attributes)]
+        for request in requests:
+            reads, writes = self.accesses(request)
+            touched = {entity_id: reads.get(entity_id, set()) | writes.get(entity_id, set())
+                       for entity_id in set(reads) | set(writes)}
+            request_dependencies = set()
+            for entity_id, attributes in touched.items():
+                for writer_id, written in writers[entity_id]:
+                    if self.overlaps(attributes, written):
+                        request_dependencies.add(writer_id)
+            dependencies[request.entity_id] = request_dependencies
+            for entity_id, attributes in writes.items():
+                writers[entity_id].append((request.entity_id, attributes))
+        return dependencies
+
+    def accesses(self, request):
+        """(entity id -> attributes read, entity id -> attributes written) of a request"""
+        strategy_cls = self.executor_service.strategies.get(request.strategy_name)
+        target = request.target_entity_id
+        input_attributes = getattr(strategy_cls, 'input_attributes', None)
+        output_attributes = getattr(strategy_cls, 'output_attributes', None)
+        if input_attributes or output_attributes:
+            return {target: set(input_attributes or [])}, {target: set(output_attributes or [])}
+
+        entity_ids = {target} | self.param_entity_ids(request.param_config)
+        return ({entity_id: {ALL_ATTRIBUTES} for entity_id in entity_ids},
+                {entity_id: {ALL_ATTRIBUTES} for entity_id in entity_ids})
+
+    @staticmethod
+    def param_entity_ids(param_config) -> Set[str]:
+        entity_ids = set()
+        for key, value in (param_config or {}).items():
+            if not key.endswith(ID_PARAM_SUFFIXES) or not value:
+                continue
+            if isinstance(value, (list, tuple)):
+                entity_ids.update(str(item) for item in value)
+            else:
+                entity_ids.add(str(value))
+        return entity_ids
+
+    @staticmethod
+    def overlaps(attributes, written) -> bool:
+        if not attributes or not written:
+            return False
+        return ALL_ATTRIBUTES in attributes or ALL_ATTRIBUTES in written or bool(attributes & written)
+
+    def missing_target_requests(self, requests) -> Set[str]:
+        """Requests touching entities that are gone from the cache and database, so their outputs are lost"""
+        touched = {}
+        for request in requests:
+            reads, writes = self.accesses(request)
+            touched[request.entity_id] = {entity_id for entity_id in set(reads) | set(writes) if entity_id}
+
+        entity_ids = set().union(*touched.values()) if touched else set()
+        missing = entity_ids - self.existing_entity_ids(entity_ids)
+        return {request_id for request_id, entity_ids in touched.items() if entity_ids & missing}
+
+    def existing_entity_ids(self, entity_ids) -> Set[str]:
+        """The entities in the cache or the database, of entity_ids"""
+        found = set(self.entity_service.load_entities_from_cache(list(entity_ids)).keys())
+        return found | {entity_id for entity_id in set(entity_ids) - found
+                        if self.entity_service.entity_exists_in_db(entity_id)}
@@ -0,0 +1,65 @@
+from collections import defaultdict
+from typing import Dict, List
+
+
+class StrategyRequestGraph:
+    """
+    Dependency graph of sibling strategy requests.
+
+    A request runs after the requests listed in its depends_on. Requests on the same target entity
+    also run one after another, in the order given, because each of them reads, changes and saves that
+    entity. Requests without a path between them can run at the same time. Dependencies on requests
+    outside the graph are treated as already done.
+    """
+
+    def __init__(self, requests):
+        self.requests = list(requests)
+        self.ids = [request.entity_id for request in self.requests]
+        self._by_id = dict(zip(self.ids, self.requests))
+        if len(set(self.ids)) != len(self.ids):
+            raise ValueError("Strategy requests in a graph must have unique ids")
+
+        known_ids = set(self.ids)
+        self.dependencies: Dict[str, List[str]] = {}
+        last_by_target = {}
+        for request in self.requests:
+            dependencies = [dependency for dependency in getattr(request, 'depends_on', []) if dependency in known_ids]
+            previous = last_by_target.get(request.target_entity_id)
+            if previous is not None and previous not in dependencies:
+                dependencies.append(previous)
+            last_by_target[request.target_entity_id] = request.entity_id
+            self.dependencies[request.entity_id] = dependencies
+
+        self.dependents = defaultdict(list)
+        for request_id, dependencies in self.dependencies.items():
+            for dependency in dependencies:
+                self.dependents[dependency].append(request_id)
+
+        self.order = self.topological_order()
+
+    def topological_order(self) -> List[str]:
+        remaining = {request_id: len(dependencies) for request_id, dependencies in self.dependencies.items()}
+        ready = [request_id for request_id in self.ids if remaining[request_id] == 0]
+        order = []
+        while ready:
+            request_id = ready.pop(0)
+            order.append(request_id)
+            for dependent in self.dependents[request_id]:
+                remaining[dependent] -= 1
+                if remaining[dependent] == 0:
+                    ready.append(dependent)
+
+        if len(order) != len(self.ids):
+            cycle = [request_id for request_id in self.ids if request_id not in set(order)]
+            raise ValueError(f"Strategy request dependencies contain a cycle: {cycle}")
+        return order
+
+    def is_chain(self) -> bool:
+        """Whether every request depends on the one before it, so no two requests can run at the same time"""
+        return all(previous in self.dependencies[request_id] for previous, request_id in zip(self.order, self.order[1:]))
+
+    def roots(self) -> List[str]:
+        return [request_id for request_id in self.ids if not self.dependencies[request_id]]
+
+    def get_request(self, request_id):
+        return self._by_id[request_id]
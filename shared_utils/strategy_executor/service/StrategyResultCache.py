@@ -0,0 +1,115 @@
+import hashlib
+import inspect
+import json
+import logging
+import pickle
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from shared_utils.cache.ArrayStore import ArrayStore
+from shared_utils.cache.AttributeReference import AttributeReference
+
+logger = logging.getLogger(__name__)
+
+RESULT_KEY_PREFIX = "strategy_result"
+
+# strategy class -> hash of its source, so editing a strategy invalidates its cached results
+_code_fingerprints = {}
+
+
+class StrategyResultCache:
+    """
+    Memoized results of strategies that declare the attributes they read and write.
+
+    A strategy opts in with cacheable = True and lists input_attributes and output_attributes. Its result
+    is keyed by the strategy name and source, the canonical param_config and the content fingerprints of
+    the input attributes. Array outputs are kept in the ArrayStore, so a hit only sets handles on the
+    entity and the arrays are memory-mapped when read. Strategies with side effects beyond their output
+    attributes (nested requests, other entities, external calls) must not opt in.
+    """
+
+    def __init__(self):
+        self.cache = cache
+        self.enabled = getattr(settings, 'STRATEGY_RESULT_CACHE_ENABLED', True)
+        self.timeout = getattr(settings, 'STRATEGY_RESULT_CACHE_TIMEOUT', None)
+        self.array_store = ArrayStore() if getattr(settings, 'ENTITY_ARRAY_STORE_ENABLED', True) else None
+
+    def key_for(self, strategy, entity):
+        """Get the result key of a strategy applied to an entity, None when the result can't be cached"""
+        strategy_cls = type(strategy)
+        if not self.enabled or not getattr(strategy_cls, 'cacheable', False):
+            return None
+        if not hasattr(entity, 'get_raw_attributes'):
+            return None
+
+        digest = hashlib.sha1(strategy_cls.__name__.encode())
+        digest.update(self.code_fingerprint(strategy_cls).encode())
+        digest.update(self.fingerprint(strategy.strategy_request.param_config).encode())
+        for name in strategy_cls.input_attributes:
+            digest.update(name.encode())
+            digest.update(self.attribute_fingerprint(entity, name).encode())
+        return f"{RESULT_KEY_PREFIX}:{digest.hexdigest()}"
+
+    def restore(self, key, entity) -> bool:
+        """Set the cached output attributes on the entity, returns False on a miss"""
+        outputs = self.cache.get(key)
+        if outputs is None:
+            return False
+        if any(isinstance(value, AttributeReference) and self.array_store is not None
+               and not self.array_store.exists(value.key) for value in outputs.values()):
+            # The array store was cleared since the result was cached
+            self.cache.delete(key)
+            return False
+
+        for name, value in outputs.items():
+            entity.set_attribute(name, value)
+        return True
+
+    def store(self, key, strategy, entity):
+        """Cache the output attributes a strategy set on the entity"""
+        outputs = {}
+        for name in type(strategy).output_attributes:
+            if not entity.has_attribute(name):
+                logger.warning(f"{type(strategy).__name__} did not set {name}, result not cached")
+                return
+            value = entity.get_raw_attributes()[name]
+            if self.array_store is not None and ArrayStore.can_store(value):
+                value = self.array_store.save(value)
+            outputs[name] = value
+        self.cache.set(key, outputs, self.timeout)
+
+    def attribute_fingerprint(self, entity, name):
+        if not entity.has_attribute(name):
+            return ''
+        value = entity.get_raw_attributes()[name]
+        if isinstance(value, AttributeReference):
+            # Stored attributes are keyed by their content, no need to load them
+            return value.key
+        reference = entity.get_attribute_references().get(name)
+        if reference is not None and name not in entity.get_dirty_attributes():
+            return reference.key
+        return self.fingerprint(value)
+
+    @staticmethod
+    def fingerprint(value):
+        if isinstance(value, np.ndarray) and not value.dtype.hasobject:
+            return ArrayStore.key_for(value)
+        try:
+            payload = json.dumps(value, sort_keys=True).encode()
+        except (TypeError, ValueError):
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        return hashlib.sha1(payload).hexdigest()
+
+    @staticmethod
+    def code_fingerprint(strategy_cls):
+        fingerprint = _code_fingerprints.get(strategy_cls)
+        if fingerprint is None:
+            try:
+                source = inspect.getsource(strategy_cls)
+            except (OSError, TypeError):
+                source = strategy_cls.__qualname__
+            fingerprint = hashlib.sha1(source.encode()).hexdigest()
+            _code_fingerprints[strategy_cls] = fingerprint
+        return fingerprint
@@ -0,0 +1,179 @@
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from shared_utils.entities.Entity import Entity
+
+logger = logging.getLogger(__name__)
+
+STRATEGY_EVENTS_GROUP = "strategy_events"
+RESULT_HANDLE_KEY_PREFIX = "strategy_result_handle"
+
+
+class EntityRef:
+    """Placeholder for an entity in a strategy result, read back from the shared cache by the caller"""
+    __slots__ = ('entity_id',)
+
+    def __init__(self, entity_id):
+        self.entity_id = entity_id
+
+    def __repr__(self):
+        return f"EntityRef({self.entity_id})"
+
+
+class StrategyResultStream:
+    """
+    Results and progress of strategy requests run on Celery workers, without pushing entities through the
+    result backend.
+
+    A worker stores the executed request under its own result key, with the entities in its ret_val (and in
+    its nested requests) replaced by EntityRefs, and returns only a small handle: request id, status and the
+    ids of the entities it changed. The entities themselves are already in the cache, written by the
+    strategy; only entities the strategy returned without saving are written. Callers waiting on the task
+    turn the handle back into the executed request with from_handle. The stored result expires after
+    STRATEGY_RESULT_HANDLE_TIMEOUT seconds; the request entity in the entity cache is left as it is.
+    Started, progress, completed and failed events are published on the channel layer group
+    STRATEGY_EVENTS_GROUP, which the global websocket forwards to the frontend.
+    """
+
+    def __init__(self, entity_service):
+        self.entity_service = entity_service
+        self.channel_layer = get_channel_layer()
+        self.timeout = getattr(settings, 'STRATEGY_RESULT_HANDLE_TIMEOUT', 3600)
+
+    def to_handle(self, strategy_request):
+        """Store an executed request in the cache and build the handle returned by the task"""
+        requests = self.collect_requests(strategy_request)
+        entities = self.detach_entities(requests)
+
+        unsaved = [entity for entity in entities.values() if self.is_unsaved(entity)]
+        if unsaved:
+            self.entity_service.cache_service.set_entities(unsaved)
+        # The nested requests are stored inside the root request
+        self.entity_service.cache_service.set(self.result_key(strategy_request.entity_id), strategy_request,
+                                              self.timeout)
+
+        entity_ids = [entity_id for entity_id, entity in entities.items() if not getattr(entity, 'deleted', False)]
+        return {
+            'request_id': strategy_request.entity_id,
+            'strategy_name': strategy_request.strategy_name,
+            'status': 'completed',
+            'target_entity_id': strategy_request.target_entity_id,
+            'entity_ids': entity_ids,
+        }
+
+    def to_batch_handle(self, strategy_requests, entity_ids):
+        """
+        Store the executed requests of a batch and build its handle. The entities were already written by the
+        batch's working set, so only the requests are stored here.
+        """
+        requests = [request for strategy_request in strategy_requests
+                    for request in self.collect_requests(strategy_request)]
+        detached = [entity_id for entity_id, entity in self.detach_entities(requests).items()
+                    if not getattr(entity, 'deleted', False)]
+        entity_ids = list(dict.fromkeys(list(entity_ids) + detached))
+        self.entity_service.cache_service.set_many(
+            {self.result_key(strategy_request.entity_id): strategy_request for strategy_request in strategy_requests},
+            self.timeout)
+        return {
+            'request_ids': [strategy_request.entity_id for strategy_request in strategy_requests],
+            'status': 'completed',
+            'entity_ids': entity_ids,
+        }
+
+    def from_batch_handle(self, handle):
+        """Load the executed requests of a batch handle from the cache, in the order they were run"""
+        cache_service = self.entity_service.cache_service
+        loaded = cache_service.get_many([self.result_key(request_id) for request_id in handle['request_ids']])
+        entities = cache_service.get_entities(handle.get('entity_ids', []))
+        strategy_requests = []
+        for request_id in handle['request_ids']:
+            strategy_request = loaded.get(self.result_key(request_id))
+            if strategy_request is None:
+                raise ValueError(f"Result of strategy request {request_id} not found in cache")
+            self.attach_entities(self.collect_requests(strategy_request), entities)
+            strategy_requests.append(strategy_request)
+        return strategy_requests
+
+    @staticmethod
+    def is_unsaved(entity):
+        """
+        Whether an entity returned by a strategy still has to be written: deleted entities must not be brought
+        back, entities the strategy saved are already in the cache at their current state
+        """
+        if getattr(entity, 'deleted', False):
+            return False
+        return entity.get_cache_version() is None or bool(entity.get_dirty_attributes())
+
+    @staticmethod
+    def detach_entities(requests):
+        """Replace the entities in the ret_val of requests by EntityRefs, returning them by id"""
+        entities = {}
+        for request in requests:
+            for key, value in request.ret_val.items():
+                if isinstance(value, Entity):
+                    entities[value.entity_id] = value
+                    request.ret_val[key] = EntityRef(value.entity_id)
+        return entities
+
+    def from_handle(self, handle):
+        """Load the executed request of a handle from the cache, with the entities of its ret_val"""
+        cache_service = self.entity_service.cache_service
+        strategy_request = cache_service.get(self.result_key(handle['request_id']))
+        if strategy_request is None:
+            raise ValueError(f"Result of strategy request {handle['request_id']} not found in cache")
+
+        entities = cache_service.get_entities(handle.get('entity_ids', []))
+        self.attach_entities(self.collect_requests(strategy_request), entities)
+        return strategy_request
+
+    @staticmethod
+    def attach_entities(requests, entities):
+        """Replace the EntityRefs in the ret_val of requests by the loaded entities"""
+        for request in requests:
+            for key, value in request.ret_val.items():
+                if isinstance(value, EntityRef):
+                    request.ret_val[key] = entities.get(value.entity_id)
+
+    @staticmethod
+    def result_key(request_id):
+        return f"{RESULT_HANDLE_KEY_PREFIX}:{request_id}"
+
+    @staticmethod
+    def is_handle(result):
+        return isinstance(result, dict) and 'request_id' in result and 'status' in result
+
+    @staticmethod
+    def collect_requests(strategy_request):
+        """The request and its loaded nested requests, depth first"""
+        requests = []
+        stack = [strategy_request]
+        while stack:
+            request = stack.pop()
+            requests.append(request)
+            if request.nested_requests_loaded():
+                stack.extend(request.get_nested_requests())
+        return requests
+
+    def publish(self, strategy_request, status, **fields):
+        """Publish an event about a strategy request to the websocket clients"""
+        event = {
+            'type': 'strategy_event',
+            'request_id': strategy_request.entity_id,
+            'strategy_name': strategy_request.strategy_name,
+            'target_entity_id': strategy_request.target_entity_id,
+            'status': status,
+            'timestamp': time.time(),
+            **fields,
+        }
+        try:
+            async_to_sync(self.channel_layer.group_send)(STRATEGY_EVENTS_GROUP, event)
+        except Exception as e:
+            logger.warning(f"Failed to publish strategy event for {strategy_request.entity_id}: {e}")
+
+    def publish_progress(self, strategy_request, progress, message=None):
+        """Publish the progress of a running strategy, between 0 and 1"""
+        self.publish(strategy_request, 'progress', progress=progress, message=message)
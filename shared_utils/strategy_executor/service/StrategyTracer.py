@@ -0,0 +1,151 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+_current_span = contextvars.ContextVar('strategy_trace_span', default=None)
+
+
+class Span:
+    """
+    One timed step of a strategy execution, with counters (cache bytes, database queries, broadcasts) and
+    the steps nested in it. Counters only cover the span itself, not its children.
+    """
+
+    def __init__(self, name, category, attributes=None):
+        self.name = name
+        self.category = category
+        self.attributes = attributes or {}
+        self.counters = {}
+        self.children = []
+        self.thread = threading.current_thread().name
+        self.start = time.time()
+        self.end = None
+        self._lock = threading.Lock()
+
+    def add(self, counter, value=1):
+        with self._lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def add_child(self, span):
+        with self._lock:
+            self.children.append(span)
+
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'category': self.category,
+            'attributes': self.attributes,
+            'counters': dict(self.counters),
+            'thread': self.thread,
+            'start': self.start,
+            'duration': self.duration(),
+            'children': [child.to_dict() for child in self.children],
+        }
+
+
+class StrategyTracer:
+    """
+    Span tree of a top-level strategy request. The current span is kept in a context variable, so nested
+    execute calls, cache and database work done in the same thread (or in threads started with a copy of the
+    context) attach to the request that caused them. Without a span in progress tracing costs one lookup.
+    """
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'STRATEGY_TRACING_ENABLED', True)
+
+    @staticmethod
+    def current():
+        return _current_span.get()
+
+    @staticmethod
+    @contextmanager
+    def span(name, category, root=False, **attributes):
+        """
+        Time a block as a child of the current span. Without a current span nothing is recorded unless root
+        is set, which starts a new trace. Database queries are counted from the first span a thread opens, so
+        threads running with a copy of the context count theirs too.
+        """
+        parent = _current_span.get()
+        if not StrategyTracer.enabled() or (parent is None and not root):
+            yield None
+            return
+
+        span = Span(name, category, attributes)
+        if parent is not None:
+            parent.add_child(span)
+        token = _current_span.set(span)
+        try:
+            # Connections are per thread, the wrapper is installed on the connection of every thread in the trace
+            if StrategyTracer.count_query not in connection.execute_wrappers:
+                with connection.execute_wrapper(StrategyTracer.count_query):
+                    yield span
+            else:
+                yield span
+        finally:
+            span.end = time.time()
+            _current_span.reset(token)
+
+    @staticmethod
+    def count(counter, value=1):
+        """Add to a counter of the current span, if a trace is in progress"""
+        span = _current_span.get()
+        if span is not None:
+            span.add(counter, value)
+
+    @staticmethod
+    def count_query(execute, sql, params, many, context):
+        StrategyTracer.count('db_queries')
+        return execute(sql, params, many, context)
+
+    @staticmethod
+    def to_chrome_trace(trace):
+        """
+        Convert a span tree (Span.to_dict) to the Chrome trace event format, for chrome://tracing, Perfetto or
+        speedscope. Threads map to tids so concurrent nested requests show as separate tracks.
+        """
+        events = []
+        threads = {}
+
+        def visit(span):
+            tid = threads.setdefault(span['thread'], len(threads) + 1)
+            events.append({
+                'name': span['name'],
+                'cat': span['category'],
+                'ph': 'X',
+                'ts': span['start'] * 1e6,
+                'dur': span['duration'] * 1e6,
+                'pid': 1,
+                'tid': tid,
+                'args': {**span['attributes'], **span['counters']},
+            })
+            for child in span['children']:
+                visit(child)
+
+        if trace:
+            visit(trace)
+        events += [{'name': 'thread_name', 'ph': 'M', 'pid': 1, 'tid': tid, 'args': {'name': thread}}
+                   for thread, tid in threads.items()]
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    @staticmethod
+    def summarize(trace):
+        """Total of every counter over a span tree"""
+        totals = {}
+        stack = [trace] if trace else []
+        while stack:
+            span = stack.pop()
+            for counter, value in span['counters'].items():
+                totals[counter] = totals.get(counter, 0) + value
+            stack.extend(span['children'])
+        return totals
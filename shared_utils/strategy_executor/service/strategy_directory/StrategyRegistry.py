@@ -0,0 +1,66 @@
+import logging
+import threading
+from types import MappingProxyType
+
+from shared_utils.strategy_executor.service.strategy_directory.StrategyDirectory import StrategyDirectory
+
+logger = logging.getLogger(__name__)
+
+_strategy_registry = None
+_strategy_registry_lock = threading.Lock()
+
+
+def get_strategy_registry():
+    """Get the process-wide strategy registry, building it on first use"""
+    global _strategy_registry
+    if _strategy_registry is None:
+        with _strategy_registry_lock:
+            if _strategy_registry is None:
+                _strategy_registry = StrategyRegistry.build()
+    return _strategy_registry
+
+
+class StrategyRegistry:
+    """
+    Immutable lookup of the strategy classes listed in StrategyDirectory.
+
+    The classes are imported once per process (in SharedUtilsConfig.ready) and shared by every
+    StrategyExecutorService and Strategy, instead of importing the whole directory for each new service.
+    """
+
+    def __init__(self, strategy_classes):
+        self._by_entity_type = MappingProxyType({
+            entity_type: tuple(strategies) for entity_type, strategies in strategy_classes.items()
+        })
+        self._by_name = MappingProxyType({
+            strategy.__name__: strategy for strategies in strategy_classes.values() for strategy in strategies
+        })
+        self._serialized = None
+
+    @classmethod
+    def build(cls, directory=None):
+        directory = directory or StrategyDirectory()
+        registry = cls(directory.get_strategy_classes())
+        logger.info(f"Strategy registry built with {len(registry.strategies)} strategies")
+        return registry
+
+    @property
+    def strategies(self):
+        """Read-only map of strategy name -> strategy class"""
+        return self._by_name
+
+    def get(self, strategy_name):
+        return self._by_name.get(strategy_name)
+
+    def get_strategy_classes(self):
+        """Read-only map of entity type -> tuple of strategy classes, as listed in the directory"""
+        return self._by_entity_type
+
+    def serialize(self):
+        """Serialized strategies by entity type. Built once, as serializing reads the source of every strategy"""
+        if self._serialized is None:
+            self._serialized = {
+                entity_type: [strategy.serialize() for strategy in strategies]
+                for entity_type, strategies in self._by_entity_type.items()
+            }
+        return {entity_type: list(strategies) for entity_type, strategies in self._serialized.items()}
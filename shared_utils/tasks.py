@@ -6,24 +6,88 @@ from celery import shared_task
 from channels.layers import get_channel_layer
 
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.strategy.StrategyQueue import StrategyQueue
 from shared_utils.strategy_executor import StrategyExecutor
 from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
 logger = logging.getLogger(__name__)
 # Instantiate the service with your StrategyExecutor dependency.
 executor_service = StrategyExecutorService()
 
-@shared_task
-def execute_strategy_request(strategy_request):
+def run_strategy_request(strategy_request):
     """
-    Celery task to execute a strategy request.
+    Execute a strategy request on a worker.
     (Perform any conversion to a StrategyRequestEntity if necessary.)
     """
     # pydevd_pycharm.settrace('localhost', port=12345, stdoutToServer=True, stderrToServer=True, suspend=False)
     # Here, we assume strategy_request_data is already a StrategyRequestEntity.
     # Retrieve the target entity within the service call.
-    target_entity = executor_service.entity_service.get_entity(strategy_request.target_entity_id)
-    logger.info("Task started: executing strategy request")
-    result = executor_service.execute(target_entity, strategy_request)
+    # The result backend only gets a small handle; the executed request and its entities are read back from
+    # the shared cache by whoever waits on the task (see StrategyResultStream)
+    result_stream = executor_service.result_stream
+    result_stream.publish(strategy_request, 'started')
+    try:
+        target_entity = executor_service.entity_service.get_entity(strategy_request.target_entity_id)
+        logger.info("Task started: executing strategy request")
+        result = executor_service.execute(target_entity, strategy_request)
+        handle = result_stream.to_handle(result)
+    except Exception as e:
+        result_stream.publish(strategy_request, 'failed', error=str(e))
+        raise
     logger.info("Task finished: strategy execution complete")
+    result_stream.publish(result, 'completed', entity_ids=handle['entity_ids'])
+
+    return handle
+
+
+# One task per StrategyQueue, routed to its queue by CELERY_TASK_ROUTES, so each queue gets its own workers
+@shared_task(serializer='entity_codec')
+def execute_strategy_request(strategy_request):
+    """Celery task to execute a CPU heavy strategy request, also the default for unrouted strategies"""
+    return run_strategy_request(strategy_request)
+
+
+@shared_task(serializer='entity_codec')
+def execute_interactive_strategy_request(strategy_request):
+    """Celery task to execute a short strategy request from the UI"""
+    return run_strategy_request(strategy_request)
+
+
+@shared_task(serializer='entity_codec')
+def execute_io_strategy_request(strategy_request):
+    """Celery task to execute an I/O bound strategy request"""
+    return run_strategy_request(strategy_request)
+
+
+@shared_task(serializer='entity_codec')
+def execute_training_strategy_request(strategy_request):
+    """Celery task to execute a model training strategy request"""
+    return run_strategy_request(strategy_request)
+
+
+@shared_task(serializer='entity_codec')
+def execute_strategy_batch(strategy_requests):
+    """
+    Celery task to execute an ordered list of strategy requests on a shared working set of entities
+    (see StrategyExecutorService.execute_batch). Routed by the caller to the queue of its heaviest request.
+    """
+    result_stream = executor_service.result_stream
+    for strategy_request in strategy_requests:
+        result_stream.publish(strategy_request, 'started')
+    try:
+        results, entity_ids = executor_service.execute_batch(strategy_requests)
+        handle = result_stream.to_batch_handle(results, entity_ids)
+    except Exception as e:
+        for strategy_request in strategy_requests:
+            result_stream.publish(strategy_request, 'failed', error=str(e))
+        raise
+    for result in results:
+        result_stream.publish(result, 'completed', entity_ids=handle['entity_ids'])
+    return handle
+
 
-    return result
\ No newline at end of file
+QUEUE_TASKS = {
+    StrategyQueue.INTERACTIVE: execute_interactive_strategy_request,
+    StrategyQueue.IO: execute_io_strategy_request,
+    StrategyQueue.CPU: execute_strategy_request,
+    StrategyQueue.TRAINING: execute_training_strategy_request,
+}
@@ -0,0 +1,87 @@
+import tempfile
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.ArrayStore import ArrayHandle, ArrayStore
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+
+
+class ArrayStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.array_store = ArrayStore(self.tmp_dir.name)
+        self.array = np.arange(24, dtype=np.float64).reshape(2, 3, 4)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_save_and_load_memory_mapped(self):
+        handle = self.array_store.save(self.array)
+        loaded = self.array_store.load(handle.key)
+
+        self.assertIsInstance(loaded, np.memmap)
+        self.assertFalse(loaded.flags.writeable)
+        np.testing.assert_array_equal(loaded, self.array)
+        self.assertEqual(handle.shape, (2, 3, 4))
+
+    def test_same_content_same_key(self):
+        first = self.array_store.save(self.array)
+        second = self.array_store.save(self.array.copy())
+        reshaped = self.array_store.save(self.array.reshape(6, 4))
+
+        self.assertEqual(first.key, second.key)
+        self.assertNotEqual(first.key, reshaped.key)
+
+    def test_object_arrays_not_stored(self):
+        self.assertFalse(ArrayStore.can_store(np.array([{'a': 1}], dtype=object)))
+
+    def test_load_missing_raises(self):
+        with self.assertRaises(ValueError):
+            self.array_store.load('missing')
+
+
+class CacheServiceArrayStoreTestCase(TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(
+            ENTITY_CACHE_SPLIT_ATTRIBUTES=True,
+            ENTITY_CACHE_SPLIT_THRESHOLD_BYTES=1024,
+            ENTITY_ARRAY_STORE_ENABLED=True,
+            ENTITY_ARRAY_STORE_DIR=self.tmp_dir.name,
+        )
+        self.settings_override.enable()
+        self.cache_service = CacheService()
+        self.cache_service.clear_all()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.tmp_dir.cleanup()
+
+    def test_large_arrays_stored_on_disk(self):
+        entity = Entity()
+        entity.set_attribute('X', np.ones((100, 100)))
+        self.cache_service.set_entity(entity)
+
+        stored = self.cache_service.get_entity(entity.entity_id)
+        handle = stored.get_raw_attributes()['X']
+        self.assertIsInstance(handle, ArrayHandle)
+        self.assertFalse(self.cache_service.cache.has_key(handle.key))
+
+        X = stored.get_attribute('X')
+        self.assertIsInstance(X, np.memmap)
+        np.testing.assert_array_equal(X, np.ones((100, 100)))
+
+    def test_memory_mapped_attribute_not_rewritten(self):
+        entity = Entity()
+        entity.set_attribute('X', np.ones((100, 100)))
+        self.cache_service.set_entity(entity)
+
+        loaded = self.cache_service.get_entity(entity.entity_id)
+        loaded.get_attribute('X')
+        loaded.set_attribute('position', {'x': 1, 'y': 1})
+        shell, blobs = self.cache_service.split_entity(loaded)
+
+        self.assertEqual(blobs, {})
+        self.assertIsInstance(shell.get_raw_attributes()['X'], ArrayHandle)
@@ -0,0 +1,232 @@
+from unittest.mock import patch
+
+import numpy as np
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.AttributeReference import AttributeReference
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.cache.EntityVersionConflict import EntityVersionConflict
+from shared_utils.entities.Entity import Entity
+
+
+@override_settings(ENTITY_CACHE_SPLIT_ATTRIBUTES=True, ENTITY_CACHE_SPLIT_THRESHOLD_BYTES=1024,
+                   ENTITY_ARRAY_STORE_ENABLED=False)
+class CacheServiceSplitStorageTestCase(TestCase):
+    def setUp(self):
+        self.cache_service = CacheService()
+        self.cache_service.clear_all()
+
+        self.entity = Entity()
+        self.entity.set_attribute('X', np.arange(10000, dtype=np.float64).reshape(100, 100))
+        self.entity.set_attribute('position', {'x': 0, 'y': 0})
+
+    def test_large_attribute_stored_under_own_key(self):
+        """Large arrays are replaced by a reference in the stored metadata"""
+        self.cache_service.set_entity(self.entity)
+
+        stored = self.cache_service.get(self.entity.entity_id)
+        reference = stored.get_raw_attributes()['X']
+        self.assertIsInstance(reference, AttributeReference)
+        self.assertEqual(reference.shape, (100, 100))
+        self.assertEqual(stored.get_raw_attributes()['position'], {'x': 0, 'y': 0})
+        self.assertTrue(self.cache_service.cache.has_key(reference.key))
+
+    def test_large_attribute_loaded_lazily(self):
+        """Large attributes are only fetched when they are first read"""
+        self.cache_service.set_entity(self.entity)
+
+        loaded = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertIsInstance(loaded.get_raw_attributes()['X'], AttributeReference)
+        self.assertEqual(loaded.get_attribute_shape('X'), (100, 100))
+        self.assertIsInstance(loaded.get_raw_attributes()['X'], AttributeReference)
+
+        np.testing.assert_array_equal(loaded.get_attribute('X'), self.entity.get_attribute('X'))
+        self.assertIsInstance(loaded.get_raw_attributes()['X'], np.ndarray)
+
+    def test_unchanged_attribute_not_rewritten(self):
+        """Saving after changing a small attribute does not upload the large ones again"""
+        self.cache_service.set_entity(self.entity)
+
+        loaded = self.cache_service.get_entity(self.entity.entity_id)
+        loaded.set_attribute('position', {'x': 10, 'y': 20})
+
+        with patch.object(CacheService, 'write_attributes') as write_attributes:
+            self.cache_service.set_entity(loaded)
+            write_attributes.assert_called_once_with({})
+
+        reloaded = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(reloaded.get_attribute('position'), {'x': 10, 'y': 20})
+        np.testing.assert_array_equal(reloaded.get_attribute('X'), self.entity.get_attribute('X'))
+
+    def test_changed_attribute_rewritten(self):
+        """Setting a large attribute again stores it under a new key"""
+        self.cache_service.set_entity(self.entity)
+        old_key = self.cache_service.get(self.entity.entity_id).get_raw_attributes()['X'].key
+
+        self.entity.set_attribute('X', np.ones((100, 100)))
+        self.cache_service.set_entity(self.entity)
+
+        reloaded = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertNotEqual(reloaded.get_raw_attributes()['X'].key, old_key)
+        np.testing.assert_array_equal(reloaded.get_attribute('X'), np.ones((100, 100)))
+
+    def test_identical_attributes_share_key(self):
+        """Equal arrays on different entities are stored once"""
+        other = Entity()
+        other.set_attribute('X', self.entity.get_attribute('X').copy())
+        self.cache_service.set_entities([self.entity, other])
+
+        first = self.cache_service.get_entity(self.entity.entity_id).get_raw_attributes()['X']
+        second = self.cache_service.get_entity(other.entity_id).get_raw_attributes()['X']
+        self.assertEqual(first.key, second.key)
+
+    @override_settings(ENTITY_CACHE_SPLIT_ATTRIBUTES=False)
+    def test_split_storage_disabled(self):
+        """With split storage disabled the whole entity is stored under its id"""
+        cache_service = CacheService()
+        cache_service.set_entity(self.entity)
+
+        stored = cache_service.get(self.entity.entity_id)
+        self.assertIsInstance(stored.get_raw_attributes()['X'], np.ndarray)
+
+
+class CacheServiceLocalCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache_service = CacheService()
+        self.cache_service.clear_all()
+        self.cache_service.local_cache.reset_stats()
+
+        self.entity = Entity()
+        self.entity.set_attribute('position', {'x': 0, 'y': 0})
+
+    def test_read_served_from_local_cache(self):
+        """Reading an entity that was just saved does not fetch it from Redis"""
+        self.cache_service.set_entity(self.entity)
+
+        with patch.object(self.cache_service.cache, 'get_many', wraps=self.cache_service.cache.get_many) as get_many:
+            loaded = self.cache_service.get_entity(self.entity.entity_id)
+            get_many.assert_not_called()
+
+        self.assertEqual(loaded.entity_id, self.entity.entity_id)
+        self.assertEqual(self.cache_service.get_local_cache_stats()['hits'], 1)
+
+    def test_loaded_entities_are_independent(self):
+        """Mutating a loaded entity does not change the cached copy"""
+        self.cache_service.set_entity(self.entity)
+
+        loaded = self.cache_service.get_entity(self.entity.entity_id)
+        loaded.set_attribute('position', {'x': 5, 'y': 5})
+
+        reloaded = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(reloaded.get_attribute('position'), {'x': 0, 'y': 0})
+
+    def test_stale_entry_detected_by_version(self):
+        """A write from another process bumps the version and the local copy is not used"""
+        self.cache_service.set_entity(self.entity)
+
+        # Simulate another worker process writing a newer copy
+        updated = Entity(entity_id=self.entity.entity_id)
+        updated.set_attribute('position', {'x': 1, 'y': 1})
+        self.cache_service.cache.set(self.entity.entity_id, updated)
+        self.cache_service.increment_version(self.entity.entity_id)
+
+        loaded = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(loaded.get_attribute('position'), {'x': 1, 'y': 1})
+        self.assertEqual(self.cache_service.get_local_cache_stats()['stale'], 1)
+
+    def test_delete_invalidates_local_cache(self):
+        """Deleted entities are not returned from the local cache"""
+        self.cache_service.set_entity(self.entity)
+        self.cache_service.delete_entity(self.entity.entity_id)
+
+        self.assertIsNone(self.cache_service.get_entity(self.entity.entity_id))
+        self.assertNotIn(self.entity.entity_id, self.cache_service.local_cache)
+
+    def test_get_entities_mixes_hits_and_misses(self):
+        """Entities missing locally are fetched from Redis in one batch"""
+        other = Entity()
+        self.cache_service.set_entities([self.entity, other])
+        self.cache_service.local_cache.invalidate(other.entity_id)
+
+        entities = self.cache_service.get_entities([self.entity.entity_id, other.entity_id])
+        self.assertEqual(set(entities.keys()), {self.entity.entity_id, other.entity_id})
+        self.assertIn(other.entity_id, self.cache_service.local_cache)
+
+
+class CacheServiceConcurrentWriteTestCase(TestCase):
+    def setUp(self):
+        self.cache_service = CacheService()
+        self.cache_service.clear_all()
+
+        self.entity = Entity()
+        self.entity.set_attribute('position', {'x': 0, 'y': 0})
+        self.entity.set_attribute('text', 'original')
+        self.cache_service.set_entity(self.entity)
+
+    def test_write_increments_version(self):
+        """Every write stamps the entity with the new version"""
+        version = self.entity.get_cache_version()
+        self.entity.set_attribute('text', 'changed')
+        self.cache_service.set_entity(self.entity)
+
+        self.assertEqual(self.entity.get_cache_version(), version + 1)
+        self.assertEqual(self.cache_service.get_entity(self.entity.entity_id).get_cache_version(), version + 1)
+
+    def test_concurrent_attribute_changes_merged(self):
+        """Two copies changing different attributes both keep their change"""
+        first = self.cache_service.get_entity(self.entity.entity_id)
+        second = self.cache_service.get_entity(self.entity.entity_id)
+
+        first.set_attribute('position', {'x': 1, 'y': 1})
+        self.cache_service.set_entity(first)
+        second.set_attribute('text', 'changed')
+        self.cache_service.set_entity(second)
+
+        stored = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(stored.get_attribute('position'), {'x': 1, 'y': 1})
+        self.assertEqual(stored.get_attribute('text'), 'changed')
+
+    def test_in_place_change_kept_when_marked(self):
+        """A list appended to in place survives a merge once it is marked dirty"""
+        self.entity.set_attribute('train_loss', [])
+        self.cache_service.set_entity(self.entity)
+        first = self.cache_service.get_entity(self.entity.entity_id)
+        second = self.cache_service.get_entity(self.entity.entity_id)
+
+        first.set_attribute('text', 'changed')
+        self.cache_service.set_entity(first)
+        second.get_attribute('train_loss').append(0.5)
+        second.mark_attributes_dirty(['train_loss'])
+        self.cache_service.set_entity(second)
+
+        stored = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(stored.get_attribute('train_loss'), [0.5])
+        self.assertEqual(stored.get_attribute('text'), 'changed')
+
+    def test_concurrent_children_merged(self):
+        """Children added by two copies are both kept"""
+        first = self.cache_service.get_entity(self.entity.entity_id)
+        second = self.cache_service.get_entity(self.entity.entity_id)
+
+        first.add_child(Entity())
+        self.cache_service.set_entity(first)
+        second.add_child(Entity())
+        self.cache_service.set_entity(second)
+
+        stored = self.cache_service.get_entity(self.entity.entity_id)
+        self.assertEqual(len(stored.children_ids), 2)
+        self.assertEqual(set(stored.children_ids), set(first.children_ids) | set(second.children_ids))
+
+    def test_conflict_raised_without_merge(self):
+        """A stale write is rejected when merging is turned off"""
+        first = self.cache_service.get_entity(self.entity.entity_id)
+        second = self.cache_service.get_entity(self.entity.entity_id)
+
+        first.set_attribute('text', 'first')
+        self.cache_service.set_entity(first)
+        second.set_attribute('text', 'second')
+        with self.assertRaises(EntityVersionConflict) as context:
+            self.cache_service.set_entities([second], merge_conflicts=False)
+
+        self.assertEqual(context.exception.entity_ids, [self.entity.entity_id])
+        self.assertEqual(self.cache_service.get_entity(self.entity.entity_id).get_attribute('text'), 'first')
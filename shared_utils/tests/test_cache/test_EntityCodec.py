@@ -0,0 +1,42 @@
+import pickle
+
+import numpy as np
+from django.test import TestCase
+
+from shared_utils.cache.EntityCodec import EntityCodec
+from shared_utils.entities.Entity import Entity
+
+
+class EntityCodecTestCase(TestCase):
+    def setUp(self):
+        self.entity = Entity()
+        self.entity.set_attribute('X', np.arange(2 * 3 * 4, dtype=np.float64).reshape(2, 3, 4))
+        self.entity.set_attribute('y', np.arange(5, dtype=np.int32))
+        self.entity.set_attribute('position', {'x': 1, 'y': 2})
+
+    def test_round_trip(self):
+        decoded = EntityCodec.decode(EntityCodec.encode(self.entity))
+
+        self.assertEqual(decoded.entity_id, self.entity.entity_id)
+        np.testing.assert_array_equal(decoded.get_attribute('X'), self.entity.get_attribute('X'))
+        self.assertEqual(decoded.get_attribute('y').dtype, np.int32)
+        self.assertEqual(decoded.get_attribute('position'), {'x': 1, 'y': 2})
+
+    def test_arrays_decoded_without_copy(self):
+        payload = EntityCodec.encode(self.entity)
+        X = EntityCodec.decode(payload).get_attribute('X')
+
+        self.assertFalse(X.flags.owndata)
+        self.assertFalse(X.flags.writeable)
+        self.assertEqual(X.ctypes.data % 8, 0)
+
+    def test_non_contiguous_array(self):
+        self.entity.set_attribute('X_t', self.entity.get_attribute('X').transpose(0, 2, 1))
+        decoded = EntityCodec.decode(EntityCodec.encode(self.entity))
+
+        np.testing.assert_array_equal(decoded.get_attribute('X_t'), self.entity.get_attribute('X_t'))
+
+    def test_decodes_plain_pickle(self):
+        payload = pickle.dumps({'a': np.ones(3)})
+
+        np.testing.assert_array_equal(EntityCodec.decode(payload)['a'], np.ones(3))
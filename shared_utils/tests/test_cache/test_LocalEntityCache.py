@@ -0,0 +1,44 @@
+from django.test import TestCase
+
+from shared_utils.cache.LocalEntityCache import LocalEntityCache
+
+
+class LocalEntityCacheTestCase(TestCase):
+    def setUp(self):
+        self.local_cache = LocalEntityCache(max_entries=3, max_bytes=100)
+
+    def test_get_returns_stored_payload(self):
+        self.local_cache.set('a', b'payload', version=1)
+
+        self.assertEqual(self.local_cache.get('a', 1), b'payload')
+        self.assertEqual(self.local_cache.get_stats()['hits'], 1)
+
+    def test_version_mismatch_is_stale(self):
+        self.local_cache.set('a', b'payload', version=1)
+
+        self.assertIsNone(self.local_cache.get('a', 2))
+        self.assertNotIn('a', self.local_cache)
+        self.assertEqual(self.local_cache.get_stats()['stale'], 1)
+
+    def test_evicts_least_recently_used_entry(self):
+        self.local_cache.set('a', b'1')
+        self.local_cache.set('b', b'2')
+        self.local_cache.set('c', b'3')
+        self.local_cache.get('a')
+        self.local_cache.set('d', b'4')
+
+        self.assertNotIn('b', self.local_cache)
+        self.assertIn('a', self.local_cache)
+        self.assertEqual(self.local_cache.get_stats()['evictions'], 1)
+
+    def test_evicts_to_stay_within_byte_limit(self):
+        self.local_cache.set('a', b'x' * 60)
+        self.local_cache.set('b', b'x' * 60)
+
+        self.assertNotIn('a', self.local_cache)
+        self.assertEqual(self.local_cache.get_stats()['bytes'], 60)
+
+    def test_oversized_payload_not_stored(self):
+        self.local_cache.set('a', b'x' * 200)
+
+        self.assertNotIn('a', self.local_cache)
@@ -4,6 +4,7 @@ from shared_utils.entities.EntityModel import EntityModel
 from shared_utils.entities.EnityEnum import EntityEnum
 import numpy as np
 import uuid
+from shared_utils.entities.LazyStrategyRequests import LazyStrategyRequests
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 from shared_utils.models import StrategyRequest
 from django.utils import timezone
@@ -141,6 +142,20 @@ class EntityTestCase(TestCase):
         self.assertFalse(entity.has_attribute('key2'))
         self.assertTrue(entity.has_attribute('key3'))
 
+    def test_serialize_skips_unloaded_strategy_requests(self):
+        """Serializing an entity loaded from the database does not query its strategy history"""
+        entity = Entity(str(uuid.uuid4()))
+        entity.strategy_requests = LazyStrategyRequests(entity.entity_id)
+
+        with self.assertNumQueries(0):
+            data = entity.serialize()
+
+        self.assertNotIn('strategy_requests', data)
+        self.assertFalse(entity.strategy_requests_loaded())
+
+        entity.strategy_requests = [StrategyRequestEntity()]
+        self.assertEqual(len(entity.serialize()['strategy_requests']), 1)
+
     def test_to_db_and_from_db(self):
         """Test converting an Entity to a database model and back"""
         # Create StrategyRequest objects associated with the parent entity
@@ -406,3 +421,47 @@ class TestEntityAdapter(TestCase):
         self.assertEqual(saved_requests.first().strategy_name, "test_strategy")
         self.assertEqual(saved_requests.first().param_config, {"test": "value"})
 
+
+    def test_model_to_entity_loads_strategy_requests_lazily(self):
+        """Test that strategy requests are only queried when accessed"""
+        with self.assertNumQueries(0):
+            entity = EntityAdapter.model_to_entity(self.test_model)
+        self.assertFalse(entity.strategy_requests_loaded())
+
+        self.assertEqual(entity.strategy_requests[0].strategy_name, "test_strategy")
+        self.assertTrue(entity.strategy_requests_loaded())
+
+    def test_pickled_entity_keeps_lazy_strategy_requests(self):
+        """Test that caching an entity does not load its strategy requests"""
+        import pickle
+        entity = EntityAdapter.model_to_entity(self.test_model)
+
+        restored = pickle.loads(pickle.dumps(entity))
+
+        self.assertFalse(restored.strategy_requests_loaded())
+        self.assertEqual(restored.get_children(), self.test_children_ids)
+        self.assertEqual(len(restored.strategy_requests), 1)
+
+    def test_entity_has_no_instance_dict(self):
+        """Test that the core entity fields are stored in slots"""
+        entity = Entity()
+        request = StrategyRequestEntity()
+
+        self.assertFalse(hasattr(entity, '__dict__'))
+        self.assertFalse(hasattr(request, '__dict__'))
+        self.assertFalse(hasattr(entity, 'deleted'))
+
+    def test_setstate_accepts_dict_state(self):
+        """Test that entities pickled before slots were added can still be restored"""
+        entity = Entity.__new__(Entity)
+        entity.__setstate__({
+            'entity_id': self.test_uuid,
+            '_attributes': {'name': 'Test Entity'},
+            'children_ids': [],
+            'parent_ids': [],
+            'strategy_requests': [],
+        })
+
+        self.assertEqual(entity.get_attribute('name'), 'Test Entity')
+        self.assertEqual(entity.strategy_requests, [])
+        self.assertEqual(entity.get_dirty_attributes(), {'name'})
@@ -0,0 +1,116 @@
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from django.test import TestCase
+
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.service.EntityBroadcastBuffer import EntityBroadcastBuffer, GLOBAL_GROUP
+
+
+class EntityBroadcastBufferTestCase(TestCase):
+    def setUp(self):
+        self.channel_layer = MagicMock()
+        self.channel_layer.group_send = AsyncMock()
+        # A long window so the timer never fires during a test and flushes are triggered explicitly
+        self.buffer = EntityBroadcastBuffer(channel_layer=self.channel_layer, window_seconds=60,
+                                            max_updates_per_second=10)
+
+    def tearDown(self):
+        if self.buffer._timer is not None:
+            self.buffer._timer.cancel()
+
+    def global_sends(self):
+        return [call.args[1] for call in self.channel_layer.group_send.call_args_list if call.args[0] == GLOBAL_GROUP]
+
+    def entity_sends(self, entity_id):
+        return [call.args[1] for call in self.channel_layer.group_send.call_args_list
+                if call.args[0] == f"entity_{entity_id}"]
+
+    def sent_entities(self, call_index=-1):
+        message = self.global_sends()[call_index]
+        self.assertEqual(message['type'], 'entity_update')
+        return message['entities']
+
+    def test_updates_coalesced_into_one_send(self):
+        entity = Entity()
+        other = Entity()
+        with patch.object(Entity, 'serialize', autospec=True,
+                          side_effect=lambda e: {'id': e.entity_id, 'step': e.get_attribute('step')}):
+            for i in range(5):
+                entity.set_attribute('step', i)
+                self.buffer.add(entity)
+            other.set_attribute('step', 0)
+            self.buffer.add(other)
+            self.buffer.flush()
+
+        self.assertEqual(len(self.global_sends()), 1)
+        self.assertEqual(set(self.sent_entities().keys()), {entity.entity_id, other.entity_id})
+        self.assertEqual(self.sent_entities()[entity.entity_id]['step'], 4)
+
+    def test_serialized_once_per_window(self):
+        entity = Entity()
+        with patch.object(Entity, 'serialize', autospec=True,
+                          side_effect=lambda e: {'id': e.entity_id, 'step': e.get_attribute('step')}) as serialize:
+            for step in range(5):
+                entity.set_attribute('step', step)
+                self.buffer.add(entity)
+            self.assertEqual(serialize.call_count, 0)
+            self.buffer.flush()
+
+        self.assertEqual(serialize.call_count, 1)
+        self.assertEqual(self.sent_entities()[entity.entity_id]['step'], 4)
+
+    def test_state_kept_when_added(self):
+        entity = Entity()
+        entity.set_attribute('step', 1)
+        self.buffer.add(entity)
+        entity.set_attribute('step', 2)
+        entity.add_child(Entity())
+        with patch.object(Entity, 'serialize', autospec=True,
+                          side_effect=lambda e: {'id': e.entity_id, 'step': e.get_attribute('step'),
+                                                 'children': list(e.children_ids)}):
+            self.buffer.flush()
+
+        self.assertEqual(self.sent_entities()[entity.entity_id]['step'], 1)
+        self.assertEqual(self.sent_entities()[entity.entity_id]['children'], [])
+
+    def test_entity_group_gets_full_state(self):
+        entity = Entity()
+        with patch.object(Entity, 'serialize', autospec=True, side_effect=lambda e: {'id': e.entity_id}):
+            self.buffer.add(entity)
+            self.buffer.flush()
+
+        self.assertEqual(self.entity_sends(entity.entity_id),
+                         [{'type': 'entity_update', 'entity': {'id': entity.entity_id}}])
+
+    def test_rate_limited_entity_waits_for_next_slot(self):
+        entity = Entity()
+        self.buffer.add(entity)
+        self.buffer.flush()
+        self.buffer.add(entity)
+        self.buffer.flush()
+
+        self.assertEqual(len(self.global_sends()), 1)
+        self.assertEqual(self.buffer.pending_count(), 1)
+
+        self.buffer.flush(force=True)
+        self.assertEqual(len(self.global_sends()), 2)
+        self.assertEqual(self.buffer.pending_count(), 0)
+
+    def test_deletion_replaces_pending_update(self):
+        entity = Entity()
+        self.buffer.add(entity)
+        self.buffer.add_deletion(entity.entity_id)
+        self.buffer.flush()
+
+        self.assertEqual(self.sent_entities(), {entity.entity_id: {'deleted': True, 'id': entity.entity_id}})
+        self.assertEqual(self.entity_sends(entity.entity_id)[-1]['entity'], {'deleted': True, 'id': entity.entity_id})
+
+    def test_deletion_not_rate_limited(self):
+        entity = Entity()
+        self.buffer.add(entity)
+        self.buffer.flush()
+        self.buffer.add_deletion(entity.entity_id)
+        self.buffer.flush()
+
+        self.assertEqual(len(self.global_sends()), 2)
+        self.assertTrue(self.sent_entities()[entity.entity_id]['deleted'])
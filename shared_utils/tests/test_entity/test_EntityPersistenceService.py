@@ -0,0 +1,74 @@
+from django.test import TestCase
+
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityPersistenceService import EntityPersistenceService
+from shared_utils.models import StrategyRequest
+
+
+class EntityPersistenceServiceTestCase(TestCase):
+    def setUp(self):
+        self.persistence_service = EntityPersistenceService()
+
+        self.root = Entity()
+        self.children = [Entity() for _ in range(5)]
+        for child in self.children:
+            self.root.add_child(child)
+            child.set_attribute('position', {'x': 0, 'y': 0})
+
+        self.request = StrategyRequestEntity()
+        self.request.strategy_name = 'TestStrategy'
+        self.request.param_config = {'a': 1}
+        self.nested_request = StrategyRequestEntity()
+        self.nested_request.strategy_name = 'NestedStrategy'
+        self.request.add_nested_request(self.nested_request)
+        self.children[0].strategy_requests.append(self.request)
+
+        self.entities = [self.root] + self.children
+
+    def test_save_entities_creates_rows(self):
+        result = self.persistence_service.save_entities(self.entities)
+
+        self.assertEqual(result, {'saved': 8, 'skipped': 0})
+        model = EntityModel.objects.get(entity_id=self.children[0].entity_id)
+        self.assertEqual(model.attributes['position'], {'x': 0, 'y': 0})
+        self.assertEqual(model.parent_ids, [self.root.entity_id])
+
+        request_model = StrategyRequest.objects.get(entity_id=self.request.entity_id)
+        self.assertEqual(str(request_model.entity_model_id), self.children[0].entity_id)
+        self.assertEqual(request_model.param_config, {'a': 1})
+        nested_model = StrategyRequest.objects.get(entity_id=self.nested_request.entity_id)
+        self.assertEqual(str(nested_model.parent_request_id), self.request.entity_id)
+
+    def test_unchanged_entities_skipped(self):
+        self.persistence_service.save_entities(self.entities)
+
+        self.children[1].set_attribute('position', {'x': 5, 'y': 5})
+        result = self.persistence_service.save_entities(self.entities)
+
+        self.assertEqual(result, {'saved': 1, 'skipped': 7})
+        model = EntityModel.objects.get(entity_id=self.children[1].entity_id)
+        self.assertEqual(model.attributes['position'], {'x': 5, 'y': 5})
+
+    def test_changed_request_updated(self):
+        self.persistence_service.save_entities(self.entities)
+
+        self.request.param_config = {'a': 2}
+        result = self.persistence_service.save_entities(self.entities)
+
+        self.assertEqual(result['saved'], 1)
+        self.assertEqual(StrategyRequest.objects.get(entity_id=self.request.entity_id).param_config, {'a': 2})
+
+    def test_saved_entities_load_back(self):
+        self.persistence_service.save_entities(self.entities)
+
+        model = EntityModel.objects.get(entity_id=self.children[0].entity_id)
+        entity = Entity.from_db(model)
+        self.assertEqual(entity.strategy_requests[0].strategy_name, 'TestStrategy')
+        self.assertEqual(entity.strategy_requests[0].get_nested_requests()[0].strategy_name, 'NestedStrategy')
+
+    def test_query_count_independent_of_size(self):
+        # Stored hash lookup, entity upsert, request upsert and the transaction savepoint
+        with self.assertNumQueries(5):
+            self.persistence_service.save_entities(self.entities)
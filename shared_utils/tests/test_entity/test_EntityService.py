@@ -0,0 +1,121 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from shared_utils.entities.EnityEnum import EntityEnum
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.EntityModel import EntityModel
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+
+
+class EntityServiceLoadSubtreeTestCase(TestCase):
+    def setUp(self):
+        self.entity_service = EntityService()
+        self.entity_service.clear_all_entities()
+
+        self.root = Entity()
+        self.children = [Entity() for _ in range(10)]
+        self.grandchildren = [Entity() for _ in range(10)]
+        for child, grandchild in zip(self.children, self.grandchildren):
+            self.root.add_child(child)
+            child.add_child(grandchild)
+
+        # Every child carries a strategy request with a nested request
+        for child in self.children:
+            request = StrategyRequestEntity()
+            request.strategy_name = 'TestStrategy'
+            nested_request = StrategyRequestEntity()
+            nested_request.strategy_name = 'NestedStrategy'
+            nested_request.add_to_history = False
+            request.add_nested_request(nested_request)
+            child.strategy_requests.append(request)
+
+        for entity in [self.root] + self.children + self.grandchildren:
+            entity.to_db()
+
+    def all_ids(self):
+        return {entity.entity_id for entity in [self.root] + self.children + self.grandchildren}
+
+    def test_load_subtree_loads_all_descendants(self):
+        entities = self.entity_service.load_subtree(self.root.entity_id, fill_cache=False)
+
+        self.assertEqual(set(entities.keys()), self.all_ids())
+        child = entities[self.children[0].entity_id]
+        self.assertEqual(len(child.strategy_requests), 1)
+        self.assertEqual(child.strategy_requests[0].get_nested_requests()[0].strategy_name, 'NestedStrategy')
+
+    def test_load_subtree_query_count_independent_of_width(self):
+        # One query per level for the entity rows, strategy requests are not loaded
+        with self.assertNumQueries(3):
+            self.entity_service.load_subtree(self.root.entity_id, fill_cache=False)
+
+    def test_load_subtree_loads_strategy_requests_on_access(self):
+        entities = self.entity_service.load_subtree(self.root.entity_id, fill_cache=False)
+        first_child = entities[self.children[0].entity_id]
+        last_child = entities[self.children[-1].entity_id]
+        self.assertFalse(first_child.strategy_requests_loaded())
+
+        # Requests of the whole subtree, then one query per level of nested requests
+        with self.assertNumQueries(3):
+            self.assertEqual(len(first_child.strategy_requests), 1)
+            self.assertEqual(len(first_child.strategy_requests[0].get_nested_requests()), 1)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(last_child.strategy_requests[0].get_nested_requests()[0].strategy_name, 'NestedStrategy')
+
+    def test_load_subtree_fills_cache(self):
+        self.entity_service.load_subtree(self.root.entity_id)
+
+        cached = self.entity_service.load_entities_from_cache(list(self.all_ids()))
+        self.assertEqual(set(cached.keys()), self.all_ids())
+
+    def test_load_subtree_reads_cache_first(self):
+        self.entity_service.load_subtree(self.root.entity_id)
+
+        with self.assertNumQueries(0):
+            entities = self.entity_service.load_subtree(self.root.entity_id, use_cache=True)
+        self.assertEqual(set(entities.keys()), self.all_ids())
+
+    def test_delete_session_db_deletes_subtree(self):
+        self.entity_service.delete_session_db(self.root.entity_id)
+
+        self.assertFalse(EntityModel.objects.filter(entity_id__in=list(self.all_ids())).exists())
+
+
+class EntityServiceChildTypeTestCase(TestCase):
+    def setUp(self):
+        self.entity_service = EntityService()
+        self.entity_service.clear_all_entities()
+
+        self.parent = Entity()
+        self.entity_child = Entity()
+        self.request_child = StrategyRequestEntity()
+        self.parent.add_child(self.entity_child)
+        self.parent.add_child(self.request_child)
+        for entity in [self.parent, self.entity_child, self.request_child]:
+            self.entity_service.cache_service.set_entity(entity)
+
+    def test_types_from_entity_do_not_load_children(self):
+        with patch.object(EntityService, 'load_entities_from_cache') as load_entities_from_cache:
+            request_ids = self.entity_service.get_children_ids_by_type(self.parent, EntityEnum.STRATEGY_REQUEST)
+            load_entities_from_cache.assert_not_called()
+
+        self.assertEqual(request_ids, [self.request_child.entity_id])
+
+    def test_types_from_index_do_not_load_children(self):
+        # Entities loaded from the database only know their children ids
+        parent = Entity(entity_id=self.parent.entity_id)
+        parent.children_ids = list(self.parent.children_ids)
+
+        with patch.object(EntityService, 'load_entities_from_cache') as load_entities_from_cache:
+            entity_ids = self.entity_service.get_children_ids_by_type(parent, EntityEnum.ENTITY)
+            load_entities_from_cache.assert_not_called()
+
+        self.assertEqual(entity_ids, [self.entity_child.entity_id])
+        self.assertEqual(parent.get_child_types()[self.request_child.entity_id], EntityEnum.STRATEGY_REQUEST.value)
+
+    def test_removed_child_not_returned(self):
+        self.parent.remove_child(self.request_child)
+
+        self.assertEqual(self.entity_service.get_children_ids_by_type(self.parent, EntityEnum.STRATEGY_REQUEST), [])
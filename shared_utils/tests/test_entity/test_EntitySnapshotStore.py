@@ -0,0 +1,96 @@
+import threading
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import TestCase
+
+from shared_utils.entities.service.EntitySnapshotStore import EntitySnapshotStore
+
+
+class EntitySnapshotStoreTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.store = EntitySnapshotStore()
+        self.entity = {
+            'entity_id': 'a',
+            'child_ids': ['b'],
+            'position': {'x': 1, 'y': 2},
+            'visualization': {'data': [[1, 2], [3, 4]]},
+        }
+
+    def test_first_record_is_full(self):
+        full, patches, versions = self.store.record({'a': self.entity})
+
+        self.assertEqual(full, {'a': self.entity})
+        self.assertEqual(patches, {})
+        self.assertEqual(versions, {'a': 1})
+
+    def test_changed_fields_sent_as_patch(self):
+        self.store.record({'a': self.entity})
+        updated = dict(self.entity, position={'x': 5, 'y': 2}, width=700)
+
+        full, patches, versions = self.store.record({'a': updated})
+
+        self.assertEqual(full, {})
+        self.assertEqual(patches['a']['base_version'], 1)
+        self.assertEqual(patches['a']['version'], 2)
+        self.assertEqual(patches['a']['ops'], [
+            {'op': 'replace', 'path': '/position/x', 'value': 5},
+            {'op': 'add', 'path': '/width', 'value': 700},
+        ])
+        self.assertEqual(versions, {'a': 2})
+
+    def test_unchanged_entity_not_sent(self):
+        self.store.record({'a': self.entity})
+
+        full, patches, versions = self.store.record({'a': dict(self.entity)})
+
+        self.assertEqual((full, patches), ({}, {}))
+        self.assertEqual(versions, {'a': 1})
+
+    def test_lists_replaced_and_keys_removed(self):
+        old = {'child_ids': ['b'], 'a/b': 1}
+        new = {'child_ids': ['b', 'c']}
+
+        self.assertEqual(EntitySnapshotStore.diff(old, new), [
+            {'op': 'replace', 'path': '/child_ids', 'value': ['b', 'c']},
+            {'op': 'remove', 'path': '/a~1b'},
+        ])
+
+    def test_reset_bumps_version(self):
+        self.store.record({'a': self.entity})
+
+        versions = self.store.reset({'a': self.entity})
+
+        self.assertEqual(versions, {'a': 2})
+        self.assertEqual(self.store.get_snapshots(['a'])['a'], (2, self.entity))
+
+    def test_stale_base_sent_as_full(self):
+        self.store.record({'a': self.entity})
+        stale = self.store.get_snapshots(['a'])
+        # Another process records the entity after this one read the snapshot
+        self.store.record({'a': dict(self.entity, width=1)})
+        updated = dict(self.entity, width=2)
+
+        with patch.object(self.store, 'get_snapshots', return_value=stale):
+            full, patches, versions = self.store.record({'a': updated})
+
+        self.assertEqual(full, {'a': updated})
+        self.assertEqual(patches, {})
+        self.assertEqual(versions, {'a': 3})
+        self.assertEqual(self.store.get_snapshots(['a'])['a'], (3, updated))
+
+    def test_concurrent_records_get_distinct_versions(self):
+        self.store.record({'a': self.entity})
+        versions = []
+
+        def record(width):
+            versions.append(self.store.record({'a': dict(self.entity, width=width)})[2]['a'])
+
+        threads = [threading.Thread(target=record, args=(width,)) for width in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(versions), list(range(2, 10)))
@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.entities.service.WorkingSetEntityService import WorkingSetEntityService
+from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry
+
+
+class IncrementStrategy(Strategy):
+    def apply(self, entity):
+        entity.set_attribute('count', (entity.get_attribute('count') or 0) + 1)
+        return self.strategy_request
+
+
+class FailingStrategy(Strategy):
+    def apply(self, entity):
+        raise ValueError("failed")
+
+
+class WorkingSetEntityServiceTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        self.entity_service = EntityService()
+        self.entity = Entity()
+        self.entity.set_attribute('count', 0)
+        self.entity_service.save_entity(self.entity)
+
+        self.service = StrategyExecutorService(
+            entity_service=self.entity_service,
+            registry=StrategyRegistry({'entity': [IncrementStrategy, FailingStrategy]}),
+        )
+
+    def build_request(self, strategy_cls):
+        request = StrategyRequestEntity()
+        request.strategy_name = strategy_cls.__name__
+        request.target_entity_id = self.entity.entity_id
+        return request
+
+    def test_get_returns_same_object(self):
+        working_set = WorkingSetEntityService()
+        self.assertIs(working_set.get_entity(self.entity.entity_id), working_set.get_entity(self.entity.entity_id))
+
+    def test_saves_are_written_on_flush(self):
+        working_set = WorkingSetEntityService()
+        entity = working_set.get_entity(self.entity.entity_id)
+        entity.set_attribute('count', 5)
+        working_set.save_entity(entity)
+
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('count'), 0)
+        self.assertEqual(working_set.flush(), [self.entity.entity_id])
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('count'), 5)
+
+    def test_batch_writes_each_entity_once(self):
+        requests = [self.build_request(IncrementStrategy) for _ in range(3)]
+        with patch.object(CacheService, 'set_entities', autospec=True, side_effect=CacheService.set_entities) as set_entities:
+            results, entity_ids = self.service.execute_batch(requests)
+
+        self.assertEqual(len(results), 3)
+        self.assertEqual(entity_ids, [self.entity.entity_id])
+        self.assertEqual(set_entities.call_count, 1)
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('count'), 3)
+
+    def test_failed_batch_writes_nothing(self):
+        requests = [self.build_request(IncrementStrategy), self.build_request(FailingStrategy)]
+        with self.assertRaises(ValueError):
+            self.service.execute_batch(requests)
+
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('count'), 0)
+
+    def test_traced_batch_writes_only_on_flush(self):
+        request = self.build_request(IncrementStrategy)
+        request.add_to_history = True
+        requests = [request, self.build_request(FailingStrategy)]
+        with patch.object(CacheService, 'set_entities', autospec=True, side_effect=CacheService.set_entities) as set_entities:
+            with self.assertRaises(ValueError):
+                self.service.execute_batch(requests)
+
+        self.assertEqual(set_entities.call_count, 0)
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('count'), 0)
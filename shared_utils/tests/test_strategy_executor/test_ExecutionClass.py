@@ -0,0 +1,110 @@
+from concurrent.futures import Future
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy.ExecutionClass import ExecutionClass
+from shared_utils.strategy.StrategyQueue import StrategyQueue
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry
+
+
+class InlineStrategy(Strategy):
+    execution_class = ExecutionClass.INLINE
+
+    def apply(self, entity):
+        entity.set_attribute('ran', 'inline')
+        return self.strategy_request
+
+
+class ThreadStrategy(Strategy):
+    execution_class = ExecutionClass.THREAD
+
+    def apply(self, entity):
+        entity.set_attribute('ran', 'thread')
+        return self.strategy_request
+
+
+class CeleryStrategy(Strategy):
+    def apply(self, entity):
+        return self.strategy_request
+
+
+class TrainingStrategy(Strategy):
+    queue = StrategyQueue.TRAINING
+
+    def apply(self, entity):
+        return self.strategy_request
+
+
+class UrgentStrategy(Strategy):
+    queue = StrategyQueue.INTERACTIVE
+    priority = 1
+
+    def apply(self, entity):
+        return self.strategy_request
+
+
+class ExecutionClassTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        self.entity_service = EntityService()
+        self.service = StrategyExecutorService(
+            entity_service=self.entity_service,
+            registry=StrategyRegistry({'entity': [InlineStrategy, ThreadStrategy, CeleryStrategy, TrainingStrategy,
+                                                  UrgentStrategy]}),
+        )
+        self.entity = Entity()
+        self.entity_service.save_entity(self.entity)
+
+    def build_request(self, strategy_cls):
+        request = StrategyRequestEntity()
+        request.strategy_name = strategy_cls.__name__
+        request.target_entity_id = self.entity.entity_id
+        return request
+
+    def test_default_is_celery(self):
+        self.assertEqual(self.service.get_execution_class(CeleryStrategy.__name__), ExecutionClass.CELERY)
+
+    def test_inline_strategy_skips_celery(self):
+        with patch('shared_utils.tasks.execute_strategy_request.apply_async') as apply_async:
+            result = self.service.execute_request(self.build_request(InlineStrategy))
+            apply_async.assert_not_called()
+
+        self.assertIsInstance(result, StrategyRequestEntity)
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('ran'), 'inline')
+
+    def test_thread_strategy_runs_on_pool(self):
+        future = self.service.execute_request(self.build_request(ThreadStrategy), wait=False)
+
+        self.assertIsInstance(future, Future)
+        future.result(timeout=10)
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('ran'), 'thread')
+
+    def test_celery_strategy_is_queued(self):
+        with patch('shared_utils.tasks.execute_strategy_request.apply_async') as apply_async:
+            self.service.execute_request(self.build_request(CeleryStrategy), wait=False)
+            apply_async.assert_called_once()
+
+    def test_training_strategy_routed_to_training_queue(self):
+        with patch('shared_utils.tasks.execute_training_strategy_request.apply_async') as apply_async:
+            self.service.execute_request(self.build_request(TrainingStrategy), wait=False)
+            apply_async.assert_called_once()
+
+        self.assertEqual(apply_async.call_args.kwargs['priority'], 9)
+
+    @override_settings(STRATEGY_QUEUES={'interactive': {'priority': 0}})
+    def test_priority(self):
+        self.assertEqual(self.service.get_routing(UrgentStrategy.__name__), (StrategyQueue.INTERACTIVE, 1))
+        self.assertEqual(self.service.get_routing(CeleryStrategy.__name__), (StrategyQueue.CPU, 5))
+
+    def test_unknown_strategy_raises(self):
+        request = self.build_request(InlineStrategy)
+        request.strategy_name = 'MissingStrategy'
+        with self.assertRaises(ValueError):
+            self.service.execute_request(request)
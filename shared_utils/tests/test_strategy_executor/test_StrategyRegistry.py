@@ -0,0 +1,48 @@
+from django.test import TestCase
+
+from shared_utils.entities.EnityEnum import EntityEnum
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.strategy.BaseStrategy import GetAttributesStrategy, Strategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import get_strategy_registry
+
+
+class RegistryTestStrategy(Strategy):
+    def apply(self, entity):
+        return self.strategy_request
+
+
+class StrategyRegistryTestCase(TestCase):
+    def test_registry_built_once(self):
+        self.assertIs(get_strategy_registry(), get_strategy_registry())
+        self.assertIs(StrategyExecutorService().registry, get_strategy_registry())
+
+    def test_registry_is_read_only(self):
+        registry = get_strategy_registry()
+
+        self.assertIs(registry.get('GetAttributesStrategy'), GetAttributesStrategy)
+        self.assertIn(GetAttributesStrategy, registry.get_strategy_classes()[EntityEnum.ENTITY.value])
+        with self.assertRaises(TypeError):
+            registry.strategies['RegistryTestStrategy'] = RegistryTestStrategy
+
+    def test_register_strategies_does_not_change_shared_registry(self):
+        service = StrategyExecutorService()
+        service.register_strategies({EntityEnum.ENTITY.value: [RegistryTestStrategy]})
+
+        self.assertIs(service.strategies['RegistryTestStrategy'], RegistryTestStrategy)
+        self.assertIsNone(get_strategy_registry().get('RegistryTestStrategy'))
+        self.assertNotIn('RegistryTestStrategy', StrategyExecutorService().strategies)
+
+    def test_strategy_shares_executor_services(self):
+        service = StrategyExecutorService()
+        strategy = GetAttributesStrategy(service, StrategyRequestEntity())
+
+        self.assertIs(strategy.executor_service, service)
+        self.assertIs(strategy.entity_service, service.entity_service)
+
+    def test_serialized_registry_copies(self):
+        registry = get_strategy_registry()
+        serialized = registry.serialize()
+        serialized[EntityEnum.ENTITY.value].clear()
+
+        self.assertTrue(registry.serialize()[EntityEnum.ENTITY.value])
@@ -0,0 +1,145 @@
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyReplayEngine import StrategyReplayEngine
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry
+
+executed = []
+
+
+class LoadStrategy(Strategy):
+    input_attributes = []
+    output_attributes = ['raw']
+
+    def apply(self, entity):
+        executed.append(self.strategy_request.entity_id)
+        entity.set_attribute('raw', self.strategy_request.param_config['value'])
+        return self.strategy_request
+
+
+class ScaleStrategy(Strategy):
+    input_attributes = ['raw']
+    output_attributes = ['scaled']
+
+    def apply(self, entity):
+        executed.append(self.strategy_request.entity_id)
+        entity.set_attribute('scaled', entity.get_attribute('raw') * self.strategy_request.param_config['factor'])
+        return self.strategy_request
+
+
+class LabelStrategy(Strategy):
+    input_attributes = []
+    output_attributes = ['label']
+
+    def apply(self, entity):
+        executed.append(self.strategy_request.entity_id)
+        entity.set_attribute('label', self.strategy_request.param_config['label'])
+        return self.strategy_request
+
+
+@override_settings(STRATEGY_RESULT_CACHE_ENABLED=False)
+class StrategyReplayEngineTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        executed.clear()
+        self.entity_service = EntityService()
+        self.service = StrategyExecutorService(
+            entity_service=self.entity_service,
+            registry=StrategyRegistry({'entity': [LoadStrategy, ScaleStrategy, LabelStrategy]}),
+        )
+        self.engine = StrategyReplayEngine(self.service)
+
+        self.entity = Entity()
+        self.entity_service.save_entity(self.entity)
+        self.load = self.run_request(LoadStrategy, {'value': 2})
+        self.scale = self.run_request(ScaleStrategy, {'factor': 3})
+        self.label = self.run_request(LabelStrategy, {'label': 'a'})
+        executed.clear()
+
+    def run_request(self, strategy_cls, param_config):
+        request = StrategyRequestEntity()
+        request.strategy_name = strategy_cls.__name__
+        request.target_entity_id = self.entity.entity_id
+        request.param_config = param_config
+        request.add_to_history = True
+        return self.service.execute(self.entity, request)
+
+    def test_history_recorded_in_order(self):
+        plan = self.engine.plan(self.entity.strategy_requests)
+
+        self.assertEqual(plan.order, [self.load.entity_id, self.scale.entity_id, self.label.entity_id])
+        self.assertEqual(plan.dependencies[self.scale.entity_id], {self.load.entity_id})
+        self.assertEqual(plan.dependencies[self.label.entity_id], set())
+
+    def test_param_change_replays_downstream_only(self):
+        """Changing the load re-runs the scale that reads its output but not the unrelated label"""
+        plan = self.engine.replay(self.entity, {self.load.entity_id: {'value': 5}})
+
+        self.assertEqual(executed, [self.load.entity_id, self.scale.entity_id])
+        self.assertEqual(plan.reused_requests(), [self.label.entity_id])
+        self.assertEqual(self.entity.get_attribute('scaled'), 15)
+        self.assertEqual(self.entity_service.get_entity(self.entity.entity_id).get_attribute('scaled'), 15)
+
+    def test_leaf_change_replays_itself(self):
+        self.engine.replay(self.entity, {self.scale.entity_id: {'factor': 10}})
+
+        self.assertEqual(executed, [self.scale.entity_id])
+        self.assertEqual(self.entity.get_attribute('scaled'), 20)
+
+    def test_rebuild_replays_everything(self):
+        self.engine.replay(self.entity, rebuild=True)
+
+        self.assertEqual(executed, [self.load.entity_id, self.scale.entity_id, self.label.entity_id])
+
+    def test_unknown_request_raises(self):
+        with self.assertRaises(ValueError):
+            self.engine.replay(self.entity, {'missing': {'value': 1}})
+
+    def test_unknown_request_leaves_history_unchanged(self):
+        with self.assertRaises(ValueError):
+            self.engine.replay(self.entity, {self.load.entity_id: {'value': 7}, 'missing': {'value': 1}})
+
+        self.assertEqual(self.load.param_config['value'], 2)
+        self.assertEqual(executed, [])
+
+    def test_request_on_deleted_entity_skipped(self):
+        """A request whose target is gone is not executed, requests on existing entities still are"""
+        request = StrategyRequestEntity()
+        request.strategy_name = LabelStrategy.__name__
+        request.target_entity_id = Entity().entity_id
+        request.param_config = {'label': 'gone'}
+        self.entity.strategy_requests.append(request)
+
+        plan = self.engine.replay(self.entity, {self.load.entity_id: {'value': 5}})
+
+        self.assertEqual(plan.skipped, {request.entity_id})
+        self.assertEqual(executed, [self.load.entity_id, self.scale.entity_id])
+        self.assertEqual(self.entity.get_attribute('scaled'), 15)
+
+    def test_subtree_replay_includes_child_histories(self):
+        """Requests recorded on a child are planned with the root's and run on the child"""
+        child = Entity()
+        self.entity.add_child(child)
+        self.entity_service.save_entity(child)
+        self.entity_service.save_entity(self.entity)
+        request = StrategyRequestEntity()
+        request.strategy_name = LabelStrategy.__name__
+        request.target_entity_id = child.entity_id
+        request.param_config = {'label': 'b'}
+        request.add_to_history = True
+        request = self.service.execute(child, request)
+        executed.clear()
+
+        plan = self.engine.replay_subtree(self.entity, {request.entity_id: {'label': 'c'},
+                                                        self.scale.entity_id: {'factor': 10}})
+
+        self.assertEqual(set(plan.order), {self.load.entity_id, self.scale.entity_id, self.label.entity_id,
+                                           request.entity_id})
+        self.assertEqual(executed, [self.scale.entity_id, request.entity_id])
+        self.assertEqual(self.entity.get_attribute('scaled'), 20)
+        self.assertEqual(self.entity_service.get_entity(child.entity_id).get_attribute('label'), 'c')
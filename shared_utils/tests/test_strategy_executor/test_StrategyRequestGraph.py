@@ -0,0 +1,133 @@
+import threading
+import uuid
+from unittest.mock import patch
+
+from django.test import TestCase
+
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyRequestGraph import StrategyRequestGraph
+
+
+def build_request(target_entity_id, depends_on=None):
+    request = StrategyRequestEntity()
+    request.strategy_name = 'GetEntityStrategy'
+    request.target_entity_id = target_entity_id
+    request.depends_on = [dependency.entity_id for dependency in depends_on or []]
+    return request
+
+
+class StrategyRequestGraphTestCase(TestCase):
+    def test_independent_requests_are_roots(self):
+        requests = [build_request(str(uuid.uuid4())) for _ in range(3)]
+
+        graph = StrategyRequestGraph(requests)
+
+        self.assertEqual(graph.roots(), [request.entity_id for request in requests])
+
+    def test_requests_on_same_target_are_chained(self):
+        target = str(uuid.uuid4())
+        first, second = build_request(target), build_request(target)
+
+        graph = StrategyRequestGraph([first, second])
+
+        self.assertEqual(graph.dependencies[second.entity_id], [first.entity_id])
+        self.assertEqual(graph.order, [first.entity_id, second.entity_id])
+
+    def test_depends_on_orders_requests(self):
+        create = build_request(str(uuid.uuid4()))
+        child = build_request(str(uuid.uuid4()), depends_on=[create])
+
+        graph = StrategyRequestGraph([child, create])
+
+        self.assertEqual(graph.roots(), [create.entity_id])
+        self.assertEqual(graph.order, [create.entity_id, child.entity_id])
+
+    def test_is_chain(self):
+        target = str(uuid.uuid4())
+        self.assertTrue(StrategyRequestGraph([build_request(target) for _ in range(3)]).is_chain())
+        self.assertFalse(StrategyRequestGraph([build_request(str(uuid.uuid4())) for _ in range(2)]).is_chain())
+
+    def test_cycle_raises(self):
+        first = build_request(str(uuid.uuid4()))
+        second = build_request(str(uuid.uuid4()), depends_on=[first])
+        first.depends_on = [second.entity_id]
+
+        with self.assertRaises(ValueError):
+            StrategyRequestGraph([first, second])
+
+
+class StrategyExecutorServiceExecuteRequestsTestCase(TestCase):
+    def test_independent_requests_run_concurrently(self):
+        service = StrategyExecutorService()
+        requests = [build_request(str(uuid.uuid4())) for _ in range(3)]
+        barrier = threading.Barrier(3, timeout=5)
+
+        def execute(entity, strategy_request):
+            # Only passes if all three requests are running at the same time
+            barrier.wait()
+            return strategy_request
+
+        with patch.object(service, 'is_running_in_task', return_value=True), \
+                patch.object(service.entity_service, 'get_entity', side_effect=lambda entity_id: entity_id), \
+                patch.object(service, 'execute', side_effect=execute):
+            results = service.execute_requests(requests, max_workers=3)
+
+        self.assertEqual(results, requests)
+
+    def test_dependencies_run_first(self):
+        service = StrategyExecutorService()
+        create = build_request(str(uuid.uuid4()))
+        child = build_request(str(uuid.uuid4()), depends_on=[create])
+        executed = []
+
+        def execute(entity, strategy_request):
+            executed.append(strategy_request.entity_id)
+            return strategy_request
+
+        with patch.object(service, 'is_running_in_task', return_value=True), \
+                patch.object(service.entity_service, 'get_entity', side_effect=lambda entity_id: entity_id), \
+                patch.object(service, 'execute', side_effect=execute):
+            service.execute_requests([child, create], max_workers=2)
+
+        self.assertEqual(executed, [create.entity_id, child.entity_id])
+
+    def test_same_target_runs_in_calling_thread(self):
+        service = StrategyExecutorService()
+        target = str(uuid.uuid4())
+        requests = [build_request(target) for _ in range(3)]
+        threads = []
+
+        def execute(entity, strategy_request):
+            threads.append(threading.current_thread())
+            return strategy_request
+
+        with patch.object(service, 'is_running_in_task', return_value=True), \
+                patch.object(service.entity_service, 'get_entity', side_effect=lambda entity_id: entity_id), \
+                patch.object(service, 'execute', side_effect=execute):
+            service.execute_requests(requests, max_workers=3)
+
+        self.assertEqual(threads, [threading.current_thread()] * 3)
+
+    def test_nested_calls_run_inline_on_pool_threads(self):
+        service = StrategyExecutorService()
+        outer = [build_request(str(uuid.uuid4())) for _ in range(2)]
+        executed_on = {}
+        nested = {}
+
+        def execute(entity, strategy_request):
+            executed_on[strategy_request.entity_id] = threading.current_thread()
+            if strategy_request in outer:
+                inner = [build_request(str(uuid.uuid4())) for _ in range(2)]
+                service.execute_requests(inner, max_workers=2)
+                nested[strategy_request.entity_id] = [request.entity_id for request in inner]
+            return strategy_request
+
+        with patch.object(service, 'is_running_in_task', return_value=True), \
+                patch.object(service.entity_service, 'get_entity', side_effect=lambda entity_id: entity_id), \
+                patch.object(service, 'execute', side_effect=execute):
+            service.execute_requests(outer, max_workers=2)
+
+        for outer_id, inner_ids in nested.items():
+            self.assertNotEqual(executed_on[outer_id], threading.current_thread())
+            self.assertEqual([executed_on[inner_id] for inner_id in inner_ids], [executed_on[outer_id]] * 2)
@@ -0,0 +1,79 @@
+import numpy as np
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.ArrayStore import ArrayHandle
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry
+
+
+class DoubleStrategy(Strategy):
+    """Doubles X into X_doubled and counts how often it really ran"""
+    cacheable = True
+    input_attributes = ['X']
+    output_attributes = ['X_doubled', 'count']
+    calls = 0
+
+    def apply(self, entity):
+        DoubleStrategy.calls += 1
+        factor = self.strategy_request.param_config.get('factor', 2)
+        entity.set_attribute('X_doubled', entity.get_attribute('X') * factor)
+        entity.set_attribute('count', len(entity.get_attribute('X')))
+        return self.strategy_request
+
+
+@override_settings(STRATEGY_RESULT_CACHE_ENABLED=True)
+class StrategyResultCacheTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        DoubleStrategy.calls = 0
+        self.service = StrategyExecutorService(entity_service=EntityService(),
+                                               registry=StrategyRegistry({'entity': [DoubleStrategy]}))
+
+    def run_strategy(self, X, param_config=None):
+        entity = Entity()
+        entity.set_attribute('X', X)
+        request = StrategyRequestEntity()
+        request.strategy_name = DoubleStrategy.__name__
+        request.param_config = param_config or {}
+        request.add_to_history = False
+        self.service.execute(entity, request)
+        return entity, request
+
+    def test_same_inputs_restore_result(self):
+        """A second run with the same inputs does not call apply"""
+        self.run_strategy(np.arange(10, dtype=np.float64))
+        entity, request = self.run_strategy(np.arange(10, dtype=np.float64))
+
+        self.assertEqual(DoubleStrategy.calls, 1)
+        self.assertTrue(request.ret_val['result_cache_hit'])
+        self.assertIsInstance(entity.get_raw_attributes()['X_doubled'], ArrayHandle)
+        np.testing.assert_array_equal(entity.get_attribute('X_doubled'), np.arange(10) * 2)
+        self.assertEqual(entity.get_attribute('count'), 10)
+
+    def test_changed_input_recomputes(self):
+        self.run_strategy(np.arange(10, dtype=np.float64))
+        entity, _ = self.run_strategy(np.arange(1, 11, dtype=np.float64))
+
+        self.assertEqual(DoubleStrategy.calls, 2)
+        np.testing.assert_array_equal(entity.get_attribute('X_doubled'), np.arange(1, 11) * 2)
+
+    def test_changed_param_config_recomputes(self):
+        self.run_strategy(np.arange(10, dtype=np.float64), {'factor': 2})
+        entity, _ = self.run_strategy(np.arange(10, dtype=np.float64), {'factor': 3})
+
+        self.assertEqual(DoubleStrategy.calls, 2)
+        np.testing.assert_array_equal(entity.get_attribute('X_doubled'), np.arange(10) * 3)
+
+    @override_settings(STRATEGY_RESULT_CACHE_ENABLED=False)
+    def test_disabled(self):
+        self.service = StrategyExecutorService(entity_service=EntityService(),
+                                               registry=StrategyRegistry({'entity': [DoubleStrategy]}))
+        self.run_strategy(np.arange(10, dtype=np.float64))
+        self.run_strategy(np.arange(10, dtype=np.float64))
+
+        self.assertEqual(DoubleStrategy.calls, 2)
@@ -0,0 +1,85 @@
+import pickle
+
+import numpy as np
+from django.test import TestCase
+
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy_executor.service.StrategyResultStream import EntityRef, StrategyResultStream
+
+
+class StrategyResultStreamTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        self.entity_service = EntityService()
+        self.stream = StrategyResultStream(self.entity_service)
+
+        self.entity = Entity()
+        self.entity.set_attribute('X', np.arange(100000, dtype=np.float64))
+        self.entity_service.save_entity(self.entity)
+
+        self.request = StrategyRequestEntity()
+        self.request.strategy_name = 'GetEntityStrategy'
+        self.request.target_entity_id = self.entity.entity_id
+        self.request.ret_val['entity'] = self.entity
+
+        self.child = Entity()
+        self.nested = StrategyRequestEntity()
+        self.nested.ret_val['child_entity'] = self.child
+        self.request.add_nested_request(self.nested)
+
+    def test_handle_is_small(self):
+        """The handle returned through the result backend carries ids only"""
+        handle = self.stream.to_handle(self.request)
+
+        self.assertEqual(handle['request_id'], self.request.entity_id)
+        self.assertEqual(set(handle['entity_ids']), {self.entity.entity_id, self.child.entity_id})
+        self.assertLess(len(pickle.dumps(handle)), 1024)
+        self.assertIsInstance(self.request.ret_val['entity'], EntityRef)
+
+    def test_round_trip_through_cache(self):
+        handle = self.stream.to_handle(self.request)
+
+        loaded = self.stream.from_handle(handle)
+        self.assertEqual(loaded.entity_id, self.request.entity_id)
+        self.assertEqual(loaded.ret_val['entity'].entity_id, self.entity.entity_id)
+        np.testing.assert_array_equal(loaded.ret_val['entity'].get_attribute('X'), self.entity.get_attribute('X'))
+        nested = loaded.get_nested_requests()[0]
+        self.assertEqual(nested.ret_val['child_entity'].entity_id, self.child.entity_id)
+
+    def test_is_handle(self):
+        self.assertTrue(StrategyResultStream.is_handle(self.stream.to_handle(self.request)))
+        self.assertFalse(StrategyResultStream.is_handle(self.request))
+
+    def test_missing_result_raises(self):
+        with self.assertRaises(ValueError):
+            self.stream.from_handle({'request_id': 'missing', 'status': 'completed'})
+
+    def test_deleted_entity_not_written_back(self):
+        self.entity.deleted = True
+        self.entity_service.save_entity(self.entity)
+
+        handle = self.stream.to_handle(self.request)
+        self.assertNotIn(self.entity.entity_id, handle['entity_ids'])
+        self.assertIsNone(CacheService().get_entity(self.entity.entity_id))
+
+    def test_only_unsaved_entities_written(self):
+        self.assertFalse(StrategyResultStream.is_unsaved(self.entity))
+        self.assertTrue(StrategyResultStream.is_unsaved(self.child))
+
+        self.stream.to_handle(self.request)
+        self.assertIsNotNone(CacheService().get_entity(self.child.entity_id))
+        # Nested requests travel inside the root request
+        self.assertIsNone(CacheService().get_entity(self.nested.entity_id))
+
+    def test_request_entity_left_unchanged(self):
+        """The result is stored under its own key, the cached request entity keeps its lifetime and state"""
+        self.entity_service.save_entity(self.request)
+        version = CacheService().get_entity(self.request.entity_id).get_cache_version()
+
+        self.stream.to_handle(self.request)
+
+        self.assertEqual(CacheService().get_entity(self.request.entity_id).get_cache_version(), version)
+        self.assertIsNotNone(CacheService().get(StrategyResultStream.result_key(self.request.entity_id)))
@@ -0,0 +1,122 @@
+import contextvars
+import threading
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import TestCase, override_settings
+
+from shared_utils.cache.CacheService import CacheService
+from shared_utils.entities.Entity import Entity
+from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
+from shared_utils.entities.service.EntityService import EntityService
+from shared_utils.strategy.BaseStrategy import Strategy
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyTracer import StrategyTracer
+from shared_utils.strategy_executor.service.strategy_directory.StrategyRegistry import StrategyRegistry
+
+
+class ChildStrategy(Strategy):
+    def apply(self, entity):
+        entity.set_attribute('child', True)
+        return self.strategy_request
+
+
+class ParentStrategy(Strategy):
+    def apply(self, entity):
+        child_request = StrategyRequestEntity()
+        child_request.strategy_name = ChildStrategy.__name__
+        self.executor_service.execute(entity, child_request)
+        return self.strategy_request
+
+
+class StrategyTracerTestCase(TestCase):
+    def setUp(self):
+        CacheService().clear_all()
+        self.entity_service = EntityService()
+        self.service = StrategyExecutorService(
+            entity_service=self.entity_service,
+            registry=StrategyRegistry({'entity': [ParentStrategy, ChildStrategy]}),
+        )
+        self.entity = Entity()
+        self.entity_service.save_entity(self.entity)
+
+    def build_request(self):
+        request = StrategyRequestEntity()
+        request.strategy_name = ParentStrategy.__name__
+        request.target_entity_id = self.entity.entity_id
+        return request
+
+    def test_trace_contains_nested_strategy(self):
+        request = self.service.execute(self.entity, self.build_request())
+
+        trace = request.trace
+        self.assertEqual(trace['name'], ParentStrategy.__name__)
+        apply_span = next(span for span in trace['children'] if span['name'] == 'apply')
+        self.assertIn(ChildStrategy.__name__, [span['name'] for span in apply_span['children']])
+        self.assertGreater(StrategyTracer.summarize(trace)['cache_entity_writes'], 0)
+
+    def test_trace_saved_with_entity_history(self):
+        request = self.build_request()
+        request.add_to_history = True
+        self.service.execute(self.entity, request)
+
+        cached = self.entity_service.get_entity(self.entity.entity_id)
+        history = {strategy_request.entity_id: strategy_request for strategy_request in cached.strategy_requests}
+        self.assertIsNotNone(history[request.entity_id].trace)
+
+    def test_request_and_entity_saved_once(self):
+        request = self.build_request()
+        request.strategy_name = ChildStrategy.__name__
+        request.add_to_history = True
+        with patch.object(self.entity_service, 'save_entity', wraps=self.entity_service.save_entity) as save_entity:
+            self.service.execute(self.entity, request)
+
+        saved_ids = [call.args[0].entity_id for call in save_entity.call_args_list]
+        self.assertEqual(saved_ids.count(request.entity_id), 1)
+        self.assertEqual(saved_ids.count(self.entity.entity_id), 1)
+
+    def test_nested_request_has_no_trace_of_its_own(self):
+        with StrategyTracer.span('outer', 'test', root=True):
+            request = self.service.execute(self.entity, self.build_request())
+        self.assertIsNone(request.trace)
+
+    def test_no_span_outside_trace(self):
+        with StrategyTracer.span('orphan', 'test') as span:
+            self.assertIsNone(span)
+        StrategyTracer.count('cache_entity_reads')
+
+    @override_settings(STRATEGY_TRACING_ENABLED=False)
+    def test_disabled(self):
+        request = self.service.execute(self.entity, self.build_request())
+        self.assertIsNone(request.trace)
+
+    def test_chrome_trace(self):
+        with StrategyTracer.span('root', 'strategy', root=True) as root:
+            StrategyTracer.count('db_queries', 2)
+            with StrategyTracer.span('child', 'cache'):
+                pass
+            thread = threading.Thread(target=lambda: StrategyTracer.count('db_queries'))
+            thread.start()
+            thread.join()
+
+        chrome = StrategyTracer.to_chrome_trace(root.to_dict())
+        events = [event for event in chrome['traceEvents'] if event['ph'] == 'X']
+        self.assertEqual([event['name'] for event in events], ['root', 'child'])
+        self.assertEqual(events[0]['args']['db_queries'], 2)
+        self.assertGreaterEqual(events[0]['dur'], events[1]['dur'])
+
+    def test_queries_counted_in_worker_threads(self):
+        """Threads running with a copy of the context count the queries on their own connection"""
+        def query():
+            with StrategyTracer.span('worker', 'strategy'):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            connection.close()
+
+        with StrategyTracer.span('root', 'strategy', root=True) as root:
+            thread = threading.Thread(target=contextvars.copy_context().run, args=(query,))
+            thread.start()
+            thread.join()
+
+        self.assertEqual(root.children[0].counters.get('db_queries'), 1)
+        self.assertNotIn('db_queries', root.counters)
@@ -5,6 +5,7 @@ from asgiref.sync import sync_to_async
 from shared_utils.entities.service.EntityService import EntityService
 from shared_utils.strategy_executor.StrategyExecutor import StrategyExecutor
 from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyResultStream import STRATEGY_EVENTS_GROUP
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
 
 entity_service = EntityService()
@@ -20,6 +21,7 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
             print("Connection accepted")
             
             await self.channel_layer.group_add("global_entities", self.channel_name)
+            await self.channel_layer.group_add(STRATEGY_EVENTS_GROUP, self.channel_name)
             print("Added to global_entities group")
             
             await self.send(json.dumps({
@@ -37,6 +39,7 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
         print(f"Disconnecting from Global WebSocket with code: {close_code}")
         try:
             await self.channel_layer.group_discard("global_entities", self.channel_name)
+            await self.channel_layer.group_discard(STRATEGY_EVENTS_GROUP, self.channel_name)
             print("Removed from global_entities group")
         except Exception as e:
             print(f"Error in disconnect: {str(e)}")
@@ -52,6 +55,8 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
             if command == 'subscribe_entities':
                 entity_ids = data.get('entity_ids', [])
                 await self.handle_entity_subscriptions(entity_ids)
+            elif command == 'resync':
+                await self.handle_resync(data.get('entity_ids', []))
             elif command == 'execute_strategy':
                 await self.handle_execute_strategy(data.get('strategy'))
             elif command == 'start_session':
@@ -107,6 +112,7 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
         strat_request.param_config = json_data['param_config']
         strat_request.add_to_history = json_data['add_to_history']
         strat_request.target_entity_id = json_data['target_entity_id']
+        strat_request.depends_on = json_data.get('depends_on', [])
 
         nested_requests = json_data['nested_requests']
         for nested_request in nested_requests:
@@ -119,18 +125,15 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
         try:
             print(f"Setting up subscriptions for entities: {entity_ids}")
             
-            # Get current entities from service
-            entities_data = {}
-            for entity_id in entity_ids:
-                entity = await sync_to_async(entity_service.get_entity)(entity_id)
-                if entity:
-                    entities_data[entity_id] = entity.serialize()
+            # Get current entities from service, with the versions later patches apply to
+            entities_data, versions = await sync_to_async(entity_service.get_entity_snapshots)(entity_ids)
 
             # Send current state of subscribed entities
             if entities_data:
                 await self.send(json.dumps({
                     'type': 'entity_update',
-                    'entities': entities_data
+                    'entities': entities_data,
+                    'versions': versions
                 }))
 
             await self.send(json.dumps({
@@ -145,6 +148,24 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
                 'message': f'Failed to set up subscriptions: {str(e)}'
             }))
 
+    async def handle_resync(self, entity_ids):
+        """Send the full state of entities to a client that missed a patch"""
+        try:
+            print(f"Resyncing entities: {entity_ids}")
+            entities_data, versions = await sync_to_async(entity_service.get_entity_snapshots)(entity_ids)
+            await self.send(json.dumps({
+                'type': 'entity_update',
+                'entities': entities_data,
+                'versions': versions,
+                'resync': True
+            }))
+        except Exception as e:
+            print(f"Error resyncing entities: {str(e)}")
+            await self.send(json.dumps({
+                'type': 'error',
+                'message': f'Failed to resync entities: {str(e)}'
+            }))
+
     async def handle_execute_strategy(self, strategy_data):
         """Handle strategy execution via WebSocket"""
         try:
@@ -158,11 +179,13 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
             # call with sync to async
             strat_request = await sync_to_async(self.json_to_strategy_request)(strategy_data)
 
-            task = strategy_executor_service.execute_request(strat_request, wait=False)
+            # Inline strategies run right here, so keep their database and cache work off the event loop
+            task = await sync_to_async(strategy_executor_service.execute_request)(strat_request, wait=False)
             # Send confirmation of execution
             await self.send(json.dumps({
                 'type': 'strategy_executed',
-                'message': 'Strategy executed successfully'
+                'message': 'Strategy executed successfully',
+                'request_id': strat_request.entity_id
             }))
 
         except Exception as e:
@@ -172,16 +195,33 @@ class GlobalEntityConsumer(AsyncWebsocketConsumer):
                 'message': str(e)
             }))
 
+    async def strategy_event(self, event):
+        """Forward strategy started/progress/completed/failed events to clients"""
+        try:
+            await self.send(text_data=json.dumps(event))
+        except Exception as e:
+            print(f"Error in strategy_event: {str(e)}")
+
     async def entity_update(self, event):
         """Handle entity updates and send to clients"""
         try:
-            await self.send(text_data=json.dumps({
-                'type': 'entity_update',
-                'entities': event['entities']
-            }))
+            await self.send(text_data=json.dumps(self.entity_update_message(event)))
         except Exception as e:
             print(f"Error in entity_update: {str(e)}")
 
+    @staticmethod
+    def entity_update_message(event):
+        """Build the client message of an entity update. Known entities arrive as versioned JSON-patches"""
+        message = {
+            'type': 'entity_update',
+            'entities': event.get('entities', {})
+        }
+        if event.get('patches'):
+            message['patches'] = event['patches']
+        if event.get('versions'):
+            message['versions'] = event['versions']
+        return message
+
 class EntityConsumer(AsyncWebsocketConsumer):
     """Handles individual entity updates"""
 
@@ -2,6 +2,7 @@ from enum import Enum
 
 from shared_utils.strategy_executor.StrategyExecutor import StrategyExecutor
 from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyReplayEngine import StrategyReplayEngine
 from training_session.entities.TrainingSessionEntity import TrainingSessionEntity, TrainingSessionStatus
 from training_session.models import TrainingSession
 
@@ -41,6 +42,16 @@ class TrainingSessionEntityService:
         #TODO later we want to be able to potentially change the status of downstream requests when an existing request is re-executed
 
 
+    def replay_session(self, session_entity, param_changes=None, rebuild=False):
+        """
+        Re-execute the requests in the session's strategy history invalidated by param_changes
+        (request id -> param_config updates). The history is the requests recorded on every entity of the
+        session. rebuild replays the whole history, e.g. after the cache was cleared, reusing memoized
+        strategy results where the inputs did not change.
+        """
+        replay_engine = StrategyReplayEngine(self.strategy_executor_service)
+        return replay_engine.replay_subtree(session_entity, param_changes, rebuild)
+
     def serialize_session(self):
         """Serialize the current session state"""
 
@@ -1,3 +1,4 @@
+import contextvars
 import json
 
 import numpy as np
@@ -8,6 +9,9 @@ from sequenceset_manager.models import SequenceSet, Sequence
 # from sequenceset_manager.strategy.SequenceSetStrategy import CombineSeqBundlesStrategy
 from shared_utils.entities.EnityEnum import EntityEnum
 from shared_utils.strategy.BaseStrategy import Strategy, CreateEntityStrategy
+from shared_utils.strategy.StrategyQueue import StrategyQueue
+from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService, \
+    get_request_pool, is_request_pool_thread
 from training_session.entities.TrainingSessionEntity import TrainingSessionEntity
 from training_session.models import TrainingSession
 from shared_utils.entities.StrategyRequestEntity import StrategyRequestEntity
@@ -47,6 +51,7 @@ class GetSequenceSetsStrategy(TrainingSessionStrategy):
     Th key point is the strategy is responsible. So in this case, if there are no nested requests (happens the first time) then we created the nested 
     requests and execute them. if there are nested requests, this means that we are recreating from some history, we just need to execute them. 
     '''
+    queue = StrategyQueue.IO
     url = 'http://localhost:8000/sequenceset_manager/get_sequence_data/'
     name = "GetSequenceSets"
     def __init__(self, strategy_executor, strategy_request):
@@ -66,71 +71,93 @@ class GetSequenceSetsStrategy(TrainingSessionStrategy):
         nested_requests += [self.create_sequence_set_requests(session_entity) for _ in
                             range(len(param_config['model_set_configs']) - len(nested_requests))]
 
-        for i, param in enumerate(param_config['model_set_configs']):
-            nested_request = nested_requests[i]
-            # It is possible that on recreating the history, the order of the nested requests is not the same as the original model set configs.
-            nested_request = self.strategy_executor.execute(session_entity, nested_request)
-            sequence_set = nested_request.ret_val['child_entity']
-
-            # Set attributes directly
-            sequence_set.set_attribute('dataset_type', param_config['dataset_type'])
-            sequence_set.set_attribute('sequence_length', param['sequence_length'])
-            sequence_set.set_attribute('start_timestamp', param['start_timestamp'])
-            sequence_set.set_attribute('sequences', [])
-            sequence_set.set_attribute('metadata', param)
-            sequence_set.set_attribute('X_features', X_features)
-            sequence_set.set_attribute('y_features', y_features)
-
-            # Include features in the payload
-            param['features'] = features
-
-            # Send the request as a POST with a JSON body
-            response = requests.post(self.url, json=param, stream=True)
-            if response.status_code == 200:
-                try:
-                    # Collect the streamed response chunks
-                    json_chunks = []
-                    for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1 MB chunks
-                        if chunk:
-                            json_chunks.append(chunk.decode('utf-8'))
-                    # Reassemble the full JSON string
-                    full_json = "".join(json_chunks)
-                    data = json.loads(full_json)
-
-                    for obj in data:
-                        sequence_data = obj['sliced_data']
-                        sequence_data_array = np.array(sequence_data)
-                        sequence_data = np.nan_to_num(sequence_data_array)
-                        # Check if sequence_data contains NaN
-                        if not np.isnan(sequence_data).any():
-                            sequence = Sequence(
-                                id=obj['id'],
-                                start_timestamp=obj['start_timestamp'],
-                                end_timestamp=obj['end_timestamp'],
-                                sequence_length=param['sequence_length'],
-                                sequence_data=sequence_data
-                            )
-                            sequence_set.get_attribute('sequences').append(sequence)
-
-                    # Only add sequence set if it has sequences
-                    if sequence_set.get_attribute('sequences'):
-                        sequence_set.set_attribute(
-                            'seq_end_dates',
-                            [sequence.end_timestamp for sequence in sequence_set.get_attribute('sequences')]
-                        )
-
-                    self.entity_service.save_entity(sequence_set)
-
-                except Exception as e:
-                    print(f"Failed to decode JSON: {e}")
-                    raise e
-            else:
-                print(f"Failed to retrieve sequence data: {response.status_code}")
-                print(response)
-                raise ValueError("Failed to retrieve sequence data " + response.json()['error'])
+        model_set_configs = param_config['model_set_configs']
+        # It is possible that on recreating the history, the order of the nested requests is not the same as the original model set configs.
+        # The create requests all target the session so they run one after another, the sequence data of every
+        # model set config is then fetched concurrently as the sequence sets are independent of each other
+        nested_requests = self.executor_service.execute_requests(nested_requests[:len(model_set_configs)], entity=session_entity)
+        sequence_sets = [nested_request.ret_val['child_entity'] for nested_request in nested_requests]
+
+        def populate(item):
+            sequence_set, param = item
+            self.populate_sequence_set(sequence_set, param, param_config, X_features, y_features)
+
+        items = list(zip(sequence_sets, model_set_configs))
+        if is_request_pool_thread():
+            # Waiting on the pool from one of its own threads could deadlock once every thread waits
+            for item in items:
+                populate(item)
+        else:
+            # The shared request pool bounds the threads of the whole process
+            futures = [get_request_pool().submit(contextvars.copy_context().run,
+                                                 StrategyExecutorService.run_on_pool_thread, populate, item)
+                       for item in items]
+            for future in futures:
+                future.result()
 
         return self.strategy_request
 
+    def populate_sequence_set(self, sequence_set, param, param_config, X_features, y_features):
+        """Fetch the sequences of one model set config into its sequence set and save it"""
+        features = X_features + y_features
+        # Set attributes directly
+        sequence_set.set_attribute('dataset_type', param_config['dataset_type'])
+        sequence_set.set_attribute('sequence_length', param['sequence_length'])
+        sequence_set.set_attribute('start_timestamp', param['start_timestamp'])
+        sequence_set.set_attribute('sequences', [])
+        sequence_set.set_attribute('metadata', param)
+        sequence_set.set_attribute('X_features', X_features)
+        sequence_set.set_attribute('y_features', y_features)
+
+        # Include features in the payload
+        param['features'] = features
+
+        # Send the request as a POST with a JSON body
+        response = requests.post(self.url, json=param, stream=True)
+        if response.status_code == 200:
+            try:
+                # Collect the streamed response chunks
+                json_chunks = []
+                for chunk in response.iter_content(chunk_size=1024 * 1024):  # 1 MB chunks
+                    if chunk:
+                        json_chunks.append(chunk.decode('utf-8'))
+                # Reassemble the full JSON string
+                full_json = "".join(json_chunks)
+                data = json.loads(full_json)
+
+                for obj in data:
+                    sequence_data = obj['sliced_data']
+                    sequence_data_array = np.array(sequence_data)
+                    sequence_data = np.nan_to_num(sequence_data_array)
+                    # Check if sequence_data contains NaN
+                    if not np.isnan(sequence_data).any():
+                        sequence = Sequence(
+                            id=obj['id'],
+                            start_timestamp=obj['start_timestamp'],
+                            end_timestamp=obj['end_timestamp'],
+                            sequence_length=param['sequence_length'],
+                            sequence_data=sequence_data
+                        )
+                        sequence_set.get_attribute('sequences').append(sequence)
+                sequence_set.mark_attributes_dirty(['sequences'])
+
+                # Only add sequence set if it has sequences
+                if sequence_set.get_attribute('sequences'):
+                    sequence_set.set_attribute(
+                        'seq_end_dates',
+                        [sequence.end_timestamp for sequence in sequence_set.get_attribute('sequences')]
+                    )
+
+                self.entity_service.save_entity(sequence_set)
+
+            except Exception as e:
+                print(f"Failed to decode JSON: {e}")
+                raise e
+        else:
+            print(f"Failed to retrieve sequence data: {response.status_code}")
+            print(response)
+            raise ValueError("Failed to retrieve sequence data " + response.json()['error'])
+
     def verify_executable(self, session_entity, strategy_request):
         config = strategy_request.param_config
         if 'X_features' not in config.keys() or not config['X_features']:
@@ -1,7 +1,8 @@
 from django.urls import path
 from .views import api_start_session, api_stop_session, \
     api_save_session, api_get_saved_sessions, api_load_session, api_get_strategy_registry, get_available_entities, \
-    api_execute_strategy, api_get_strategy_history, api_execute_strategy_list, api_delete_session
+    api_execute_strategy, api_get_strategy_history, api_execute_strategy_list, api_delete_session, \
+    api_get_strategy_trace, api_replay_session
 
 urlpatterns = [
 
@@ -16,6 +17,8 @@ urlpatterns = [
     path('api/get_available_entities/', get_available_entities, name='get_available_entities'),
     path('api/execute_strategy/', api_execute_strategy, name='api_execute_strategy'),
     path('api/get_strategy_history/', api_get_strategy_history, name='api_get_strategy_history'),
+    path('api/get_strategy_trace/<str:request_id>/', api_get_strategy_trace, name='api_get_strategy_trace'),
 
     path('api/execute_strategy_list/', api_execute_strategy_list, name='api_execute_strategy_list'),
+    path('api/replay_session/', api_replay_session, name='api_replay_session'),
 ]
@@ -17,6 +17,7 @@ from training_session.entities.TrainingSessionEntity import TrainingSessionEntit
 from training_session.services.TrainingSessionEntityService import TrainingSessionEntityService
 from training_session.models import TrainingSession
 from shared_utils.strategy_executor.service.StrategyExecutorService import StrategyExecutorService
+from shared_utils.strategy_executor.service.StrategyTracer import StrategyTracer
 from shared_utils.cache.CacheService import CacheService
 from shared_utils.entities.service.EntityService import EntityService
 from shared_utils.entities import discover_entities
@@ -85,28 +86,12 @@ def api_save_session(request):
             return JsonResponse({'error': 'No session in progress'}, status=400)
         
         try:
-            # Convert and save to database
-            session_entity = entity_service.get_entity(session_entity_id)
-
-            children = deepcopy(session_entity.get_children())
-            session_model = session_entity.to_db()
-            traversed_children = []
-            while children:
-                child_id = children.pop()
-                if child_id in traversed_children:
-                    continue
-                try:
-                    child  = entity_service.get_entity(child_id)
-                except Exception as e:
-                    continue
-                children.extend(child.get_children())
-                child.to_db()
-                traversed_children.append(child_id)
+            # Convert and save to database in one transaction, skipping unchanged rows
+            entity_service.save_subtree_to_db(session_entity_id)
 
-            
             return JsonResponse({
                 'status': 'success',
-                'session_id': session_model.entity_id,
+                'session_id': session_entity_id,
                 'message': 'Session saved successfully'
             })
         except Exception as e:
@@ -141,29 +126,13 @@ def api_load_session(request, session_id):
             cur_session_id = entity_service.get_session_id()
 
             if cur_session_id != entity_id:
-                session_model = EntityModel.objects.get(entity_id=session_id)
-                session_entity = TrainingSessionEntity.from_db(session_model)
                 entity_service.cache_service.clear_all()
-                cache.set('current_session_id', session_entity.entity_id)
-                entity_service.save_entity(session_entity)
-
-                children = deepcopy(session_entity.get_children())
-                traversed_children = []
-                while children:
-                    child_id = children.pop()
-                    if child_id in traversed_children:
-                        continue
-                    try:
-                        child_model = EntityModel.objects.get(entity_id=child_id)
-                    except EntityModel.DoesNotExist:
-                        continue
-                    child_entity_class = child_model.class_path
-                    child = create_instance_from_path(child_entity_class).from_db(child_model)
-                    children.extend(child.get_children())
-                    entity_service.save_entity(child)
-                    traversed_children.append(child_id)
-
-            serialized = serialize_entity_and_children(entity_id)
+                cache.set('current_session_id', entity_id)
+
+            # Loads the whole session graph in a few batched queries and fills the cache with it. When the
+            # session is already current its entities are read from the cache instead.
+            entities = entity_service.load_subtree(entity_id, use_cache=True)
+            serialized = {child_id: entity.serialize() for child_id, entity in entities.items()}
             # Store in cache
             return JsonResponse({
                 'status': 'success',
@@ -285,6 +254,7 @@ def api_execute_strategy(request):
             return JsonResponse({
                 'status': 'success',
                 'message': 'Session loaded successfully',
+                'request_id': ret_val.entity_id,
                 'entities': get_updated_entities(ret_val)
                 # 'strategy_response': ret_val
             })
@@ -299,8 +269,9 @@ def api_execute_strategy(request):
 def api_execute_strategy_list(request):
     print('execute_strategy_list')
     if request.method == 'POST':
-        session = cache.get('current_session')
-        if not session:
+        entity_service = EntityService()
+        session_id = entity_service.get_session_id()
+        if not session_id:
             return JsonResponse({'error': 'No session in progress'}, status=400)
 
         print(json.loads(request.body))
@@ -310,54 +281,105 @@ def api_execute_strategy_list(request):
         if not strategies:
             return JsonResponse({'error': 'strategies are required'}, status=400)
 
-        training_session_service = TrainingSessionEntityService()
-        training_session_service.set_session(session)
+        strat_requests = [json_to_StrategyRequestEntity(strategy) for strategy in strategies]
 
         strategy_executor_service = StrategyExecutorService()
-        for strategy in strategies:
-            try:
-                strat_request = json_to_StrategyRequestEntity(strategy)
-                ret_val = strategy_executor_service.execute_by_target_entity_id(session, strat_request)
-                add_to_strategy_history(session, ret_val)
-
-
-            except Exception as e:
-                print(str(e))
-                cache.set('current_session', session)
-                return JsonResponse({'error': str(e)}, status=400)
-
-        cache.set('current_session', session)
-        return JsonResponse({
-            'status': 'success',
-            'message': 'Session loaded successfully',
-            'session_data': session.serialize()
-        })
+        try:
+            # The whole list runs in one task on a shared working set, entities are written and broadcast once
+            ret_vals = strategy_executor_service.execute_batch_request(strat_requests)
+
+            entities = {}
+            for ret_val in ret_vals:
+                entities.update(get_updated_entities(ret_val))
+            return JsonResponse({
+                'status': 'success',
+                'message': 'Strategies executed successfully',
+                'request_ids': [ret_val.entity_id for ret_val in ret_vals],
+                'entities': entities
+            })
+        except Exception as e:
+            print(str(e))
+            return JsonResponse({'error': str(e)}, status=400)
     else:
         return JsonResponse({'error': 'POST method required'}, status=400)
 
-# @csrf_exempt
+@csrf_exempt
+def api_replay_session(request):
+    '''
+    Re-execute the strategy requests of the current session invalidated by param_changes
+    (request id -> param_config updates), or all of them with rebuild
+    '''
+    print('api_replay_session')
+    if request.method == 'POST':
+        entity_service = EntityService()
+        session_id = entity_service.get_session_id()
+        if not session_id:
+            return JsonResponse({'error': 'No session in progress'}, status=400)
+
+        body = json.loads(request.body or '{}')
+        try:
+            session_entity = entity_service.get_entity(session_id)
+            plan = TrainingSessionEntityService().replay_session(
+                session_entity, body.get('param_changes'), body.get('rebuild', False))
+            return JsonResponse({
+                'status': 'success',
+                'replayed': [request_id for request_id in plan.dirty_requests() if request_id not in plan.skipped],
+                'skipped': sorted(plan.skipped),
+                'reused': plan.reused_requests(),
+            })
+        except Exception as e:
+            print(str(e))
+            return JsonResponse({'error': str(e)}, status=400)
+    else:
+        return JsonResponse({'error': 'POST method required'}, status=400)
+
+def api_get_strategy_trace(request, request_id):
+    print('api_get_strategy_trace')
+    if request.method == 'GET':
+        entity_service = EntityService()
+        strat_request = entity_service.cache_service.get_entity(request_id)
+        if strat_request is not None:
+            trace = getattr(strat_request, 'trace', None)
+        else:
+            trace = StrategyRequest.objects.filter(entity_id=request_id).values_list('trace', flat=True).first()
+
+        if not trace:
+            return JsonResponse({'error': f'No trace recorded for strategy request {request_id}'}, status=404)
+
+        if request.GET.get('format') == 'chrome':
+            # Loadable in chrome://tracing, Perfetto or speedscope
+            return JsonResponse(StrategyTracer.to_chrome_trace(trace))
+        return JsonResponse({'trace': trace, 'totals': StrategyTracer.summarize(trace)})
+    else:
+        return JsonResponse({'error': 'GET method required'}, status=400)
+
 def api_get_strategy_history(request):
-    pass
-#     print('api_get_strategy_history')
-#     if request.method == 'GET':
-#         entity_service = EntityService()
-#         session_id = entity_service.get_session_id()
-#         if not session_id:
-#             return JsonResponse({'error': 'No session in progress'}, status=400)
-#
-#         try:
-#             session = entity_service.get_entity(session_id)
-#             strategy_requests = []
-#             print(session.strategy_history)
-#             for strategy_request in session.strategy_history:
-#                 strategy_requests.append(strategy_request.serialize())
-#
-#             return JsonResponse({'strategy_requests': strategy_requests})
-#         except Exception as e:
-#             print(str(e))
-#             return JsonResponse({'error': str(e)}, status=400)
-#     else:
-#         return JsonResponse({'error': 'GET method required'}, status=400)
+    '''
+    Strategy requests of an entity (the current session by default). Session loads and broadcasts leave out
+    the history of entities that have not loaded it, this returns it on demand.
+    '''
+    print('api_get_strategy_history')
+    if request.method == 'GET':
+        entity_service = EntityService()
+        entity_id = request.GET.get('entity_id') or entity_service.get_session_id()
+        if not entity_id:
+            return JsonResponse({'error': 'No session in progress'}, status=400)
+
+        try:
+            entity = entity_service.get_entity(entity_id)
+        except ValueError:
+            return JsonResponse({'error': f'Entity {entity_id} not found'}, status=404)
+
+        try:
+            return JsonResponse({
+                'entity_id': entity_id,
+                'strategy_requests': [strategy_request.serialize() for strategy_request in entity.strategy_requests]
+            })
+        except Exception as e:
+            print(str(e))
+            return JsonResponse({'error': str(e)}, status=400)
+    else:
+        return JsonResponse({'error': 'GET method required'}, status=400)
 
 
 # Helper Functions
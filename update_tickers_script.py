@@ -7,9 +7,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'TradeLens.settings')
 # Initialize Django
 django.setup()
 
-from dataset_manager.models import DataSet
-from sequenceset_manager.models import SequenceSet
-from dataset_manager.services import StockDataSetService, DataSetService
+from dataset_manager.ingestion import BatchIngestionService
 from sequenceset_manager.services import StockSequenceSetService, SequenceSetService
 
 # tickers = ["AAPL", "SPY", "QQQ", "XOM", "MSFT", "AMZN", "BB", 'F', 'TSLA', 'GE',
@@ -19,14 +17,15 @@ from sequenceset_manager.services import StockSequenceSetService, SequenceSetSer
 tickers = ["SPY", "AAPL", "NVDA", "MSFT", "QQQ", 'TSLA', 'AMZN', 'VST','DAVE']
 sequences_lengths = [50]
 
-for ticker in tickers:
-    for sequence_length in sequences_lengths:
-        dataset = DataSetService.get_data_set(dataset_type="stock", ticker=ticker, interval="1d")
-        StockDataSetService.update_recent_data(dataset)
 
+def update_sequence_sets(ticker, dataset):
+    for sequence_length in sequences_lengths:
         sequences_set = SequenceSetService.get_sequence_set(sequence_length = sequence_length, dataset_type='stock', ticker=ticker, interval='1d').get()
         StockSequenceSetService.update_recent(sequences_set, ticker =  ticker, interval= '1d', start_date = "2020-01-01")
         print(f"Updated {ticker} with sequence length {sequence_length}")
 
+
 if __name__ == "__main__":
-    pass
\ No newline at end of file
+    service = BatchIngestionService(on_written=update_sequence_sets)
+    report = service.update_tickers(tickers, interval="1d")
+    print(report.summary())